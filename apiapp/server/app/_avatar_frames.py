@@ -74,8 +74,20 @@ def _fex_to_dataframe(obj):
     raise TypeError("Unsupported object type for DataFrame conversion")
 
 
+def _is_au_column(name: str) -> bool:
+    return name.startswith("AU") or name.startswith("HMM_AUexp_")
+
+
 def _load_csv(path: Path):
     import pandas as pd
+    # Columnar sidecar written by predict_video_to_csv.py: load only the AU columns
+    try:
+        import column_store
+        df = column_store.read_sidecar(path, where=_is_au_column)
+        if df is not None:
+            return df
+    except Exception:
+        pass
     if _read_feat is not None:
         try:
             fex = _read_feat(str(path))
@@ -243,6 +255,7 @@ def render_avatar_frames(
     limit: Optional[int] = None,
     size: tuple[int, int] = (400, 500),
     progress_cb: Optional[callable] = None,
+    cancel: Optional[callable] = None,
 ) -> tuple[int, List[Path]]:
     """
     Render per-frame avatar images from CSV into PNG files (schematic face).
@@ -255,6 +268,8 @@ def render_avatar_frames(
         dpi: DPI for matplotlib figure
         limit: optional limit of frames to render
         size: figure size in pixels (width, height)
+        progress_cb: called as progress_cb(done, total) after each frame
+        cancel: called before each frame; raising from it stops rendering
 
     Returns:
         (fps, list_of_paths)
@@ -323,27 +338,30 @@ def render_avatar_frames(
     out_prefix.parent.mkdir(parents=True, exist_ok=True)
 
     total = int(values.shape[0])
-    for i, row in enumerate(values):
-        au_map = {name: float(val) for name, val in zip(au_names, row.tolist())}
-        _try_plot_face(ax, au_map, row)
-        fig.canvas.draw()
-        out_file = Path(f"{str(out_prefix)}_aframe_{i:04d}.png")
-        print(f"[avatar_frames] rendering frame {i+1}/{total} -> {out_file.name}")
-        try:
-            fig.savefig(out_file, dpi=dpi, bbox_inches='tight', pad_inches=0)
-        finally:
-            if callable(progress_cb):
-                try:
-                    progress_cb(i + 1, total)
-                except Exception:
-                    pass
-        out_files.append(out_file)
-        ax.cla()
-        try:
-            ax.set_facecolor("white")
-        except Exception:
-            pass
-        ax.set_axis_off()
-
-    plt.close(fig)
+    try:
+        for i, row in enumerate(values):
+            if callable(cancel):
+                cancel()
+            au_map = {name: float(val) for name, val in zip(au_names, row.tolist())}
+            _try_plot_face(ax, au_map, row)
+            fig.canvas.draw()
+            out_file = Path(f"{str(out_prefix)}_aframe_{i:04d}.png")
+            print(f"[avatar_frames] rendering frame {i+1}/{total} -> {out_file.name}")
+            try:
+                fig.savefig(out_file, dpi=dpi, bbox_inches='tight', pad_inches=0)
+            finally:
+                if callable(progress_cb):
+                    try:
+                        progress_cb(i + 1, total)
+                    except Exception:
+                        pass
+            out_files.append(out_file)
+            ax.cla()
+            try:
+                ax.set_facecolor("white")
+            except Exception:
+                pass
+            ax.set_axis_off()
+    finally:
+        plt.close(fig)
     return fps, out_files
@@ -1,13 +1,29 @@
 from __future__ import annotations
 
+import re
 from pathlib import Path
 from typing import Optional
 
 # Import the existing scripts as modules
 from predict_video_to_csv import run as _predict_run
+from predict_video_to_csv import OUTPUTS_ALL, _pipeline_outputs
 from avatar_animation import main as _avatar_main
 from emotions_plot import main as _emotions_main
+import video_normalize as _video_normalize
 from app._avatar_frames import render_avatar_frames as _render_avatar_frames
+from app.utils.models import registry as _model_registry
+from app.configs.settings import get_settings
+from app.utils.result_cache import ResultCache, video_sha256
+
+_result_cache: Optional[ResultCache] = None
+
+
+def result_cache() -> ResultCache:
+    global _result_cache
+    if _result_cache is None:
+        settings = get_settings()
+        _result_cache = ResultCache(settings.RESULT_CACHE_DIR, settings.RESULT_CACHE_MAX_BYTES)
+    return _result_cache
 
 
 def run_predict(
@@ -17,18 +33,242 @@ def run_predict(
     fps: int = 25,
     skip_frames: int = 25,
     face_threshold: float = 0.95,
+    stream_csv: Optional[Path] = None,
+    on_rows=None,
+    write_posteriors: bool = True,
+    video_hash: Optional[str] = None,
+    log_cb=None,
+    detection_store: Optional[Path] = None,
+    outputs=None,
+    decode_path: Optional[Path] = None,
+    stats_cb=None,
+    deadline_s: Optional[float] = None,
+    sampling: Optional[str] = None,
+    cancel=None,
 ) -> Path:
-    """Call predict_video_to_csv.run and return output CSV path."""
+    """Call predict_video_to_csv.run with warm models from the registry and return output CSV path.
+
+    Results are looked up in the content-hash result cache first (video hash +
+    parameters + artifacts version); a hit places the cached CSV at output_csv.
+    Deadline runs bypass the cache: their sampling depends on machine load.
+    With PREDICT_WORKERS > 1 detection runs chunked in the script's process pool,
+    whose workers hold their own Detectors, so none is leased here.
+    With stream_csv set, detection rows are appended there while the run progresses.
+    With detection_store set (and DETECTION_STORE on), raw detections are kept there
+    so a cache miss caused by new parameters re-runs only the cheap stages.
+    `outputs` (default: Settings.PREDICT_OUTPUTS) lists the detector outputs the
+    later stages need; heads outside it are not run. Detector time per frame is
+    reported through log_cb, with the saving against all heads (measured in this
+    process, else Settings.PREDICT_DETECT_ALL_HEADS_MS from detect_benchmark.py).
+    `decode_path` is the upload's normalized copy (see normalize_video); frames
+    are decoded from it while it is current.
+    `stats_cb(stats)` receives the run's detection stats, including the
+    decode/detect/write pipeline summary under "pipeline" and the sampling
+    actually used under "sampling".
+    `deadline_s` asks the run to finish detection within that many seconds by
+    widening skip_frames as needed (serial detection with a leased Detector).
+    `sampling` (default: Settings.PREDICT_SAMPLING) is "fixed" or "motion"
+    (the skip_frames budget placed where the picture changes).
+    `cancel` is checked between frames/chunks and stops the run by raising
+    (see predict_video_to_csv.run).
+    """
     output_csv.parent.mkdir(parents=True, exist_ok=True)
     artifacts_dir.mkdir(parents=True, exist_ok=True)
-    return _predict_run(
+    settings = get_settings()
+    outputs = _pipeline_outputs(outputs if outputs is not None else settings.PREDICT_OUTPUTS)
+    sampling = str(sampling or settings.PREDICT_SAMPLING)
+
+    def _log(msg: str) -> None:
+        print(f"[predict_bridge] {msg}")
+        if callable(log_cb):
+            try:
+                log_cb(msg)
+            except Exception:
+                pass
+
+    # A deadline run's sampling depends on machine load (the step widens, the tail may be cut): not cached
+    cache = result_cache() if settings.RESULT_CACHE_MAX_BYTES > 0 and not deadline_s else None
+    key_parts: dict = {}
+    if cache is not None:
+        key_parts = dict(
+            video=video_hash or video_sha256(video_path),
+            fps=int(fps),
+            skip_frames=int(skip_frames),
+            face_threshold=float(face_threshold),
+            artifacts=_model_registry.artifacts_version(artifacts_dir),
+            posteriors=bool(write_posteriors),
+            outputs=list(outputs),
+            track_keyframes=int(settings.PREDICT_TRACK_KEYFRAMES),
+            downscale_face_px=int(settings.PREDICT_DOWNSCALE_FACE_PX),
+            sampler=str(settings.PREDICT_SAMPLER),
+        )
+        if decode_path is not None:
+            meta = _video_normalize.current(decode_path, video_path)
+            if meta is not None:
+                key_parts["normalized"] = {"fps": meta["fps"], "height": meta["height"]}
+            else:
+                decode_path = None
+        if sampling != "fixed":
+            key_parts["sampling"] = sampling
+        key = ResultCache.make_key(**key_parts)
+        if cache.fetch(key, output_csv):
+            _log(f"Result cache hit ({key[:12]})")
+            return output_csv
+        _log(f"Result cache miss ({key[:12]})")
+
+    def _on_detect_stats(stats: dict) -> None:
+        if stats.get("spill_frames"):
+            _log(f"Memory-bounded mode: {stats['spill_frames']} sampled frames spilled to disk")
+        if stats.get("detection_store_skipped"):
+            _log(f"Detection store not used ({stats['detection_store_skipped']}): "
+                 "frames are detected again and not saved for later runs")
+        frames, detect_s = int(stats.get("frames") or 0), float(stats.get("detect_s") or 0.0)
+        if frames <= 0:
+            _log("Detector not run (all frames from the detection store)")
+            return
+        _model_registry.record_detect_cost(outputs, frames, detect_s)
+        ms = 1000.0 * detect_s / frames
+        skipped = [o for o in OUTPUTS_ALL if o not in outputs]
+        msg = f"Detector time {ms:.1f} ms/frame over {frames} frames (outputs={','.join(outputs)}"
+        msg += f"; skipped: {','.join(skipped)})" if skipped else ")"
+        if skipped:
+            full_ms, source = _model_registry.detect_cost_ms(OUTPUTS_ALL), "measured"
+            if full_ms is None and settings.PREDICT_DETECT_ALL_HEADS_MS > 0:
+                full_ms, source = float(settings.PREDICT_DETECT_ALL_HEADS_MS), "benchmark"
+            if full_ms is not None:
+                msg += f", saves {full_ms - ms:.1f} ms/frame vs all heads ({full_ms:.1f}, {source})"
+            else:
+                msg += ", saving unknown: no all-heads baseline (set PREDICT_DETECT_ALL_HEADS_MS)"
+        if stats.get("face_detect_skipped"):
+            runs, skipped = int(stats.get("face_detect_runs", 0)), int(stats["face_detect_skipped"])
+            msg += (f"; face detector ran on {runs}/{runs + skipped} frames "
+                    f"({1000.0 * float(stats.get('face_detect_s', 0.0)) / max(1, runs):.1f} ms each), "
+                    f"re-detected {int(stats.get('redetected', 0))}")
+        if "read" in stats:
+            msg += f"; decoded {stats['read']} frames, grabbed {stats['grabbed']}, seeks {stats['seeks']}"
+        _log(msg)
+        pipeline = stats.get("pipeline") or {}
+        if pipeline.get("bottleneck"):
+            busy = ", ".join(f"{k} {100.0 * v['busy']:.0f}%" for k, v in pipeline.items()
+                             if isinstance(v, dict) and "busy" in v)
+            _log(f"Pipeline busy: {busy}; bottleneck: {pipeline['bottleneck']}")
+        sampling = stats.get("sampling") or {}
+        if sampling.get("mode") == "motion":
+            _log(f"Motion sampling: {sampling['frames']} frames for a budget of {sampling['budget']}")
+        if sampling.get("mode") == "deadline":
+            _log(f"Deadline {sampling['deadline_s']:.1f}s: effective skip {sampling['effective_skip']:.1f} "
+                 f"({sampling['effective_fps']:.2f} frames/s of video) over {sampling['frames']} frames"
+                 + (", stopped early" if sampling.get("exhausted") else ""))
+        if callable(stats_cb):
+            stats_cb(stats)
+
+    out = _run_predict_uncached(
+        video_path, output_csv, artifacts_dir, fps, skip_frames, face_threshold,
+        stream_csv=stream_csv, on_rows=on_rows, write_posteriors=write_posteriors,
+        detection_store=detection_store if settings.DETECTION_STORE else None,
+        outputs=outputs, on_detect_stats=_on_detect_stats, decode_path=decode_path,
+        deadline_s=deadline_s, sampling=sampling, cancel=cancel,
+    )
+    if cache is not None:
+        cache.store(key, out, **key_parts)
+    return out
+
+
+def _run_predict_uncached(
+    video_path: Path,
+    output_csv: Path,
+    artifacts_dir: Path,
+    fps: int,
+    skip_frames: int,
+    face_threshold: float,
+    stream_csv: Optional[Path] = None,
+    on_rows=None,
+    write_posteriors: bool = True,
+    detection_store: Optional[Path] = None,
+    outputs=None,
+    on_detect_stats=None,
+    decode_path: Optional[Path] = None,
+    deadline_s: Optional[float] = None,
+    sampling: str = "fixed",
+    cancel=None,
+) -> Path:
+    settings = get_settings()
+    workers = max(1, int(settings.PREDICT_WORKERS))
+    artifacts = _model_registry.hmm(artifacts_dir)
+    kwargs = dict(
         video_path=video_path,
         output_csv=output_csv,
         artifacts_dir=artifacts_dir,
         fps=fps,
         skip_frames=skip_frames,
         face_threshold=face_threshold,
+        artifacts=artifacts,
+        write_posteriors=write_posteriors,
+        workers=workers,
+        chunk_frames=int(settings.PREDICT_CHUNK_FRAMES),
+        stream_csv=stream_csv,
+        stream_batch_frames=int(settings.PREDICT_STREAM_BATCH_FRAMES),
+        stream_hmm_lag=int(settings.PREDICT_STREAM_HMM_LAG) if settings.PREDICT_STREAM_HMM_LAG >= 0 else None,
+        on_rows=on_rows,
+        detection_store=detection_store,
+        store_threshold=float(settings.DETECTION_STORE_THRESHOLD),
+        outputs=outputs,
+        on_detect_stats=on_detect_stats,
+        sampler=str(settings.PREDICT_SAMPLER),
+        track_keyframes=int(settings.PREDICT_TRACK_KEYFRAMES),
+        downscale_face_px=int(settings.PREDICT_DOWNSCALE_FACE_PX),
+        decode_path=decode_path,
+        batch_size=int(settings.PREDICT_BATCH_SIZE),
+        spill_dir=output_csv.with_suffix(".spill") if settings.PREDICT_SPILL_MIN_FRAMES >= 0 else None,
+        spill_min_frames=max(0, int(settings.PREDICT_SPILL_MIN_FRAMES)),
+        deadline_s=deadline_s,
+        sampling=sampling,
+        cancel=cancel,
     )
+    # A deadline run detects serially, so it needs a Detector even with workers
+    if workers > 1 and not deadline_s:
+        return _predict_run(**kwargs)
+    with _model_registry.detector(outputs) as detector:
+        return _predict_run(detector=detector, **kwargs)
+
+
+def normalized_path(workspace_dir: Path, filename: str) -> Path:
+    """Where the normalized copy of an upload lives in the session workspace."""
+    stem = re.sub(r"[^A-Za-z0-9._-]+", "_", Path(filename).stem) or "out"
+    return workspace_dir / f"{stem}_normalized.avi"
+
+
+def normalized_video(video_path: Path, workspace_dir: Path) -> Optional[Path]:
+    """The upload's normalized copy if it is complete and matches the current file, else None."""
+    out = normalized_path(workspace_dir, video_path.name)
+    return out if _video_normalize.current(out, video_path) is not None else None
+
+
+def normalize_video(video_path: Path, workspace_dir: Path, progress_cb=None) -> dict:
+    """Re-encode an upload to the intra-only intermediate read by later analyses; returns its meta."""
+    settings = get_settings()
+    return _video_normalize.normalize(
+        video_path,
+        normalized_path(workspace_dir, video_path.name),
+        fps=float(settings.NORMALIZE_FPS),
+        max_height=int(settings.NORMALIZE_MAX_HEIGHT),
+        progress_cb=progress_cb,
+    )
+
+
+def pipeline_outputs(outputs) -> tuple:
+    """Validated detector outputs for a request (ValueError on unknown names)."""
+    return _pipeline_outputs(outputs)
+
+
+def model_stats() -> dict:
+    """Registry load times and hit/miss counters."""
+    return _model_registry.stats()
+
+
+def cache_stats() -> dict:
+    """Result cache size and hit/miss counters."""
+    return result_cache().stats()
 
 
 def render_avatar(
@@ -81,6 +321,7 @@ def render_avatar_frames(
     dpi: int = 150,
     limit: Optional[int] = None,
     progress_cb=None,
+    cancel=None,
 ) -> tuple[int, list[Path]]:
     """Render per-frame avatar PNGs using internal helper.
 
@@ -96,4 +337,5 @@ def render_avatar_frames(
         dpi=dpi,
         limit=limit,
         progress_cb=progress_cb,
+        cancel=cancel,
     )
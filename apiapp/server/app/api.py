@@ -57,6 +57,53 @@ app.include_router(analyze_router, prefix="/analyze", tags=["Analyze"])
 # Additional compat mount under '/core/analyze' to mirror working '/core' base
 app.include_router(analyze_router, prefix="/core/analyze", tags=["Analyze-CoreCompat"])
 
+# Live analysis over WebSocket: '/ws' is what the frontend WsService and the proxy use
+from app.routes.live import router as live_router
+app.include_router(live_router, tags=["Live"])
+app.include_router(live_router, prefix="/analyze", tags=["Live"])
+
+@app.on_event("startup")
+async def _preload_models():
+    # Warm the model registry in the background so the first analysis does not pay the load cost
+    from app.configs.settings import get_settings
+    settings = get_settings()
+    if not settings.MODELS_PRELOAD:
+        return
+    import threading
+    from app.utils.models import registry
+
+    def _warm() -> None:
+        try:
+            registry.warmup(settings.ARTIFACTS_DIR, settings.PREDICT_OUTPUTS)
+            print("[api] models preloaded:", registry.stats())
+        except Exception as e:
+            print("[api] models preload failed:", e)
+
+    threading.Thread(target=_warm, name="models-preload", daemon=True).start()
+
+@app.on_event("startup")
+async def _fail_orphaned_tasks():
+    # Tasks left running by a worker process that no longer exists (restart/crash) are marked as errors
+    from app.utils.tasks import manager
+    try:
+        n = manager.store.fail_orphans()
+    except Exception as e:
+        print("[api] task store check failed:", e)
+        return
+    if n:
+        print(f"[api] marked {n} interrupted task(s) as failed")
+
+@app.on_event("startup")
+async def _resume_predictions():
+    # Continue predictions cut short by a restart; their finished detections are checkpointed
+    from app.configs.settings import get_settings
+    if not get_settings().PREDICT_AUTO_RESUME:
+        return
+    from app.routes.analyze import resume_interrupted_predictions
+    task_ids = resume_interrupted_predictions()
+    if task_ids:
+        print("[api] resumed predictions:", task_ids)
+
 # Debug: list registered routes on startup (after app init)
 @app.on_event("startup")
 async def _print_routes():
@@ -1,3 +1,4 @@
+import os
 from pathlib import Path
 from typing import Optional, Dict
 from functools import lru_cache
@@ -38,6 +39,125 @@ class Settings(BaseSettings):
     # Префикс маршрутов API
     FILES_API_PREFIX: str = "/core"
 
+    # --- Модели (py-feat Detector + HMM) ---
+
+    # Каталог артефактов HMM по умолчанию (hmm_poisson.joblib, meta.json)
+    ARTIFACTS_DIR: Path = Path("artifacts")
+    # Прогреть Detector и HMM при старте приложения (в фоне), а не на первом запросе
+    MODELS_PRELOAD: bool = False
+
+    # Параллельная детекция: число процессов (1 — последовательно, как раньше)
+    # и размер куска видео в кадрах для одного процесса
+    PREDICT_WORKERS: int = 1
+    PREDICT_CHUNK_FRAMES: int = 1500
+    # Сколько кадров передавать в модели py-feat за один вызов (кадры декодируются заранее
+    # в отдельном потоке в ограниченную очередь); подбирается под CPU через detect_benchmark.py
+    PREDICT_BATCH_SIZE: int = 4
+    # Режим ограниченной памяти для длинных записей: при числе выбираемых кадров не меньше N
+    # строки детекции сбрасываются на диск по частям, HMM декодируется по memmap-матрице AU,
+    # а CSV пишется частями. Хранилище детекций в этом режиме не используется (оно держит все
+    # строки в памяти) — об этом пишется в лог задачи; поэтому по умолчанию выкл. (-1)
+    PREDICT_SPILL_MIN_FRAMES: int = -1
+
+    # Потоковый режим: строки детекции дописываются в CSV-спутник пачками по N кадров,
+    # чтобы кадры/превью можно было получать до окончания детекции (payload "stream" переопределяет)
+    PREDICT_STREAM: bool = False
+    PREDICT_STREAM_BATCH_FRAMES: int = 25
+    # Кэш результатов анализа по хэшу содержимого видео + параметрам (LRU по размеру; 0 — выключен)
+    RESULT_CACHE_DIR: Path = Path("cache/results")
+    RESULT_CACHE_MAX_BYTES: int = 5 * 1024 ** 3
+
+    # Онлайн-декодирование HMM в потоковом режиме: задержка (в строках) для fixed-lag Viterbi;
+    # отрицательное значение отключает HMM-колонки в потоке
+    PREDICT_STREAM_HMM_LAG: int = 5
+
+    # Хранилище сырых результатов детекции в workspace сессии: смена face_threshold/артефактов HMM
+    # не перезапускает детектор, а смена skip_frames детектирует только новые кадры.
+    # Лица сохраняются с порогом min(face_threshold, DETECTION_STORE_THRESHOLD), т.е. с хранилищем
+    # детектор (AU/эмоции/landmarks) работает и по неуверенным лицам, которые потом отбрасываются:
+    # каждый анализ дороже ради ускорения повторных. Поэтому по умолчанию выкл.
+    DETECTION_STORE: bool = False
+    DETECTION_STORE_THRESHOLD: float = 0.5
+    # Детекция журналируется по пачкам/кускам рядом с хранилищем (только при DETECTION_STORE);
+    # прерванный анализ продолжается через /analyze/resume_predict или автоматически при старте
+    # приложения (если включено), без хранилища — заново с первого кадра
+    PREDICT_AUTO_RESUME: bool = False
+
+    # Какие выходы py-feat считать (aus, emotions, landmarks, pose, identity или all);
+    # ненужные головы детектора не запускаются. AU считаются всегда — они нужны HMM
+    PREDICT_OUTPUTS: str = "aus,emotions,landmarks"
+    # Время детектора со всеми головами, мс/кадр — база для «экономии» в логе задачи, пока в процессе
+    # не было прогона с outputs=all; берётся из detect_benchmark.py --outputs all (0 — неизвестно)
+    PREDICT_DETECT_ALL_HEADS_MS: float = 0.0
+
+    # Чтение кадров: auto/seek/grab — декодируются только выбранные кадры (с перемоткой через
+    # длинные промежутки, auto сам выбирает по измеренной стоимости); feat — detect_video py-feat
+    PREDICT_SAMPLER: str = "auto"
+
+    # Выбор кадров для детекции: fixed — каждый skip_frames-й кадр; motion — тот же бюджет кадров,
+    # распределённый по энергии межкадровой разницы (больше кадров там, где лицо меняется);
+    # HMM учитывает неравные промежутки через степени матрицы переходов (payload "sampling" переопределяет)
+    PREDICT_SAMPLING: str = "fixed"
+
+    # Трекинг лица: полная детекция лица раз в N выбранных кадров, между ними рамка
+    # переносится по ландмаркам; кадры с уверенностью ниже face_threshold детектируются заново (0 — выкл.)
+    PREDICT_TRACK_KEYFRAMES: int = 0
+
+    # Уменьшение кадров перед детекцией: масштаб выбирается по размеру лица на первых кадрах так,
+    # чтобы высота лица оставалась не меньше N пикселей; координаты в CSV — исходного кадра (0 — выкл.)
+    PREDICT_DOWNSCALE_FACE_PX: int = 0
+
+    # Нормализация загруженного видео в фоне (payload/параметр normalize переопределяет):
+    # перекодирование в MJPG (каждый кадр ключевой) с фиксированными fps и высотой в workspace сессии;
+    # последующие анализы этого файла читают кадры из нормализованной копии
+    UPLOAD_NORMALIZE: bool = False
+    NORMALIZE_FPS: float = 25.0
+    NORMALIZE_MAX_HEIGHT: int = 720
+
+    # Живой анализ по WebSocket (/ws): кадры JPEG/WebP, пока идёт детекция, ждёт только последний
+    # (устаревшие отбрасываются); кадры уменьшаются до LIVE_MAX_HEIGHT строк, HMM шагает по времени
+    # между кадрами в единицах LIVE_HMM_STEP_S (интервал выборки, на котором обучена модель)
+    LIVE_OUTPUTS: str = "aus,emotions"
+    LIVE_FACE_THRESHOLD: float = 0.9
+    LIVE_MAX_HEIGHT: int = 480
+    LIVE_HMM_STEP_S: float = 1.0
+    LIVE_MAX_FRAME_BYTES: int = 2 * 1024 ** 2
+    # Проверять токен (?token=) через Keycloak introspection
+    LIVE_AUTH: bool = False
+
+    # Фоновые задачи: стадии (predict, analysis, render, plot, data, normalize) выполняются в пуле
+    # потоков ("thread") или в отдельных процессах ("process") — для GIL-зависимых стадий
+    # (рендер кадров, графики); обновления состояния задачи идут в основной процесс через очередь.
+    # data читает состояние другой задачи (потоковый predict) и должна оставаться в потоках.
+    # По умолчанию все стадии в потоках; процессы включаются явно (каждый процесс пула заново
+    # импортирует приложение), в ENV задаётся JSON: TASK_STAGE_BACKENDS='{"render": "process", "plot": "process"}'
+    TASK_PROCESS_WORKERS: int = 2
+    TASK_STAGE_BACKENDS: Dict[str, str] = {}
+    # У каждой стадии своя очередь и свой предел одновременных задач, чтобы долгая детекция не держала
+    # короткий график. Пределы по умолчанию считаются от num_cores (одно ядро оставляется циклу событий):
+    # predict/analysis — (num_cores-1)//4, render — (num_cores-1)//2, plot — 2, data — 4, normalize — 1;
+    # TASK_STAGE_WORKERS переопределяет их: '{"predict": 2, "render": 4}'
+    num_cores: int = os.cpu_count() or 1
+    TASK_STAGE_WORKERS: Dict[str, int] = {}
+    # Контроль допуска: в очереди стадии ждёт не больше TASK_QUEUE_FACTOR × предел задач
+    # (TASK_STAGE_QUEUE задаёт по стадиям), одна сессия занимает не больше TASK_TENANT_QUEUE_SHARE
+    # очереди; сверх этого — 429 с Retry-After (по недавней длительности задач стадии, без истории —
+    # TASK_RETRY_AFTER_S). Очередь обслуживает сессии по взвешенной справедливой очереди,
+    # веса сессий — TASK_TENANT_WEIGHTS (по умолчанию 1)
+    TASK_QUEUE_FACTOR: float = 4.0
+    TASK_STAGE_QUEUE: Dict[str, int] = {}
+    TASK_TENANT_QUEUE_SHARE: float = 0.5
+    TASK_TENANT_WEIGHTS: Dict[str, float] = {}
+    TASK_RETRY_AFTER_S: float = 10.0
+    # Хранилище состояния задач: memory — только в памяти процесса; sqlite — общая база в режиме WAL
+    # (задачи видны всем воркерам uvicorn на хосте и сохраняются после перезапуска).
+    # Прогресс и логи пишутся пачкой не чаще раза в TASK_STORE_FLUSH_S секунд, смена статуса — сразу;
+    # завершённые задачи старше TASK_STORE_MAX_AGE_DAYS удаляются при открытии базы
+    TASK_STORE: str = "sqlite"
+    TASK_STORE_PATH: Path = Path("tasks.sqlite3")
+    TASK_STORE_FLUSH_S: float = 0.5
+    TASK_STORE_MAX_AGE_DAYS: float = 30.0
+
     model_config = SettingsConfigDict(
         env_prefix="",  # без префикса; можно задать "APP_"
         env_file=".env",
@@ -79,6 +199,10 @@ class Settings(BaseSettings):
             self.CUSTOM_TMP_DIR = _abs(self.CUSTOM_TMP_DIR).resolve()
             self.CUSTOM_TMP_DIR.mkdir(parents=True, exist_ok=True)
 
+        self.RESULT_CACHE_DIR = _abs(self.RESULT_CACHE_DIR).resolve()
+        self.RESULT_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        self.TASK_STORE_PATH = _abs(self.TASK_STORE_PATH).resolve()
+
         # кэш результата
         object.__setattr__(self, "_resolved_dirs", {
             "uploads": uploads,
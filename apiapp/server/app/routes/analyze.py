@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 import json
+import os
 from pathlib import Path
 from typing import Any, Dict, List, Optional
 
@@ -10,8 +11,10 @@ from app.configs.paths import DirectoryEnum, VALID_DIRECTORIES, ensure_session_d
 
 # Reuse existing CLI-like utilities as library functions
 from app import _predict_bridge  # type: ignore
+import column_store
 
-from app.utils.tasks import manager as task_manager
+from app.utils.tasks import TaskCancelled, TaskRejected, manager as task_manager
+from app.configs.settings import get_settings
 
 router = APIRouter()
 
@@ -20,14 +23,27 @@ from dataclasses import asdict
 import time
 
 
-def _predict_worker(payload: Dict[str, Any], task_id: str) -> Dict[str, Any]:
-    """Stage 1: Predict video -> CSV."""
+def _predict_worker(payload: Dict[str, Any], task_id: str, cancel=None) -> Dict[str, Any]:
+    """Stage 1: Predict video -> CSV. `cancel` (a CancelToken) is checked between detected frames/chunks."""
     session_id = payload.get("session_id")
     filename = payload.get("filename")
     artifacts = payload.get("artifacts") or "artifacts"
     fps = int(payload.get("fps") or 25)
     skip_frames = int(payload.get("skip_frames") or 25)
     face_threshold = float(payload.get("face_threshold") or 0.95)
+    stream = payload.get("stream")
+    stream = bool(stream) if stream is not None else bool(get_settings().PREDICT_STREAM)
+    # HMM_p_state_* columns are optional; skipping them skips forward-backward entirely
+    posteriors = bool(payload.get("posteriors") if payload.get("posteriors") is not None else True)
+    # Detector outputs later stages need ("aus,emotions" or a list); unneeded py-feat heads are skipped
+    outputs = payload.get("outputs")
+    if outputs is not None:
+        try:
+            outputs = list(_predict_bridge.pipeline_outputs(outputs))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    deadline_s = _deadline_s(payload)
+    sampling = _sampling_mode(payload)
 
     safe = {
         "session_id": session_id,
@@ -35,6 +51,10 @@ def _predict_worker(payload: Dict[str, Any], task_id: str) -> Dict[str, Any]:
         "fps": fps,
         "skip_frames": skip_frames,
         "face_threshold": face_threshold,
+        "stream": stream,
+        "outputs": outputs,
+        "deadline_s": deadline_s,
+        "sampling": sampling,
     }
     print("[analyze] /start_predict payload:", json.dumps(safe, ensure_ascii=False))
 
@@ -58,6 +78,14 @@ def _predict_worker(payload: Dict[str, Any], task_id: str) -> Dict[str, Any]:
 
     base_stem = _safe_name(Path(filename).stem)
     out_csv = workspace_dir / f"{base_stem}_analysis.csv"
+    stream_csv = workspace_dir / f"{base_stem}_analysis.stream.csv" if stream else None
+    # Left behind only if the process dies mid-run: /resume_predict (or startup) picks it up
+    job_file = _predict_job_path(workspace_dir, base_stem)
+    try:
+        job_file.write_text(json.dumps({"payload": payload, "task_id": task_id, "started_at": time.time()}),
+                            encoding="utf-8")
+    except (OSError, TypeError) as e:
+        print("[analyze] could not write predict job file:", e)
 
     # Artifacts sanity
     try:
@@ -68,6 +96,12 @@ def _predict_worker(payload: Dict[str, Any], task_id: str) -> Dict[str, Any]:
     except Exception:
         print("[analyze] artifacts", {"dir": str(artifacts), "modelExists": False, "metaExists": False})
 
+    def _on_rows(n: int) -> None:
+        task_manager.update(task_id, rows_available=n, message=f"Rows: {n}")
+
+    if stream_csv is not None:
+        task_manager.update(task_id, stream_name=stream_csv.name, rows_available=0)
+
     try:
         print("[analyze] predict.setup", {
             "video_path": str(in_video),
@@ -86,14 +120,24 @@ def _predict_worker(payload: Dict[str, Any], task_id: str) -> Dict[str, Any]:
             fps=fps,
             skip_frames=skip_frames,
             face_threshold=face_threshold,
+            stream_csv=stream_csv,
+            on_rows=_on_rows if stream_csv is not None else None,
+            write_posteriors=posteriors,
+            detection_store=workspace_dir / f"{base_stem}_detections",
+            outputs=outputs,
+            decode_path=_normalized_source(in_video, workspace_dir, lambda m: task_manager.log(task_id, m)),
+            log_cb=lambda m: task_manager.log(task_id, m),
+            stats_cb=lambda s: task_manager.update(task_id, pipeline=s.get("pipeline"), sampling=s.get("sampling")),
+            deadline_s=deadline_s,
+            sampling=sampling,
+            cancel=cancel,
         )
         print("[analyze] detect_video.done")
+        task_manager.log(task_id, f"Models: {_models_summary()}")
         # CSV saved info & move to downloads
         csv_download = ensure_session_dir(DirectoryEnum.downloads, session_id) / out_csv.name
         try:
-            if csv_download.exists():
-                csv_download.unlink()
-            out_csv.replace(csv_download)
+            _move_with_columnar(out_csv, csv_download)
         except Exception:
             csv_download = out_csv
         try:
@@ -105,11 +149,18 @@ def _predict_worker(payload: Dict[str, Any], task_id: str) -> Dict[str, Any]:
         base_prefix = "/api/v1/core/download"
         csv_url = f"{base_prefix}/downloads/{session_id}/{csv_download.name}/" if csv_download.exists() else None
         task_manager.update(task_id, progress=100.0, message="Prediction finished", csv_name=csv_download.name, csv_url=csv_url)
+        job_file.unlink(missing_ok=True)
         return {"csv_name": csv_download.name, "csv_url": csv_url}
+    except TaskCancelled:
+        # Cancelled on purpose: not an interrupted run to resume (the checkpoint stays for a restart)
+        print("[analyze] Prediction canceled", {"task_id": task_id})
+        job_file.unlink(missing_ok=True)
+        raise
     except Exception as e:
         import traceback
         print("[analyze] Prediction failed:\n", traceback.format_exc())
         task_manager.update(task_id, status="error", error=str(e))
+        job_file.unlink(missing_ok=True)
         raise
 
 
@@ -150,6 +201,13 @@ import numpy as _np
 
 def _load_csv_for_data(path: Path):
     import pandas as pd
+    # Data mode only needs AU / expected-AU columns: take them from the columnar sidecar if present
+    try:
+        df = column_store.read_sidecar(path, where=lambda c: c.startswith("AU") or c.startswith("HMM_AUexp_"))
+        if df is not None:
+            return df
+    except Exception as e:
+        print("[analyze] columnar read failed, using CSV:", e)
     try:
         from feat.utils.io import read_feat as _read_feat  # type: ignore
     except Exception:
@@ -222,7 +280,7 @@ def _values_from_cols(df, cols: list[str]) -> tuple[_np.ndarray, list[str]]:
     return values, names
 
 
-def _frames_image_worker(payload: Dict[str, Any], task_id: str) -> Dict[str, Any]:
+def _frames_image_worker(payload: Dict[str, Any], task_id: str, cancel=None) -> Dict[str, Any]:
     session_id = payload.get("session_id")
     csv_name = payload.get("csv_name")
     source = str(payload.get("source") or "hmm")
@@ -252,7 +310,7 @@ def _frames_image_worker(payload: Dict[str, Any], task_id: str) -> Dict[str, Any
                 pth = downloads_dir / name
                 if pth.exists() and (name not in st.frames):
                     print("[analyze] frame.ready", name)
-                    task_manager.update(task_id, frames=st.frames + [name])
+                    task_manager.append(task_id, "frames", name)
         except Exception:
             pass
         _pcb_counter["count"] += 1
@@ -270,10 +328,14 @@ def _frames_image_worker(payload: Dict[str, Any], task_id: str) -> Dict[str, Any
             dpi=150,
             limit=None,
             progress_cb=_pcb,
+            cancel=cancel,
         )
         print("[analyze] frames.render.done", {"count": len(paths)})
         task_manager.update(task_id, frames_fps=fps_out, progress=100.0)
         return {"count": len(paths), "fps": fps_out}
+    except TaskCancelled:
+        print("[analyze] Frames rendering canceled", {"task_id": task_id})
+        raise
     except Exception as e:
         import traceback
         print("[analyze] Frames rendering failed:\n", traceback.format_exc())
@@ -281,7 +343,80 @@ def _frames_image_worker(payload: Dict[str, Any], task_id: str) -> Dict[str, Any
         raise
 
 
-def _frames_data_worker(payload: Dict[str, Any], task_id: str) -> Dict[str, Any]:
+def _read_stream_rows(path: Path, start: int, stop: int):
+    """Read data rows [start, stop) of a streaming sidecar CSV (header is line 0)."""
+    import pandas as pd
+    return pd.read_csv(path, skiprows=range(1, start + 1), nrows=max(0, stop - start))
+
+
+def _frames_data_stream_worker(payload: Dict[str, Any], task_id: str, predict_task_id: str,
+                               cancel=None) -> Dict[str, Any]:
+    """Data mode fed by a running streaming prediction: emit rows as they are flushed,
+    then finish from the final CSV once the prediction is done."""
+    session_id = payload.get("session_id")
+    csv_name = payload.get("csv_name")
+    source = str(payload.get("source") or "hmm")
+    fps = int(payload.get("fps") or 12)
+    downloads_dir = ensure_session_dir(DirectoryEnum.downloads, session_id)
+    workspace_dir = ensure_session_dir(DirectoryEnum.workspace, session_id)
+    csv_path = downloads_dir / csv_name
+
+    task_manager.update(task_id, status="running", mode="data", frames_fps=max(1, min(30, fps)), data_next_index=0, progress=5.0)
+    print("[analyze] frames.stream.start", {"source": source, "predict_task_id": predict_task_id})
+
+    cols: Optional[list[str]] = None
+    i = 0
+
+    def _emit(df) -> None:
+        nonlocal i
+        values, _names = _values_from_cols(df, cols or [])
+        items = [{"index": i + k, "au": [float(x) for x in row.tolist()]} for k, row in enumerate(values)]
+        if not items:
+            return
+        task_manager.append(task_id, "data_items", *items)
+        i += len(items)
+        task_manager.update(task_id, frames_done=i, frames_total=i, message=f"Кадры: {i}")
+
+    try:
+        while True:
+            if cancel is not None:
+                cancel()
+            pst = task_manager.get(predict_task_id)
+            if pst is None:
+                raise RuntimeError("Prediction task not found")
+            if pst.status in ("error", "canceled"):
+                raise RuntimeError(f"Prediction {pst.status}: {pst.error or ''}")
+            if pst.status == "done" and csv_path.exists():
+                df = _load_csv_for_data(csv_path)
+                if cols is None:
+                    cols = _collect_cols_for_source(df, source)
+                if i < len(df):
+                    _emit(df.iloc[i:])
+                break
+            avail = int(pst.rows_available or 0)
+            if pst.stream_name and avail > i:
+                part = _read_stream_rows(workspace_dir / pst.stream_name, i, avail)
+                if cols is None:
+                    # Streamed rows may lack HMM columns (online decoding disabled); keep one column source for the whole task
+                    cols = _collect_cols_for_source(part, source) or _collect_cols_for_source(part, "real")
+                    print("[analyze] frames.stream.cols", {"requested": source, "count": len(cols)})
+                _emit(part)
+            else:
+                time.sleep(0.5)
+        task_manager.update(task_id, frames_total=i, progress=100.0)
+        print("[analyze] frames.render.done", {"count": i})
+        return {"count": i, "fps": int(fps)}
+    except TaskCancelled:
+        print("[analyze] Frames data stream canceled", {"task_id": task_id})
+        raise
+    except Exception as e:
+        import traceback
+        print("[analyze] Frames data stream failed:\n", traceback.format_exc())
+        task_manager.update(task_id, status="error", error=str(e))
+        raise
+
+
+def _frames_data_worker(payload: Dict[str, Any], task_id: str, cancel=None) -> Dict[str, Any]:
     session_id = payload.get("session_id")
     csv_name = payload.get("csv_name")
     source = str(payload.get("source") or "hmm")
@@ -290,6 +425,9 @@ def _frames_data_worker(payload: Dict[str, Any], task_id: str) -> Dict[str, Any]
         raise HTTPException(status_code=400, detail="session_id and csv_name are required")
     downloads_dir = ensure_session_dir(DirectoryEnum.downloads, session_id)
     csv_path = downloads_dir / csv_name
+    predict_task_id = payload.get("predict_task_id")
+    if not csv_path.exists() and predict_task_id and task_manager.get(str(predict_task_id)) is not None:
+        return _frames_data_stream_worker(payload, task_id, str(predict_task_id), cancel=cancel)
     if not csv_path.exists():
         raise HTTPException(status_code=404, detail=f"CSV not found: {csv_name}")
 
@@ -305,13 +443,14 @@ def _frames_data_worker(payload: Dict[str, Any], task_id: str) -> Dict[str, Any]
     # Stream items one by one into buffer
     try:
         for i in range(total):
+            if cancel is not None:
+                cancel()
             au = [float(x) for x in values[i].tolist()]
             # Append to buffer
-            st = task_manager.get(task_id)
-            if not st:
+            if task_manager.get(task_id) is None:
                 break
-            st.data_items.append({"index": i, "au": au})
-            task_manager.update(task_id, data_items=st.data_items, frames_done=i+1, frames_total=total)
+            task_manager.append(task_id, "data_items", {"index": i, "au": au})
+            task_manager.update(task_id, frames_done=i+1, frames_total=total)
             if (i + 1) % 10 == 0 or (i + 1) == total:
                 print("[analyze] frames.progress", f"{i+1}/{total}")
             print("[analyze] frame.data", f"index={i}")
@@ -320,6 +459,9 @@ def _frames_data_worker(payload: Dict[str, Any], task_id: str) -> Dict[str, Any]
         task_manager.update(task_id, progress=100.0)
         print("[analyze] frames.render.done", {"count": total})
         return {"count": total, "fps": int(fps)}
+    except TaskCancelled:
+        print("[analyze] Frames data mode canceled", {"task_id": task_id})
+        raise
     except Exception as e:
         import traceback
         print("[analyze] Frames data mode failed:\n", traceback.format_exc())
@@ -327,6 +469,160 @@ def _frames_data_worker(payload: Dict[str, Any], task_id: str) -> Dict[str, Any]
         raise
 
 
+def _models_summary() -> str:
+    ms = _predict_bridge.model_stats()
+    return (
+        f"detector hits={ms['detector_hits']} misses={ms['detector_misses']} load={ms['detector_load_s']:.2f}s; "
+        f"hmm hits={ms['hmm_hits']} misses={ms['hmm_misses']} load={ms['hmm_load_s']:.2f}s"
+    )
+
+
+def _predict_job_path(workspace_dir: Path, base_stem: str) -> Path:
+    return workspace_dir / f"{base_stem}_predict.job.json"
+
+
+_CLAIMED = ".claimed."  # job file renamed to <job>.claimed.<owner> while a worker resubmits it
+
+
+def _job_is_live(job_file: Path) -> bool:
+    """True while the job's task is still pending/running in the task store (possibly on another worker)."""
+    try:
+        saved = json.loads(job_file.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return False
+    st = task_manager.get(str(saved.get("task_id") or ""))
+    return st is not None and st.status in ("pending", "running")
+
+
+def _interrupted_predict_jobs(session_id: Optional[str] = None, filename: Optional[str] = None) -> List[Path]:
+    """Job files of predictions that never finished (the process died while they ran).
+
+    Jobs whose task is still live in the task store are skipped, and so are
+    claims (see _claim_predict_job) held by a live worker process.
+    """
+    from app.utils.task_store import owner_alive
+
+    root = VALID_DIRECTORIES[DirectoryEnum.workspace]
+    sessions = [root / session_id] if session_id else [p for p in root.iterdir() if p.is_dir()]
+    pattern = f"{_safe_name(Path(filename).stem)}_predict.job.json" if filename else "*_predict.job.json"
+    jobs: List[Path] = []
+    for d in sessions:
+        if not d.is_dir():
+            continue
+        jobs.extend(p for p in sorted(d.glob(pattern)) if not _job_is_live(p))
+        for p in sorted(d.glob(f"{pattern}{_CLAIMED}*")):
+            if not owner_alive(p.name.split(_CLAIMED, 1)[1]):
+                jobs.append(p)  # claimed by a worker that died before resubmitting it
+    return jobs
+
+
+def _claim_predict_job(job_file: Path) -> Optional[Path]:
+    """Atomically take a job file for this process; None if another worker took it first."""
+    from app.utils.task_store import owner_id
+
+    job = job_file.name.split(_CLAIMED, 1)[0]
+    claimed = job_file.with_name(f"{job}{_CLAIMED}{owner_id()}")
+    try:
+        os.rename(job_file, claimed)
+    except FileNotFoundError:
+        return None
+    return claimed
+
+
+def _too_busy(e: TaskRejected) -> HTTPException:
+    return HTTPException(
+        status_code=429,
+        detail={"detail": str(e), "stage": e.stage, "expected_wait_s": e.expected_wait_s,
+                "retry_after_s": e.retry_after_s},
+        headers={"Retry-After": str(int(e.retry_after_s))},
+    )
+
+
+def _queue_task(task_id: str, fn, *args: Any, stage: str, **kwargs: Any) -> Optional[float]:
+    """task_manager.run, discarding the task when admission control rejects it; returns the expected wait."""
+    try:
+        return task_manager.run(task_id, fn, *args, stage=stage, **kwargs)
+    except TaskRejected:
+        task_manager.discard(task_id)
+        raise
+
+
+def _resume_predict_job(job_file: Path, overrides: Optional[Dict[str, Any]] = None) -> Optional[str]:
+    """Start a new predict task from a job file; finished detections come from the store/checkpoint.
+
+    The job file is claimed first, so concurrent workers (startup hooks, /resume_predict)
+    resubmit it once; returns None when another worker got it. It is put back
+    pointing at the new task before queueing, which keeps it from being taken
+    again while the task is live.
+    """
+    claimed = _claim_predict_job(job_file)
+    if claimed is None:
+        return None
+    job = claimed.with_name(claimed.name.split(_CLAIMED, 1)[0])
+    try:
+        saved = json.loads(claimed.read_text(encoding="utf-8"))
+        payload = dict(saved.get("payload") or {})
+        payload.update({k: v for k, v in (overrides or {}).items() if v is not None})
+        st = task_manager.create(session_id=payload.get("session_id"), kind="predict")
+        claimed.write_text(json.dumps({"payload": payload, "task_id": st.id, "started_at": time.time()}),
+                           encoding="utf-8")
+    finally:
+        os.replace(claimed, job)
+    task_manager.log(st.id, f"Task created (predict, resumed from task {saved.get('task_id')})")
+    _queue_task(st.id, _predict_worker, payload, st.id, stage="predict", cancel=task_manager.token(st.id))
+    return st.id
+
+
+def resume_interrupted_predictions() -> List[str]:
+    """Resubmit every interrupted prediction in the workspace (called on startup)."""
+    task_ids = []
+    for job in _interrupted_predict_jobs():
+        try:
+            task_id = _resume_predict_job(job)
+            if task_id is None:
+                continue  # taken by another worker
+            task_ids.append(task_id)
+            print("[analyze] resumed interrupted prediction", {"job": str(job), "task_id": task_id})
+        except Exception as e:
+            print("[analyze] could not resume", {"job": str(job), "error": str(e)})
+    return task_ids
+
+
+def _normalized_source(in_video: Path, workspace_dir: Path, log=None) -> Optional[Path]:
+    """Normalized copy of the upload made by /core/upload (None while absent, in progress or stale)."""
+    path = _predict_bridge.normalized_video(in_video, workspace_dir)
+    if path is not None:
+        print("[analyze] decoding from normalized video", {"path": str(path)})
+        if callable(log):
+            log(f"Decoding frames from normalized copy {path.name}")
+    return path
+
+
+def _deadline_s(payload: Dict[str, Any]) -> Optional[float]:
+    """Optional `deadline_s` of a predict/analysis payload: seconds the prediction should finish in."""
+    value = payload.get("deadline_s")
+    if value is None or value == "":
+        return None
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="deadline_s must be a number of seconds")
+    if value <= 0:
+        raise HTTPException(status_code=400, detail="deadline_s must be positive")
+    return value
+
+
+def _sampling_mode(payload: Dict[str, Any]) -> Optional[str]:
+    """Optional `sampling` of a predict/analysis payload: "fixed" or "motion" (None = Settings default)."""
+    value = payload.get("sampling")
+    if value is None or value == "":
+        return None
+    value = str(value).lower()
+    if value not in ("fixed", "motion"):
+        raise HTTPException(status_code=400, detail="sampling must be 'fixed' or 'motion'")
+    return value
+
+
 def _safe_name(base: str) -> str:
     # Keep only safe chars
     import re
@@ -334,14 +630,34 @@ def _safe_name(base: str) -> str:
     return s or "out"
 
 
-def _parse_csv_for_front(csv_path: Path) -> Dict[str, Any]:
+def _is_front_column(name: str) -> bool:
+    """Columns used by _parse_csv_for_front (skips identity embeddings and state posteriors)."""
+    return (
+        name.lower() in ("anger", "disgust", "fear", "happiness", "sadness", "surprise", "neutral")
+        or name.startswith(("x_", "y_", "landmark_", "face_landmark_", "AU", "HMM_state", "HMM_AUexp_"))
+    )
+
+
+def _move_with_columnar(src_csv: Path, dst_csv: Path) -> None:
+    """Move an analysis CSV and its columnar sidecar (if any) next to each other."""
+    if dst_csv.exists():
+        dst_csv.unlink()
+    src_csv.replace(dst_csv)
+    src_cols = column_store.sidecar(src_csv)
+    if src_cols.exists():
+        column_store.replace(src_cols, column_store.sidecar(dst_csv))
+
+
+def _parse_csv_for_front(csv_path: Path, nrows: Optional[int] = None) -> Dict[str, Any]:
     import pandas as pd
 
     if not csv_path.exists():
         raise HTTPException(status_code=500, detail=f"CSV not found: {csv_path}")
 
     try:
-        df = pd.read_csv(csv_path)
+        df = column_store.read_sidecar(csv_path, where=_is_front_column) if nrows is None else None
+        if df is None:
+            df = pd.read_csv(csv_path, nrows=nrows)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to read CSV: {e}")
 
@@ -410,9 +726,10 @@ def _parse_csv_for_front(csv_path: Path) -> Dict[str, Any]:
     return result
 
 
-def _analysis_worker_impl(payload: Dict[str, Any], task_id: Optional[str] = None) -> Dict[str, Any]:
+def _analysis_worker_impl(payload: Dict[str, Any], task_id: Optional[str] = None, cancel=None) -> Dict[str, Any]:
     """Heavy synchronous analysis, factored for reuse by sync and async endpoints.
-    Updates TaskManager if task_id is provided.
+    Updates TaskManager if task_id is provided. `cancel` (a CancelToken) is checked
+    between detected frames/chunks, between stages and between rendered frames.
     """
     def tlog(msg: str) -> None:
         if task_id:
@@ -428,6 +745,9 @@ def _analysis_worker_impl(payload: Dict[str, Any], task_id: Optional[str] = None
     face_threshold = float(payload.get("face_threshold") or 0.95)
     render_avatar = bool(payload.get("render_avatar") if payload.get("render_avatar") is not None else True)
     avatar_source = str(payload.get("avatar_source") or "hmm")
+    deadline_s = _deadline_s(payload)
+    sampling_mode = _sampling_mode(payload)
+    sampling: Dict[str, Any] = {}
 
     # For building URLs early (for streaming updates)
     base_prefix = "/api/v1/core/download"
@@ -481,8 +801,19 @@ def _analysis_worker_impl(payload: Dict[str, Any], task_id: Optional[str] = None
             fps=fps,
             skip_frames=skip_frames,
             face_threshold=face_threshold,
+            detection_store=workspace_dir / f"{base_stem}_detections",
+            decode_path=_normalized_source(in_video, workspace_dir, tlog),
+            log_cb=tlog,
+            stats_cb=lambda s: sampling.update(s.get("sampling") or {}),
+            deadline_s=deadline_s,
+            sampling=sampling_mode,
+            cancel=cancel,
         )
+        if task_id and sampling:
+            task_manager.update(task_id, sampling=dict(sampling))
         print("[analyze] detect_video.done")
+        if task_id:
+            task_manager.log(task_id, f"Models: {_models_summary()}")
         # CSV saved info
         try:
             _csv_exists = out_csv.exists()
@@ -493,6 +824,9 @@ def _analysis_worker_impl(payload: Dict[str, Any], task_id: Optional[str] = None
         if task_id:
             task_manager.update(task_id, progress=40.0)
         tlog("Prediction finished")
+    except TaskCancelled:
+        print("[analyze] Analysis canceled during prediction", {"task_id": task_id})
+        raise
     except Exception as e:
         import traceback
         print("[analyze] Prediction failed:\n", traceback.format_exc())
@@ -501,6 +835,8 @@ def _analysis_worker_impl(payload: Dict[str, Any], task_id: Optional[str] = None
         raise
 
     # Emotions plot
+    if cancel is not None:
+        cancel()
     emo_png_path: Optional[Path] = None
     try:
         tlog("Emotions plot rendering started")
@@ -525,6 +861,8 @@ def _analysis_worker_impl(payload: Dict[str, Any], task_id: Optional[str] = None
     gif_path: Optional[Path] = None
     avatar_frames: list[Path] = []
     frames_fps: Optional[int] = None
+    if render_avatar and cancel is not None:
+        cancel()
     if render_avatar:
         # Prepare streaming base URL and fps for UI
         if task_id:
@@ -554,7 +892,7 @@ def _analysis_worker_impl(payload: Dict[str, Any], task_id: Optional[str] = None
                         pth = downloads_dir / name
                         if pth.exists() and name not in st.frames:
                             print("[analyze] frame.ready", name)
-                            task_manager.update(task_id, frames=st.frames + [name])
+                            task_manager.append(task_id, "frames", name)
                 except Exception:
                     pass
                 # Throttled progress print
@@ -573,8 +911,11 @@ def _analysis_worker_impl(payload: Dict[str, Any], task_id: Optional[str] = None
                 dpi=150,
                 limit=None,
                 progress_cb=_pcb,
+                cancel=cancel,
             )
             print(f"[analyze] Avatar frames render finished: count={len(avatar_frames)}, fps={frames_fps}, sample={[Path(p).name for p in avatar_frames[:3]]}")
+        except TaskCancelled:
+            raise
         except Exception as e:
             tlog(f"Avatar frames failed: {e}")
             avatar_frames = []
@@ -591,8 +932,11 @@ def _analysis_worker_impl(payload: Dict[str, Any], task_id: Optional[str] = None
                     dpi=150,
                     limit=None,
                     progress_cb=_pcb,
+                    cancel=cancel,
                 )
                 print(f"[analyze] Avatar frames fallback finished: count={len(avatar_frames)}, fps={frames_fps}, sample={[Path(p).name for p in avatar_frames[:3]]}")
+            except TaskCancelled:
+                raise
             except Exception as e:
                 tlog(f"Avatar frames fallback failed: {e}")
         print("[analyze] frames.render.done", {"count": len(avatar_frames)})
@@ -610,9 +954,7 @@ def _analysis_worker_impl(payload: Dict[str, Any], task_id: Optional[str] = None
     csv_download = downloads_dir / out_csv.name
     if out_csv.exists():
         try:
-            if csv_download.exists():
-                csv_download.unlink()
-            out_csv.replace(csv_download)
+            _move_with_columnar(out_csv, csv_download)
         except Exception:
             csv_download = out_csv  # keep in workspace if moving fails
 
@@ -655,6 +997,7 @@ def _analysis_worker_impl(payload: Dict[str, Any], task_id: Optional[str] = None
             "files": frames_list,
         },
         "data": parsed,
+        "sampling": sampling or None,
     }
 
 
@@ -668,7 +1011,9 @@ async def run_analysis(
         "skip_frames": 25,
         "face_threshold": 0.95,
         "render_avatar": True,
-        "avatar_source": "hmm"
+        "avatar_source": "hmm",
+        "deadline_s": None,
+        "sampling": "fixed"
     })
 ) -> Dict[str, Any]:
     """
@@ -680,6 +1025,9 @@ async def run_analysis(
       3) Call POST /analyze/run with session_id and uploaded filename
 
     Returns JSON with parsed data and URLs to download artifacts (CSV, GIF).
+    With "deadline_s" the prediction widens skip_frames as needed to finish in
+    time, and "sampling": "motion" places the skip_frames budget where the
+    picture changes; the sampling actually used is returned under "sampling".
     """
     safe = {
         "session_id": payload.get("session_id"),
@@ -689,6 +1037,8 @@ async def run_analysis(
         "face_threshold": payload.get("face_threshold"),
         "render_avatar": payload.get("render_avatar"),
         "avatar_source": payload.get("avatar_source"),
+        "deadline_s": payload.get("deadline_s"),
+        "sampling": payload.get("sampling"),
     }
     print("[analyze] /run payload:", json.dumps(safe, ensure_ascii=False))
     # Keep the synchronous route for compatibility; run worker inline
@@ -708,12 +1058,18 @@ async def run_analysis_async(
         "face_threshold": payload.get("face_threshold"),
         "render_avatar": payload.get("render_avatar"),
         "avatar_source": payload.get("avatar_source"),
+        "deadline_s": payload.get("deadline_s"),
+        "sampling": payload.get("sampling"),
     }
     print("[analyze] /run_async payload:", json.dumps(safe, ensure_ascii=False))
-    st = task_manager.create()
+    st = task_manager.create(session_id=payload.get("session_id"), kind="analysis")
     task_manager.log(st.id, "Task created")
-    task_manager.run(st.id, _analysis_worker_impl, payload, st.id)
-    return {"task_id": st.id}
+    try:
+        wait = _queue_task(st.id, _analysis_worker_impl, payload, st.id, stage="analysis",
+                           cancel=task_manager.token(st.id))
+    except TaskRejected as e:
+        raise _too_busy(e)
+    return {"task_id": st.id, "expected_wait_s": wait}
 
 
 @router.get("/status/{task_id}")
@@ -738,6 +1094,9 @@ async def analysis_status(task_id: str) -> Dict[str, Any]:
         "frames_base_url": st.frames_base_url,
         "frames_fps": st.frames_fps,
         "frames": st.frames,
+        "sampling": st.sampling,
+        "stage": st.stage,
+        "queue_wait_s": st.queue_wait_s,
         # Errors/logs/final result
         "error": st.error,
         "logs": st.logs,
@@ -749,10 +1108,56 @@ async def analysis_status(task_id: str) -> Dict[str, Any]:
 
 @router.post("/start_predict")
 async def start_predict(payload: Dict[str, Any] = Body(...)) -> Dict[str, Any]:
-    st = task_manager.create()
+    st = task_manager.create(session_id=payload.get("session_id"), kind="predict")
     task_manager.log(st.id, "Task created (predict)")
-    task_manager.run(st.id, _predict_worker, payload, st.id)
-    return {"task_id": st.id}
+    try:
+        wait = _queue_task(st.id, _predict_worker, payload, st.id, stage="predict", cancel=task_manager.token(st.id))
+    except TaskRejected as e:
+        raise _too_busy(e)
+    return {"task_id": st.id, "expected_wait_s": wait}
+
+
+@router.post("/resume_predict")
+async def resume_predict(payload: Dict[str, Any] = Body(...)) -> Dict[str, Any]:
+    """Continue interrupted predictions of a session (or of one file in it).
+
+    Detection already done by the interrupted run is loaded from the detection
+    store checkpoint; only the remaining frames are processed. Other payload
+    keys override the saved request. A file without a saved job is started
+    like /start_predict.
+    """
+    session_id = payload.get("session_id")
+    filename = payload.get("filename")
+    if not session_id:
+        raise HTTPException(status_code=400, detail="session_id is required")
+    ensure_session_dir(DirectoryEnum.workspace, session_id)
+    overrides = {k: v for k, v in payload.items() if k not in ("session_id", "filename")}
+    jobs = _interrupted_predict_jobs(session_id, filename)
+    task_ids: List[str] = []
+    deferred = 0
+    for i, job in enumerate(jobs):
+        try:
+            task_id = _resume_predict_job(job, overrides)
+        except TaskRejected as e:
+            if not task_ids:
+                raise _too_busy(e)
+            deferred = len(jobs) - i  # the rest stays interrupted and can be resumed later
+            break
+        if task_id is not None:
+            task_ids.append(task_id)
+    if not task_ids:
+        if jobs:
+            raise HTTPException(status_code=409, detail="Interrupted predictions are being resumed by another worker")
+        if not filename:
+            raise HTTPException(status_code=404, detail="No interrupted predictions in this session")
+        st = task_manager.create(session_id=session_id, kind="predict")
+        task_manager.log(st.id, "Task created (predict, resume without saved job)")
+        try:
+            _queue_task(st.id, _predict_worker, payload, st.id, stage="predict", cancel=task_manager.token(st.id))
+        except TaskRejected as e:
+            raise _too_busy(e)
+        task_ids = [st.id]
+    return {"task_id": task_ids[0], "task_ids": task_ids, "deferred": deferred}
 
 
 @router.get("/status_predict/{task_id}")
@@ -770,16 +1175,40 @@ async def status_predict(task_id: str) -> Dict[str, Any]:
         "message": st.message,
         "csv_url": st.csv_url,
         "csv_name": st.csv_name,
+        "rows_available": st.rows_available,
+        "stream_name": st.stream_name,
+        "pipeline": st.pipeline,
+        "sampling": st.sampling,
+        "queue_wait_s": st.queue_wait_s,
         "error": st.error,
     }
 
 
+@router.get("/preview/{task_id}")
+async def preview_predict(task_id: str, session_id: str) -> Dict[str, Any]:
+    """Frontend preview of a prediction task: the final CSV when done, else the rows streamed so far."""
+    st = task_manager.get(task_id)
+    if not st:
+        raise HTTPException(status_code=404, detail="Task not found")
+    if st.status == "done" and st.csv_name:
+        csv_path = ensure_session_dir(DirectoryEnum.downloads, session_id) / st.csv_name
+        return {"status": st.status, "rows": None, "data": _parse_csv_for_front(csv_path)}
+    if not st.stream_name or st.rows_available <= 0:
+        return {"status": st.status, "rows": 0, "data": None}
+    rows = int(st.rows_available)
+    stream_path = ensure_session_dir(DirectoryEnum.workspace, session_id) / st.stream_name
+    return {"status": st.status, "rows": rows, "data": _parse_csv_for_front(stream_path, nrows=rows)}
+
+
 @router.post("/start_emotions")
 async def start_emotions(payload: Dict[str, Any] = Body(...)) -> Dict[str, Any]:
-    st = task_manager.create()
+    st = task_manager.create(session_id=payload.get("session_id"), kind="emotions")
     task_manager.log(st.id, "Task created (emotions)")
-    task_manager.run(st.id, _emotions_worker, payload, st.id)
-    return {"task_id": st.id}
+    try:
+        wait = _queue_task(st.id, _emotions_worker, payload, st.id, stage="plot")
+    except TaskRejected as e:
+        raise _too_busy(e)
+    return {"task_id": st.id, "expected_wait_s": wait}
 
 
 @router.get("/status_emotions/{task_id}")
@@ -802,15 +1231,20 @@ async def status_emotions(task_id: str) -> Dict[str, Any]:
 @router.post("/start_frames")
 async def start_frames(payload: Dict[str, Any] = Body(...)) -> Dict[str, Any]:
     mode = str(payload.get("mode") or "image").lower()
-    st = task_manager.create()
+    st = task_manager.create(session_id=payload.get("session_id"), kind="frames")
     task_manager.log(st.id, f"Task created (frames:{mode})")
-    if mode == "data":
-        task_manager.update(st.id, mode="data")
-        task_manager.run(st.id, _frames_data_worker, payload, st.id)
-    else:
-        task_manager.update(st.id, mode="image")
-        task_manager.run(st.id, _frames_image_worker, payload, st.id)
-    return {"task_id": st.id}
+    try:
+        if mode == "data":
+            task_manager.update(st.id, mode="data")
+            wait = _queue_task(st.id, _frames_data_worker, payload, st.id, stage="data",
+                               cancel=task_manager.token(st.id))
+        else:
+            task_manager.update(st.id, mode="image")
+            wait = _queue_task(st.id, _frames_image_worker, payload, st.id, stage="render",
+                               cancel=task_manager.token(st.id))
+    except TaskRejected as e:
+        raise _too_busy(e)
+    return {"task_id": st.id, "expected_wait_s": wait}
 
 
 @router.get("/status_frames/{task_id}")
@@ -820,12 +1254,12 @@ async def status_frames(task_id: str) -> Dict[str, Any]:
         raise HTTPException(status_code=404, detail="Task not found")
     mode = (st.mode or "image").lower()
     if mode == "data":
-        # Provide next chunk since st.data_next_index
-        start_idx = st.data_next_index
-        items = st.data_items[start_idx: start_idx + 50] if isinstance(st.data_items, list) else []  # throttle batch size
+        # Provide next chunk since data_next_index; the cursor is advanced in the task store, so
+        # polls served by different API workers continue where the previous one stopped
+        total = task_manager.item_count(task_id, "data_items")
+        start_idx = task_manager.advance(task_id, "data_next_index", total, 50)  # throttle batch size
+        items = task_manager.items(task_id, "data_items", start_idx, 50)
         next_index = start_idx + len(items)
-        # update the next_index in state so subsequent calls stream next chunk
-        task_manager.update(task_id, data_next_index=next_index)
         try:
             print("[analyze] /status_frames", task_id, f"status={st.status}", f"progress={st.progress}", f"mode=data", f"next_index={next_index}")
         except Exception:
@@ -852,3 +1286,64 @@ async def status_frames(task_id: str) -> Dict[str, Any]:
             "frames": st.frames,
             "error": st.error,
         }
+
+
+@router.get("/tasks")
+async def list_tasks(session_id: Optional[str] = None, limit: int = 50) -> Dict[str, Any]:
+    """Tasks of a session (of all sessions without session_id), newest first, including previous runs."""
+    tasks = task_manager.list(session_id, max(1, min(500, int(limit))))
+    return {
+        "tasks": [
+            {
+                "id": st.id,
+                "session_id": st.session_id,
+                "kind": st.kind,
+                "status": st.status,
+                "progress": st.progress,
+                "message": st.message,
+                "started_at": st.started_at,
+                "finished_at": st.finished_at,
+                "csv_name": st.csv_name,
+                "error": st.error,
+            }
+            for st in tasks
+        ]
+    }
+
+
+@router.delete("/task/{task_id}")
+async def cancel_task(task_id: str) -> Dict[str, Any]:
+    """Cancel a task: a queued one is dropped at once, a running one stops at its next frame/chunk check.
+
+    Returns status "canceled" when the task is already stopped, "cancelling"
+    while a running job still has to reach its check (poll /status for the end).
+    """
+    st = task_manager.get(task_id)
+    if not st:
+        raise HTTPException(status_code=404, detail="Task not found")
+    if st.status in ("done", "error", "canceled"):
+        raise HTTPException(status_code=409, detail=f"Task already {st.status}")
+    if not task_manager.cancel(task_id):
+        raise HTTPException(status_code=409, detail="Task already finished")
+    st = task_manager.get(task_id)
+    status = "canceled" if st is None or st.status == "canceled" else "cancelling"
+    print("[analyze] task.cancel", {"task_id": task_id, "status": status})
+    return {"task_id": task_id, "status": status}
+
+
+@router.get("/stages")
+async def stages_status() -> Dict[str, Any]:
+    """Task stages of this worker process: concurrency limit, running/queued jobs, queue wait and run times."""
+    return task_manager.stage_stats()
+
+
+@router.get("/models")
+async def models_status() -> Dict[str, Any]:
+    """Warm model registry: load times and hit/miss counters."""
+    return _predict_bridge.model_stats()
+
+
+@router.get("/cache")
+async def cache_status() -> Dict[str, Any]:
+    """Result cache: entries, size and hit/miss counters."""
+    return _predict_bridge.cache_stats()
@@ -1,9 +1,12 @@
 from typing import Optional
 import uuid
 import stat
+import hashlib
 import shutil
 import zipfile
 import datetime
+import mimetypes
+from pathlib import Path
 import humanize
 
 from fastapi import APIRouter, UploadFile, File, HTTPException, Header, Query
@@ -11,6 +14,9 @@ from fastapi.responses import FileResponse
 
 from app.configs.paths import DirectoryEnum, VALID_DIRECTORIES
 from app.configs.paths import ensure_session_dir, assert_safe_filename
+from app.utils.result_cache import hash_sidecar
+from app.utils.tasks import TaskRejected, manager as task_manager
+from app.configs.settings import get_settings
 
 router = APIRouter()
 
@@ -79,7 +85,8 @@ async def list_files(session_id: str, directory: DirectoryEnum):
 
     files_list = []
     for file in directory_path.iterdir():
-        if file.is_file():
+        # dot-файлы служебные (например, .<name>.sha256 от upload_file) — не показываем
+        if file.is_file() and not file.name.startswith("."):
             try:
                 file_stat = file.stat()
             except OSError:
@@ -99,12 +106,43 @@ async def list_files(session_id: str, directory: DirectoryEnum):
     return {"directory": str(directory_path), "files": files_list}
 
 
+def _is_video(file: UploadFile) -> bool:
+    mime = file.content_type or mimetypes.guess_type(file.filename or "")[0] or ""
+    return mime.startswith("video/")
+
+
+def _normalize_worker(session_id: str, video_path: Path, task_id: str) -> dict:
+    """Фоновая задача: нормализованная копия загруженного видео в workspace сессии."""
+    from app import _predict_bridge
+
+    workspace_dir = ensure_session_dir(DirectoryEnum.workspace, session_id)
+    task_manager.update(task_id, message="Normalizing video", progress=1.0)
+
+    def _progress(done: int, total: int) -> None:
+        if total > 0:
+            task_manager.update(task_id, frames_done=done, frames_total=total,
+                                progress=min(99.0, 100.0 * done / total))
+
+    meta = _predict_bridge.normalize_video(video_path, workspace_dir, progress_cb=_progress)
+    out = _predict_bridge.normalized_path(workspace_dir, video_path.name)
+    task_manager.log(task_id, f"Normalized {video_path.name}: {meta['frame_count']} frames "
+                              f"{meta['width']}x{meta['height']} @ {meta['fps']:g} fps -> {out.name}")
+    task_manager.update(task_id, message="Video normalized")
+    return {"normalized": out.name, "frames": meta["frame_count"],
+            "width": meta["width"], "height": meta["height"], "fps": meta["fps"]}
+
+
 @router.post("/upload/{directory}/{session_id}/")
 async def upload_file(
-    session_id: str, directory: DirectoryEnum, file: UploadFile = File(...)
+    session_id: str, directory: DirectoryEnum, file: UploadFile = File(...),
+    normalize: Optional[bool] = Query(default=None),
 ):
     """
     Загрузить файл.
+
+    Для видео в uploads при normalize=true (по умолчанию — UPLOAD_NORMALIZE) в фоне запускается
+    перекодирование в workspace сессии; анализы этого файла будут читать кадры из копии.
+    Статус — через /analyze/status/{normalize_task_id}.
     """
     directory_path = ensure_session_dir(directory, session_id)
 
@@ -112,15 +150,33 @@ async def upload_file(
     assert_safe_filename(file.filename)
 
     file_path = directory_path / file.filename
+    # хэш содержимого считаем на лету — по нему кэшируются результаты анализа
+    digest = hashlib.sha256()
     try:
         with file_path.open("wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+            for block in iter(lambda: file.file.read(1024 * 1024), b""):
+                digest.update(block)
+                buffer.write(block)
+        hash_sidecar(file_path).write_text(digest.hexdigest(), encoding="utf-8")
     except PermissionError as e:
         raise HTTPException(status_code=403, detail=f"Permission denied: {e}")
     except OSError as e:
         raise HTTPException(status_code=500, detail=f"Filesystem error: {e}")
 
-    return {"message": "File uploaded successfully", "path": str(file_path)}
+    result = {"message": "File uploaded successfully", "path": str(file_path), "sha256": digest.hexdigest()}
+    if normalize is None:
+        normalize = get_settings().UPLOAD_NORMALIZE
+    if normalize and directory == DirectoryEnum.uploads and _is_video(file):
+        st = task_manager.create(session_id=session_id, kind="normalize")
+        task_manager.log(st.id, f"Task created (normalize {file.filename})")
+        try:
+            task_manager.run(st.id, _normalize_worker, session_id, file_path, st.id, stage="normalize")
+            result["normalize_task_id"] = st.id
+        except TaskRejected as e:
+            # Normalization is an optimization: analyses read the original upload until it exists
+            task_manager.discard(st.id)
+            print("[core] normalize skipped:", e)
+    return result
 
 
 @router.get("/download/{directory}/{session_id}/{filename}/")
@@ -0,0 +1,240 @@
+from __future__ import annotations
+
+import asyncio
+import base64
+import json
+import math
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+
+from app.configs.settings import get_settings
+from app.utils.models import registry as model_registry
+
+router = APIRouter()
+
+
+def _authorize(token: Optional[str]) -> Optional[str]:
+    """User name for `token`, or None if LIVE_AUTH is on and the token is not active."""
+    settings = get_settings()
+    if not settings.LIVE_AUTH:
+        return "anonymous"
+    if not token:
+        return None
+    from app.providers.keycloak import KeycloakProvider
+    try:
+        info = KeycloakProvider().introspect(token)
+    except Exception as e:
+        print("[live] token introspection failed:", e)
+        return None
+    if not info.get("active"):
+        return None
+    return str(info.get("preferred_username") or info.get("sub") or "user")
+
+
+class _LatestFrame:
+    """Single-slot mailbox: a new frame replaces the one still waiting, which is counted as dropped."""
+
+    def __init__(self) -> None:
+        self.item: Optional[Dict[str, Any]] = None
+        self.event = asyncio.Event()
+        self.dropped = 0
+        self.received = 0
+
+    def put(self, item: Dict[str, Any]) -> None:
+        if self.item is not None:
+            self.dropped += 1
+        self.item = item
+        self.received += 1
+        self.event.set()
+
+    async def take(self) -> Dict[str, Any]:
+        await self.event.wait()
+        item, self.item = self.item, None
+        self.event.clear()
+        return item
+
+
+def _config_update(body: Dict[str, Any]) -> Dict[str, Any]:
+    """Validated client-settable session config; ValueError on bad values.
+
+    HMM artifacts always come from Settings.ARTIFACTS_DIR: they are unpickled,
+    so a client-chosen path would run arbitrary code.
+    """
+    from app._predict_bridge import pipeline_outputs
+
+    update: Dict[str, Any] = {}
+    if body.get("face_threshold") is not None:
+        try:
+            value = float(body["face_threshold"])
+        except (TypeError, ValueError):
+            raise ValueError("face_threshold must be a number")
+        if not 0.0 <= value <= 1.0:
+            raise ValueError("face_threshold must be within [0, 1]")
+        update["face_threshold"] = value
+    if body.get("hmm_step_s") is not None:
+        try:
+            value = float(body["hmm_step_s"])
+        except (TypeError, ValueError):
+            raise ValueError("hmm_step_s must be a number")
+        if not (math.isfinite(value) and value > 0.0):
+            raise ValueError("hmm_step_s must be a positive number of seconds")
+        update["hmm_step_s"] = value
+    if body.get("outputs") is not None:
+        try:
+            update["outputs"] = ",".join(pipeline_outputs(body["outputs"]))
+        except TypeError:
+            raise ValueError("outputs must be a comma-separated string or a list")
+    return update
+
+
+def _parse_message(msg: Dict[str, Any], config: Dict[str, Any], max_bytes: int) -> Optional[Dict[str, Any]]:
+    """Frame item of a received WebSocket message; config messages update `config` in place."""
+    if msg.get("bytes") is not None:
+        data = msg["bytes"]
+        meta: Dict[str, Any] = {}
+    elif msg.get("text") is not None:
+        try:
+            body = json.loads(msg["text"])
+        except ValueError:
+            raise ValueError("text messages must be JSON")
+        if not isinstance(body, dict):
+            raise ValueError("expected a JSON object")
+        kind = body.get("type")
+        if kind == "config":
+            config.update(_config_update(body))
+            return None
+        if kind != "frame" or not body.get("data"):
+            raise ValueError("expected {'type': 'frame', 'data': <base64 image>} or {'type': 'config', ...}")
+        data = str(body["data"])
+        if data.startswith("data:"):
+            data = data.split(",", 1)[-1]  # data URL from canvas.toDataURL
+        data = base64.b64decode(data)
+        meta = {k: body[k] for k in ("id", "ts") if k in body}
+    else:
+        return None
+    if len(data) > max_bytes:
+        raise ValueError(f"frame larger than {max_bytes} bytes")
+    return {"data": data, "received": time.monotonic(), **meta}
+
+
+@router.websocket("/ws")
+async def live_ws(websocket: WebSocket, token: Optional[str] = None) -> None:
+    """Live analysis of JPEG/WebP frames pushed over a WebSocket.
+
+    Protocol:
+      - server -> {"type": "connection_ack", "user": ...} once the token is accepted
+      - client -> binary image, or {"type": "frame", "data": <base64 or data URL>, "id": ..., "ts": ...}
+      - client -> {"type": "config", "face_threshold": ..., "outputs": ..., "hmm_step_s": ...}
+                  (applies from the next frame; outputs restart the session; invalid values
+                  are answered with an error and leave the config unchanged)
+      - server -> {"type": "result", "seq", "id", "ts", "face", "aus", "emotions", "hmm",
+                   "latency_ms": {"queue", "decode", "detect", "hmm", "total"}, "dropped"}
+    Only the newest frame waits while a detection runs; older ones are dropped
+    (counted in "dropped"), so results stay current when the client sends
+    faster than the detector. "id"/"ts" are echoed for client-side round-trip timing.
+    """
+    import live_analysis
+
+    settings = get_settings()
+    user = await asyncio.to_thread(_authorize, token)
+    await websocket.accept()
+    if user is None:
+        await websocket.send_json({"type": "error", "detail": "unauthorized"})
+        await websocket.close(code=4401)
+        return
+    await websocket.send_json({"type": "connection_ack", "user": user})
+
+    config: Dict[str, Any] = {
+        "face_threshold": float(settings.LIVE_FACE_THRESHOLD),
+        "outputs": settings.LIVE_OUTPUTS,
+        "hmm_step_s": float(settings.LIVE_HMM_STEP_S),
+    }
+    slot = _LatestFrame()
+    closed = asyncio.Event()
+
+    async def _receive() -> None:
+        try:
+            while True:
+                msg = await websocket.receive()
+                if msg.get("type") == "websocket.disconnect":
+                    break
+                try:
+                    item = _parse_message(msg, config, int(settings.LIVE_MAX_FRAME_BYTES))
+                except ValueError as e:
+                    await websocket.send_json({"type": "error", "detail": str(e)})
+                    continue
+                if item is not None:
+                    slot.put(item)
+        except WebSocketDisconnect:
+            pass
+        finally:
+            closed.set()
+            slot.event.set()  # wake the worker so it can exit
+
+    receiver = asyncio.create_task(_receive())
+    lease = None
+    session = None
+    session_key = None
+    seq = 0
+    try:
+        while not closed.is_set():
+            item = await slot.take()
+            if item is None:
+                continue
+            key = str(config["outputs"])
+            if session is None or key != session_key:
+                if lease is not None:
+                    lease.__exit__(None, None, None)
+                lease = model_registry.detector(key)
+                detector = await asyncio.to_thread(lease.__enter__)
+                try:
+                    artifacts = await asyncio.to_thread(model_registry.hmm, Path(settings.ARTIFACTS_DIR))
+                except Exception as e:
+                    print("[live] HMM artifacts unavailable:", e)
+                    artifacts = None
+                session = live_analysis.LiveSession(detector, artifacts, outputs=key,
+                                                    max_height=int(settings.LIVE_MAX_HEIGHT))
+                session_key = key
+            session.face_threshold = float(config["face_threshold"])
+            session.hmm_step_s = max(1e-3, config["hmm_step_s"])
+            started = time.monotonic()
+            try:
+                res = await asyncio.to_thread(session.process, item["data"], item["received"])
+            except ValueError as e:
+                await websocket.send_json({"type": "error", "detail": str(e), "id": item.get("id")})
+                continue
+            done = time.monotonic()
+            seq += 1
+            timings = res.pop("timings_ms")
+            await websocket.send_json({
+                "type": "result",
+                "seq": seq,
+                "id": item.get("id"),
+                "ts": item.get("ts"),
+                **res,
+                "latency_ms": {
+                    "queue": round(1000.0 * (started - item["received"]), 1),
+                    **timings,
+                    "total": round(1000.0 * (done - item["received"]), 1),
+                },
+                "dropped": slot.dropped,
+                "received": slot.received,
+            })
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        import traceback
+        print("[live] session failed:\n", traceback.format_exc())
+        try:
+            await websocket.send_json({"type": "error", "detail": str(e)})
+            await websocket.close(code=1011)
+        except Exception:
+            pass
+    finally:
+        receiver.cancel()
+        if lease is not None:
+            lease.__exit__(None, None, None)
+        print("[live] session closed", {"user": user, "frames": seq, "dropped": slot.dropped})
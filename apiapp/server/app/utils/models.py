@@ -0,0 +1,189 @@
+from __future__ import annotations
+
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Iterator, Optional
+
+
+def _mtime(path: Path) -> Optional[float]:
+    try:
+        return path.stat().st_mtime
+    except OSError:
+        return None
+
+
+@dataclass
+class _HmmEntry:
+    key: tuple
+    artifacts: tuple  # (model, labels, raw_multiplier, meta) as returned by _load_artifacts
+    load_s: float
+    loaded_at: float = field(default_factory=time.time)
+
+
+class ModelRegistry:
+    """Process-wide cache of warm py-feat Detectors and HMM artifacts.
+
+    HMM artifacts are keyed by the resolved artifacts dir plus the mtimes of
+    `hmm_poisson.joblib`/`meta.json`, so replacing the files on disk triggers a
+    reload on the next request. Detectors are not thread-safe, so they are
+    leased: each concurrent TaskManager worker gets its own instance, and
+    instances are returned to an idle pool for reuse instead of being dropped.
+    Idle pools are kept per outputs set, since a Detector built without some
+    heads cannot serve a request that needs them.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._hmm: dict[str, _HmmEntry] = {}
+        self._hmm_locks: dict[str, threading.Lock] = {}
+        self._versions: dict[str, tuple] = {}
+        self._idle_detectors: dict[tuple, list[Any]] = {}
+        self._detectors_total = 0
+        self._detect_cost: dict[tuple, list[float]] = {}  # outputs -> [frames, detect_s]
+        self._stats: dict[str, Any] = {
+            "hmm_hits": 0,
+            "hmm_misses": 0,
+            "hmm_load_s": 0.0,
+            "detector_hits": 0,
+            "detector_misses": 0,
+            "detector_load_s": 0.0,
+        }
+
+    # ----- HMM artifacts -----
+
+    def hmm(self, artifacts_dir: Path) -> tuple:
+        """Return (model, labels, raw_multiplier, meta) for artifacts_dir, loading on first use."""
+        from predict_video_to_csv import _load_artifacts
+
+        adir = Path(artifacts_dir).resolve()
+        dkey = str(adir)
+        key = (dkey, _mtime(adir / "hmm_poisson.joblib"), _mtime(adir / "meta.json"))
+        with self._lock:
+            entry = self._hmm.get(dkey)
+            if entry is not None and entry.key == key:
+                self._stats["hmm_hits"] += 1
+                return entry.artifacts
+            dir_lock = self._hmm_locks.setdefault(dkey, threading.Lock())
+        # Load outside the registry lock so other dirs/detectors are not blocked
+        with dir_lock:
+            with self._lock:
+                entry = self._hmm.get(dkey)
+                if entry is not None and entry.key == key:
+                    self._stats["hmm_hits"] += 1
+                    return entry.artifacts
+            t0 = time.perf_counter()
+            artifacts = _load_artifacts(adir)
+            load_s = time.perf_counter() - t0
+            with self._lock:
+                self._hmm[dkey] = _HmmEntry(key=key, artifacts=artifacts, load_s=load_s)
+                self._stats["hmm_misses"] += 1
+                self._stats["hmm_load_s"] += load_s
+            print("[models] hmm.loaded", {"dir": dkey, "seconds": round(load_s, 3)})
+            return artifacts
+
+    def artifacts_version(self, artifacts_dir: Path) -> str:
+        """Content hash of hmm_poisson.joblib + meta.json, recomputed only when their mtimes change."""
+        import hashlib
+
+        adir = Path(artifacts_dir).resolve()
+        key = (str(adir), _mtime(adir / "hmm_poisson.joblib"), _mtime(adir / "meta.json"))
+        with self._lock:
+            cached = self._versions.get(key[0])
+            if cached is not None and cached[0] == key:
+                return cached[1]
+        h = hashlib.sha256()
+        for name in ("hmm_poisson.joblib", "meta.json"):
+            try:
+                h.update((adir / name).read_bytes())
+            except OSError:
+                h.update(b"missing:" + name.encode())
+        version = h.hexdigest()[:16]
+        with self._lock:
+            self._versions[key[0]] = (key, version)
+        return version
+
+    # ----- Detectors -----
+
+    @contextmanager
+    def detector(self, outputs: Any = None) -> Iterator[Any]:
+        """Lease a warm Detector running the heads for `outputs` (default: all) for the `with` block."""
+        from predict_video_to_csv import _pipeline_outputs
+
+        key = _pipeline_outputs(outputs)
+        det = self._acquire_detector(key)
+        try:
+            yield det
+        finally:
+            with self._lock:
+                self._idle_detectors.setdefault(key, []).append(det)
+
+    def _acquire_detector(self, key: tuple) -> Any:
+        from predict_video_to_csv import _build_detector
+
+        with self._lock:
+            idle = self._idle_detectors.get(key)
+            if idle:
+                self._stats["detector_hits"] += 1
+                return idle.pop()
+        t0 = time.perf_counter()
+        det = _build_detector(key)
+        load_s = time.perf_counter() - t0
+        with self._lock:
+            self._detectors_total += 1
+            self._stats["detector_misses"] += 1
+            self._stats["detector_load_s"] += load_s
+        print("[models] detector.loaded", {
+            "seconds": round(load_s, 3), "outputs": ",".join(key), "instances": self._detectors_total,
+        })
+        return det
+
+    def warmup(self, artifacts_dir: Path, outputs: Any = None) -> None:
+        """Load one Detector and the HMM artifacts ahead of the first request."""
+        self.hmm(artifacts_dir)
+        with self.detector(outputs):
+            pass
+
+    # ----- Detection cost -----
+
+    def record_detect_cost(self, outputs: Any, frames: int, detect_s: float) -> None:
+        """Accumulate detector time (wall time of detect_image calls) per outputs set (reported by predict_video_to_csv.run)."""
+        from predict_video_to_csv import _pipeline_outputs
+
+        if frames <= 0:
+            return
+        key = _pipeline_outputs(outputs)
+        with self._lock:
+            acc = self._detect_cost.setdefault(key, [0, 0.0])
+            acc[0] += int(frames)
+            acc[1] += float(detect_s)
+
+    def detect_cost_ms(self, outputs: Any = None) -> Optional[float]:
+        """Mean detector ms per frame measured for an outputs set, None if never run."""
+        from predict_video_to_csv import _pipeline_outputs
+
+        with self._lock:
+            acc = self._detect_cost.get(_pipeline_outputs(outputs))
+        if not acc or acc[0] <= 0:
+            return None
+        return 1000.0 * acc[1] / acc[0]
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            out = dict(self._stats)
+            out["detectors_total"] = self._detectors_total
+            out["detectors_idle"] = sum(len(v) for v in self._idle_detectors.values())
+            out["detect_ms_per_frame"] = {
+                ",".join(k): round(1000.0 * v[1] / v[0], 2) for k, v in self._detect_cost.items() if v[0]
+            }
+            out["hmm_entries"] = [
+                {"dir": k, "load_s": round(e.load_s, 3), "loaded_at": e.loaded_at}
+                for k, e in self._hmm.items()
+            ]
+        return out
+
+
+# A module-level singleton for convenience
+registry = ModelRegistry()
@@ -0,0 +1,181 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+from typing import Any
+
+_CHUNK = 1024 * 1024
+
+
+def file_sha256(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(_CHUNK), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def hash_sidecar(video_path: Path) -> Path:
+    """Where core.upload_file stores the content hash of an upload (next to it, dot-prefixed)."""
+    return video_path.with_name(f".{video_path.name}.sha256")
+
+
+def video_sha256(video_path: Path) -> str:
+    """Content hash of an uploaded video: from the upload sidecar, else computed (and stored)."""
+    side = hash_sidecar(video_path)
+    try:
+        if side.stat().st_mtime >= video_path.stat().st_mtime:
+            digest = side.read_text(encoding="utf-8").strip()
+            if len(digest) == 64:
+                return digest
+    except OSError:
+        pass
+    digest = file_sha256(video_path)
+    try:
+        side.write_text(digest, encoding="utf-8")
+    except OSError:
+        pass
+    return digest
+
+
+def _place(src: Path, dst: Path) -> None:
+    """Hardlink src to dst (same filesystem), else copy."""
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    if dst.exists():
+        dst.unlink()
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def _place_tree(src: Path, dst: Path) -> None:
+    """_place every file of directory src into dst (replaced if present)."""
+    if dst.exists():
+        shutil.rmtree(dst)
+    for f in src.rglob("*"):
+        if f.is_file():
+            _place(f, dst / f.relative_to(src))
+
+
+class ResultCache:
+    """Size-bounded LRU cache of analysis outputs keyed by video content and parameters.
+
+    Each entry is a directory named by the key hash holding `analysis.csv`, its
+    columnar sidecar `analysis.cols` (when the run wrote one) and a `key.json`
+    with the inputs. Recency is the entry directory's mtime, which is
+    touched on every hit; eviction removes the oldest entries until the total
+    size fits `max_bytes`.
+    """
+
+    CSV_NAME = "analysis.csv"
+    COLS_NAME = "analysis.cols"
+
+    def __init__(self, root: Path, max_bytes: int) -> None:
+        self.root = Path(root)
+        self.max_bytes = int(max_bytes)
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+    @staticmethod
+    def make_key(**parts: Any) -> str:
+        blob = json.dumps(parts, sort_keys=True, default=str)
+        return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+    def _entry(self, key: str) -> Path:
+        return self.root / key[:2] / key
+
+    def fetch(self, key: str, output_csv: Path) -> bool:
+        """On hit, place the cached CSV (and columnar sidecar) at output_csv and return True."""
+        import column_store
+
+        entry = self._entry(key)
+        src = entry / self.CSV_NAME
+        with self._lock:
+            if not src.is_file():
+                self._stats["misses"] += 1
+                return False
+            self._stats["hits"] += 1
+        _place(src, output_csv)
+        cols = column_store.sidecar(output_csv)
+        if (entry / self.COLS_NAME).is_dir():
+            _place_tree(entry / self.COLS_NAME, cols)
+        elif cols.exists():
+            # Entry predates columnar output; a leftover sidecar would not match this CSV
+            shutil.rmtree(cols, ignore_errors=True)
+        try:
+            os.utime(entry, None)
+        except OSError:
+            pass
+        return True
+
+    def store(self, key: str, output_csv: Path, **key_parts: Any) -> None:
+        """Add a finished analysis CSV (and its columnar sidecar) to the cache, then evict down to max_bytes."""
+        import column_store
+
+        if self.max_bytes <= 0 or not output_csv.is_file():
+            return
+        entry = self._entry(key)
+        tmp = entry.with_name(f"{entry.name}.tmp{os.getpid()}_{threading.get_ident()}")
+        try:
+            tmp.mkdir(parents=True, exist_ok=True)
+            _place(output_csv, tmp / self.CSV_NAME)
+            cols = column_store.sidecar(output_csv)
+            if cols.is_dir():
+                _place_tree(cols, tmp / self.COLS_NAME)
+            (tmp / "key.json").write_text(json.dumps(key_parts, sort_keys=True, default=str), encoding="utf-8")
+            if entry.exists():
+                shutil.rmtree(entry, ignore_errors=True)
+            tmp.rename(entry)
+        except OSError as e:
+            shutil.rmtree(tmp, ignore_errors=True)
+            print("[cache] store failed:", e)
+            return
+        with self._lock:
+            self._stats["stores"] += 1
+        self.evict()
+
+    def _entries(self) -> list[tuple[float, int, Path]]:
+        out = []
+        if not self.root.exists():
+            return out
+        for shard in self.root.iterdir():
+            if not shard.is_dir():
+                continue
+            for entry in shard.iterdir():
+                if not entry.is_dir() or ".tmp" in entry.name:
+                    continue
+                try:
+                    size = sum(f.stat().st_size for f in entry.rglob("*") if f.is_file())
+                    out.append((entry.stat().st_mtime, size, entry))
+                except OSError:
+                    continue
+        return out
+
+    def evict(self) -> None:
+        with self._lock:
+            entries = sorted(self._entries())
+            total = sum(size for _, size, _ in entries)
+            for _, size, entry in entries:
+                if total <= self.max_bytes:
+                    break
+                shutil.rmtree(entry, ignore_errors=True)
+                total -= size
+                self._stats["evictions"] += 1
+
+    def stats(self) -> dict[str, Any]:
+        entries = self._entries()
+        with self._lock:
+            out: dict[str, Any] = dict(self._stats)
+        lookups = out["hits"] + out["misses"]
+        out["hit_ratio"] = (out["hits"] / lookups) if lookups else None
+        out["entries"] = len(entries)
+        out["bytes"] = sum(size for _, size, _ in entries)
+        out["max_bytes"] = self.max_bytes
+        out["checked_at"] = time.time()
+        return out
@@ -0,0 +1,376 @@
+from __future__ import annotations
+
+import json
+import os
+from abc import ABC, abstractmethod
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+TERMINAL = ("done", "error", "canceled")
+ITEM_FIELDS = ("logs", "frames", "data_items")  # append-only lists, kept apart from the state document
+LOG_TAIL = 500  # logs returned with a task
+
+
+def _merge_items(rows: List[Any], offset: int, values: List[Any]) -> None:
+    """Write `values` into `rows` from position `offset` (overwriting, then extending)."""
+    del rows[offset:]
+    rows.extend(values)
+
+
+_BOOT = uuid.uuid4().hex[:12]  # tells apart processes that reuse a host:pid (e.g. after a container restart)
+_BOOT_PID = os.getpid()
+
+
+def _boot_nonce() -> str:
+    global _BOOT, _BOOT_PID
+    if os.getpid() != _BOOT_PID:  # forked child: a process of its own
+        _BOOT, _BOOT_PID = uuid.uuid4().hex[:12], os.getpid()
+    return _BOOT
+
+
+def owner_id() -> str:
+    """Identity of the current process as recorded in the store: host:pid:boot-nonce."""
+    return f"{socket.gethostname()}:{os.getpid()}:{_boot_nonce()}"
+
+
+def owner_alive(owner: Optional[str]) -> bool:
+    """Whether the process that recorded `owner` (see owner_id) may still be running."""
+    host, _, rest = (owner or "").partition(":")
+    pid, _, nonce = rest.partition(":")  # no nonce in owners recorded before it was added
+    if host != socket.gethostname() or not pid.isdigit():
+        return True  # another host (or unknown owner): assume it is alive
+    if int(pid) == os.getpid() and nonce:
+        return nonce == _boot_nonce()  # same pid: this process only if the nonce is ours
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass
+    return True
+
+
+class TaskStore(ABC):
+    """Where TaskManager keeps task state: plain dicts of TaskState fields keyed by task id.
+
+    put() writes a whole task, write() merges changed fields of several tasks
+    at once (the throttled progress flush), advance() moves a read cursor
+    field atomically, so concurrent pollers never get the same slice twice.
+
+    The growing lists (ITEM_FIELDS) are not part of the state document: write()
+    takes them as `appends` {task_id: {field: (offset, new items)}}, get()
+    returns logs (the last LOG_TAIL) and frames, and data_items are only read
+    in slices through items(). list() returns state documents without lists.
+    """
+
+    @abstractmethod
+    def put(self, task_id: str, fields: Dict[str, Any], owner: Optional[str] = None) -> None:
+        ...
+
+    @abstractmethod
+    def write(self, changes: Dict[str, Dict[str, Any]],
+              appends: Optional[Dict[str, Dict[str, tuple]]] = None) -> None:
+        ...
+
+    @abstractmethod
+    def get(self, task_id: str) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    def items(self, task_id: str, field: str, start: int = 0, limit: Optional[int] = None) -> List[Any]:
+        ...
+
+    @abstractmethod
+    def item_count(self, task_id: str, field: str) -> int:
+        ...
+
+    @abstractmethod
+    def delete(self, task_id: str) -> None:
+        ...
+
+    @abstractmethod
+    def list(self, session_id: Optional[str] = None, limit: int = 100) -> List[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    def advance(self, task_id: str, field: str, stop: int, limit: int) -> Optional[int]:
+        """Move integer `field` of a task by up to `limit` (not past `stop`); return its old value."""
+
+    def fail_orphans(self, alive: Optional[Callable[[Optional[str]], bool]] = None) -> int:
+        """Mark unfinished tasks whose owner process is gone as errors; return their number."""
+        return 0
+
+
+class MemoryTaskStore(TaskStore):
+    """Process-local store: tasks live as long as the process (the single-worker default)."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._rows: Dict[str, Dict[str, Any]] = {}
+        self._items: Dict[str, Dict[str, List[Any]]] = {}
+
+    def put(self, task_id: str, fields: Dict[str, Any], owner: Optional[str] = None) -> None:
+        with self._lock:
+            self._rows[task_id] = {k: v for k, v in fields.items() if k not in ITEM_FIELDS}
+            self._items.pop(task_id, None)
+
+    def write(self, changes: Dict[str, Dict[str, Any]],
+              appends: Optional[Dict[str, Dict[str, tuple]]] = None) -> None:
+        with self._lock:
+            for task_id, fields in changes.items():
+                self._rows.setdefault(task_id, {"id": task_id}).update(fields)
+            for task_id, lists in (appends or {}).items():
+                for name, (offset, values) in lists.items():
+                    _merge_items(self._items.setdefault(task_id, {}).setdefault(name, []), offset, values)
+
+    def get(self, task_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._rows.get(task_id)
+            if row is None:
+                return None
+            lists = self._items.get(task_id, {})
+            return dict(row, logs=list(lists.get("logs", [])[-LOG_TAIL:]), frames=list(lists.get("frames", [])))
+
+    def items(self, task_id: str, field: str, start: int = 0, limit: Optional[int] = None) -> List[Any]:
+        with self._lock:
+            rows = self._items.get(task_id, {}).get(field, [])
+            return list(rows[start:] if limit is None else rows[start:start + int(limit)])
+
+    def item_count(self, task_id: str, field: str) -> int:
+        with self._lock:
+            return len(self._items.get(task_id, {}).get(field, []))
+
+    def delete(self, task_id: str) -> None:
+        with self._lock:
+            self._rows.pop(task_id, None)
+            self._items.pop(task_id, None)
+
+    def list(self, session_id: Optional[str] = None, limit: int = 100) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = [dict(r) for r in self._rows.values() if session_id is None or r.get("session_id") == session_id]
+        rows.sort(key=lambda r: r.get("started_at") or 0.0, reverse=True)
+        return rows[:max(0, int(limit))]
+
+    def advance(self, task_id: str, field: str, stop: int, limit: int) -> Optional[int]:
+        with self._lock:
+            row = self._rows.get(task_id)
+            if row is None:
+                return None
+            start = int(row.get(field) or 0)
+            row[field] = max(start, min(start + int(limit), int(stop)))
+            return start
+
+
+class SqliteTaskStore(TaskStore):
+    """Tasks in one SQLite database in WAL mode, shared by all API worker processes on a host.
+
+    The id is the primary key and (session_id, started_at) is indexed, so
+    status polls and session listings are index lookups. Task fields are a
+    JSON document of the scalar fields; status, session and owner are also
+    columns for filtering. The lists are rows of `task_items` keyed by
+    (task, field, seq), so a flush appends only new rows and a poll reads
+    one slice instead of rewriting and parsing the whole history.
+    Each process opens its own connection lazily (pool processes that never
+    touch the store never open it). Finished tasks older than `max_age_s`
+    are deleted when the store is first opened.
+    """
+
+    def __init__(self, path: Path, max_age_s: Optional[float] = None, busy_timeout_s: float = 10.0) -> None:
+        self.path = Path(path)
+        self.max_age_s = max_age_s
+        self.busy_timeout_s = float(busy_timeout_s)
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pid: Optional[int] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        # Called with self._lock held
+        if self._conn is not None and self._pid == os.getpid():
+            return self._conn
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(self.path), timeout=self.busy_timeout_s, check_same_thread=False,
+                               isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")  # WAL: durable at checkpoints, no fsync per progress tick
+        conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS tasks (
+                id TEXT PRIMARY KEY,
+                session_id TEXT,
+                kind TEXT,
+                status TEXT NOT NULL,
+                owner TEXT,
+                started_at REAL,
+                updated_at REAL,
+                state TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS tasks_session ON tasks(session_id, started_at);
+            CREATE INDEX IF NOT EXISTS tasks_status ON tasks(status);
+            CREATE TABLE IF NOT EXISTS task_items (
+                task_id TEXT NOT NULL,
+                field TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                value TEXT NOT NULL,
+                PRIMARY KEY (task_id, field, seq)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS owners (
+                process TEXT PRIMARY KEY,
+                owner TEXT NOT NULL
+            );
+            """
+        )
+        # Latest process behind each host:pid, so a reused pid does not keep a dead owner's tasks alive
+        me = owner_id()
+        conn.execute("INSERT OR REPLACE INTO owners (process, owner) VALUES (?, ?)", (f"{socket.gethostname()}:{os.getpid()}", me))
+        if self.max_age_s is not None and self.max_age_s > 0:
+            cutoff = time.time() - float(self.max_age_s)
+            conn.execute(f"DELETE FROM tasks WHERE status IN ({','.join('?' * len(TERMINAL))}) AND updated_at < ?",
+                         (*TERMINAL, cutoff))
+            conn.execute("DELETE FROM task_items WHERE task_id NOT IN (SELECT id FROM tasks)")
+        self._conn, self._pid = conn, os.getpid()
+        return conn
+
+    @staticmethod
+    def _row_args(task_id: str, state: Dict[str, Any]) -> tuple:
+        return (state.get("session_id"), state.get("kind"), state.get("status") or "pending",
+                state.get("started_at"), time.time(), json.dumps(state, default=str), task_id)
+
+    def put(self, task_id: str, fields: Dict[str, Any], owner: Optional[str] = None) -> None:
+        state = {k: v for k, v in fields.items() if k not in ITEM_FIELDS}
+        state["id"] = task_id
+        with self._lock:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute(
+                    "INSERT OR REPLACE INTO tasks (session_id, kind, status, started_at, updated_at, state, id, owner)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (*self._row_args(task_id, state), owner),
+                )
+                conn.execute("DELETE FROM task_items WHERE task_id = ?", (task_id,))
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+    def write(self, changes: Dict[str, Dict[str, Any]],
+              appends: Optional[Dict[str, Dict[str, tuple]]] = None) -> None:
+        if not changes and not appends:
+            return
+        with self._lock:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                for task_id, lists in (appends or {}).items():
+                    for name, (offset, values) in lists.items():
+                        conn.execute("DELETE FROM task_items WHERE task_id = ? AND field = ? AND seq >= ?",
+                                     (task_id, name, int(offset)))
+                        conn.executemany(
+                            "INSERT INTO task_items (task_id, field, seq, value) VALUES (?, ?, ?, ?)",
+                            [(task_id, name, int(offset) + i, json.dumps(v, default=str))
+                             for i, v in enumerate(values)],
+                        )
+                for task_id, fields in changes.items():
+                    row = conn.execute("SELECT state FROM tasks WHERE id = ?", (task_id,)).fetchone()
+                    state = json.loads(row[0]) if row else {"id": task_id}
+                    state.update(fields)
+                    conn.execute(
+                        "INSERT INTO tasks (session_id, kind, status, started_at, updated_at, state, id)"
+                        " VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT(id) DO UPDATE SET"
+                        " session_id=excluded.session_id, kind=excluded.kind, status=excluded.status,"
+                        " started_at=excluded.started_at, updated_at=excluded.updated_at, state=excluded.state",
+                        self._row_args(task_id, state),
+                    )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+    def get(self, task_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute("SELECT state FROM tasks WHERE id = ?", (task_id,)).fetchone()
+            if row is None:
+                return None
+            logs = conn.execute("SELECT value FROM task_items WHERE task_id = ? AND field = 'logs'"
+                                " ORDER BY seq DESC LIMIT ?", (task_id, LOG_TAIL)).fetchall()
+            frames = conn.execute("SELECT value FROM task_items WHERE task_id = ? AND field = 'frames'"
+                                  " ORDER BY seq", (task_id,)).fetchall()
+        state = json.loads(row[0])
+        state["logs"] = [json.loads(r[0]) for r in reversed(logs)]
+        state["frames"] = [json.loads(r[0]) for r in frames]
+        return state
+
+    def items(self, task_id: str, field: str, start: int = 0, limit: Optional[int] = None) -> List[Any]:
+        with self._lock:
+            rows = self._connect().execute(
+                "SELECT value FROM task_items WHERE task_id = ? AND field = ? AND seq >= ? ORDER BY seq LIMIT ?",
+                (task_id, field, int(start), -1 if limit is None else int(limit)),
+            ).fetchall()
+        return [json.loads(r[0]) for r in rows]
+
+    def item_count(self, task_id: str, field: str) -> int:
+        with self._lock:
+            row = self._connect().execute("SELECT MAX(seq) FROM task_items WHERE task_id = ? AND field = ?",
+                                          (task_id, field)).fetchone()
+        return 0 if row[0] is None else int(row[0]) + 1
+
+    def delete(self, task_id: str) -> None:
+        with self._lock:
+            conn = self._connect()
+            conn.execute("DELETE FROM tasks WHERE id = ?", (task_id,))
+            conn.execute("DELETE FROM task_items WHERE task_id = ?", (task_id,))
+
+    def list(self, session_id: Optional[str] = None, limit: int = 100) -> List[Dict[str, Any]]:
+        with self._lock:
+            conn = self._connect()
+            if session_id is None:
+                rows = conn.execute("SELECT state FROM tasks ORDER BY started_at DESC LIMIT ?", (int(limit),))
+            else:
+                rows = conn.execute("SELECT state FROM tasks WHERE session_id = ? ORDER BY started_at DESC LIMIT ?",
+                                    (session_id, int(limit)))
+            rows = rows.fetchall()
+        return [json.loads(r[0]) for r in rows]
+
+    def advance(self, task_id: str, field: str, stop: int, limit: int) -> Optional[int]:
+        with self._lock:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute("SELECT state FROM tasks WHERE id = ?", (task_id,)).fetchone()
+                if row is None:
+                    conn.execute("COMMIT")
+                    return None
+                state = json.loads(row[0])
+                start = int(state.get(field) or 0)
+                state[field] = max(start, min(start + int(limit), int(stop)))
+                conn.execute("UPDATE tasks SET state = ?, updated_at = ? WHERE id = ?",
+                             (json.dumps(state, default=str), time.time(), task_id))
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return start
+
+    def fail_orphans(self, alive: Optional[Callable[[Optional[str]], bool]] = None) -> int:
+        with self._lock:
+            conn = self._connect()
+            rows = conn.execute("SELECT id, owner FROM tasks WHERE status IN ('pending', 'running')").fetchall()
+            latest = dict(conn.execute("SELECT process, owner FROM owners").fetchall())
+        if alive is None:
+            def alive(owner: Optional[str]) -> bool:
+                host, _, rest = (owner or "").partition(":")
+                current = latest.get(f"{host}:{rest.partition(':')[0]}")
+                return owner_alive(owner) and current in (None, owner)
+        changes: Dict[str, Dict[str, Any]] = {}
+        for task_id, owner in rows:
+            if not alive(owner):
+                changes[task_id] = {"status": "error", "error": "interrupted: the worker process exited",
+                                    "finished_at": time.time()}
+        self.write(changes)
+        return len(changes)
@@ -1,16 +1,119 @@
 from __future__ import annotations
 
+import heapq
+import math
 import threading
 import time
 import uuid
+from collections import deque
 from concurrent.futures import ThreadPoolExecutor, Future
-from dataclasses import dataclass, field
-from typing import Any, Callable, Dict, Optional
+from dataclasses import dataclass, field, fields
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from app.utils.task_store import (ITEM_FIELDS, TERMINAL, MemoryTaskStore, SqliteTaskStore, TaskStore,
+                                  owner_id)
+
+# Stages a job can be submitted as; each has its own queue and concurrency limit and runs on the
+# "thread" or "process" backend. Jobs submitted without a stage go to "default"
+STAGES = ("predict", "analysis", "render", "plot", "data", "normalize")
+BACKENDS = ("thread", "process")
+
+
+class TaskRejected(Exception):
+    """A stage queue (or a tenant's share of it) is full; retry after `retry_after_s` seconds."""
+
+    def __init__(self, stage: str, reason: str, retry_after_s: float, expected_wait_s: Optional[float]) -> None:
+        super().__init__(f"stage {stage!r} is saturated: {reason}")
+        self.stage = stage
+        self.reason = reason
+        self.retry_after_s = retry_after_s
+        self.expected_wait_s = expected_wait_s
+
+
+class TaskCancelled(Exception):
+    """Raised inside a job by its CancelToken once the task has been cancelled."""
+
+
+class CancelToken:
+    """Cooperative cancellation flag of one task.
+
+    Jobs call the token (`cancel()`) between frames, batches or chunks; once
+    the task is cancelled the call raises TaskCancelled, which unwinds the job
+    and frees its stage slot. cancel() sets an in-process event and, with
+    `flag_dir`, drops a flag file there that tokens in pool processes and in
+    other API workers see (checked at most every `poll_s` seconds). Tokens
+    pickle, so process-backed jobs get one too.
+    """
+
+    def __init__(self, task_id: str, flag_dir: Optional[Path] = None, poll_s: float = 0.25) -> None:
+        self.task_id = task_id
+        self.flag_dir = None if flag_dir is None else Path(flag_dir)
+        self.poll_s = float(poll_s)
+        self._event = threading.Event()
+        self._next_poll = 0.0
+
+    def _flag(self) -> Optional[Path]:
+        return None if self.flag_dir is None else self.flag_dir / self.task_id
+
+    @property
+    def cancelled(self) -> bool:
+        if not self._event.is_set() and self.flag_dir is not None:
+            now = time.monotonic()
+            if now >= self._next_poll:
+                self._next_poll = now + self.poll_s
+                if self._flag().exists():
+                    self._event.set()
+        return self._event.is_set()
+
+    def cancel(self) -> None:
+        self._event.set()
+        flag = self._flag()
+        if flag is not None:
+            try:
+                flag.parent.mkdir(parents=True, exist_ok=True)
+                flag.touch()
+            except OSError as e:
+                print("[tasks] could not write cancel flag:", e)
+
+    def clear(self) -> None:
+        """Remove the flag file once the task has finished."""
+        flag = self._flag()
+        if flag is not None:
+            flag.unlink(missing_ok=True)
+
+    def __call__(self) -> None:
+        if self.cancelled:
+            raise TaskCancelled(f"task {self.task_id} canceled")
+
+    def __getstate__(self) -> dict:
+        return {"task_id": self.task_id, "flag_dir": self.flag_dir, "poll_s": self.poll_s,
+                "cancelled": self._event.is_set()}
+
+    def __setstate__(self, state: dict) -> None:
+        self.__init__(state["task_id"], state["flag_dir"], state["poll_s"])
+        if state["cancelled"]:
+            self._event.set()
+
+
+def default_stage_workers(num_cores: int) -> Dict[str, int]:
+    """Concurrent jobs per stage on a host with `num_cores` cores (one core is left to the event loop)."""
+    cores = max(1, int(num_cores) - 1)
+    return {
+        "predict": max(1, cores // 4),  # a py-feat detection keeps several cores busy by itself
+        "analysis": max(1, cores // 4),
+        "render": max(1, cores // 2),
+        "plot": 2,
+        "data": 4,
+        "normalize": 1,
+    }
 
 
 @dataclass
 class TaskState:
     id: str
+    session_id: Optional[str] = None
+    kind: Optional[str] = None  # predict|analysis|emotions|frames|normalize
     status: str = "pending"  # pending|running|done|error|canceled
     progress: float = 0.0      # 0..100
     message: str = ""
@@ -32,66 +135,673 @@ class TaskState:
     mode: Optional[str] = None  # for frames: 'image' | 'data'
     data_next_index: int = 0    # for frames data mode
     data_items: list[dict[str, Any]] = field(default_factory=list)  # buffered AU data items
+    # Streaming prediction: rows flushed to the sidecar CSV (workspace/<stream_name>) so far
+    rows_available: int = 0
+    stream_name: Optional[str] = None
+    # Prediction pipeline metrics: per-stage busy/idle seconds, queue depths and the bottleneck stage
+    pipeline: Optional[dict[str, Any]] = None
+    # Frame sampling actually used (fixed skip_frames, or the adaptive step under a deadline)
+    sampling: Optional[dict[str, Any]] = None
+    # Stage the job was queued on and how long it waited there for a free slot
+    stage: Optional[str] = None
+    queue_wait_s: Optional[float] = None
+
+
+_FIELDS = tuple(f.name for f in fields(TaskState))
+
+
+def _state_fields(st: TaskState, names=_FIELDS) -> Dict[str, Any]:
+    """Store document of `st`: the scalar fields (ITEM_FIELDS lists are appended separately)."""
+    return {name: getattr(st, name) for name in names if name not in ITEM_FIELDS}
+
+
+def _state_from(doc: Dict[str, Any]) -> TaskState:
+    return TaskState(**{k: v for k, v in doc.items() if k in _FIELDS})
+
+
+@dataclass
+class _Job:
+    task_id: str
+    fn: Callable[..., dict[str, Any]]
+    args: tuple
+    kwargs: dict
+    tenant: str = ""
+    vstart: float = 0.0  # virtual start/finish times: dispatch order under weighted fair queuing
+    vfinish: float = 0.0
+    submitted: float = field(default_factory=time.monotonic)
+
+    def __lt__(self, other: "_Job") -> bool:
+        return (self.vfinish, self.submitted) < (other.vfinish, other.submitted)
+
+
+def _summary(values) -> Dict[str, Any]:
+    values = list(values)
+    if not values:
+        return {"mean": None, "max": None}
+    return {"mean": round(sum(values) / len(values), 3), "max": round(max(values), 3)}
+
+
+class _Stage:
+    """Queue, concurrency limit and recent timings of one stage.
+
+    Jobs wait in `pending` until fewer than `limit` of the stage's jobs run;
+    only then are they handed to the executor, so a stage never holds more
+    than `limit` workers and its queue is visible (and cancellable) here.
+
+    `pending` is a heap ordered by weighted fair queuing over tenants
+    (sessions): each job of a tenant with weight w advances that tenant's
+    virtual finish time by 1/w, and the job with the smallest finish time
+    starts next. A tenant that queues many jobs therefore takes turns with
+    the others instead of going first with all of them. At most `queue_max`
+    jobs wait, and a single tenant at most `tenant_max` of them.
+    """
+
+    def __init__(self, name: str, backend: str, limit: int, history: int = 50,
+                 queue_max: Optional[int] = None, tenant_share: float = 0.5) -> None:
+        self.name = name
+        self.backend = backend
+        self.limit = max(1, int(limit))
+        self.queue_max = max(1, int(queue_max if queue_max is not None else 4 * self.limit))
+        self.tenant_max = max(1, int(math.ceil(self.queue_max * min(1.0, max(0.0, float(tenant_share))))))
+        self.pending: list[_Job] = []
+        self.queued_by: dict[str, int] = {}
+        self.vtime = 0.0  # virtual time: start time of the last job started
+        self.vfinish: dict[str, float] = {}  # tenant -> virtual finish time of its last queued job
+        self.running = 0
+        self.submitted = 0
+        self.completed = 0
+        self.waits: deque[float] = deque(maxlen=history)
+        self.durations: deque[float] = deque(maxlen=history)
+        self.executor = (ThreadPoolExecutor(max_workers=self.limit, thread_name_prefix=f"task-{name}")
+                         if backend == "thread" else None)
+
+    def push(self, job: _Job, weight: float) -> None:
+        job.vstart = max(self.vtime, self.vfinish.get(job.tenant, 0.0))
+        job.vfinish = job.vstart + 1.0 / max(1e-6, float(weight))
+        self.vfinish[job.tenant] = job.vfinish
+        heapq.heappush(self.pending, job)
+        self.queued_by[job.tenant] = self.queued_by.get(job.tenant, 0) + 1
+
+    def pop(self) -> _Job:
+        job = heapq.heappop(self.pending)
+        self._unqueue(job)
+        self.vtime = max(self.vtime, job.vstart)
+        if len(self.vfinish) > 256:  # forget tenants that are caught up with the virtual clock
+            self.vfinish = {t: f for t, f in self.vfinish.items() if f > self.vtime}
+        return job
+
+    def remove(self, task_id: str) -> bool:
+        for i, job in enumerate(self.pending):
+            if job.task_id == task_id:
+                self.pending.pop(i)
+                heapq.heapify(self.pending)
+                self._unqueue(job)
+                return True
+        return False
+
+    def _unqueue(self, job: _Job) -> None:
+        n = self.queued_by.get(job.tenant, 0) - 1
+        if n > 0:
+            self.queued_by[job.tenant] = n
+        else:
+            self.queued_by.pop(job.tenant, None)
+
+    def mean_run_s(self) -> Optional[float]:
+        return sum(self.durations) / len(self.durations) if self.durations else None
+
+    def expected_wait(self, tenant: str, weight: float) -> Optional[float]:
+        """Expected queue wait of a job `tenant` would submit now (None without run-time history).
+
+        Jobs ahead are the queued ones with an earlier virtual finish time;
+        they start at `limit` per mean run time, after half a run of the
+        jobs running now.
+        """
+        if self.running < self.limit and not self.pending:
+            return 0.0
+        run_s = self.mean_run_s()
+        if run_s is None:
+            return None
+        vfinish = max(self.vtime, self.vfinish.get(tenant, 0.0)) + 1.0 / max(1e-6, float(weight))
+        ahead = sum(1 for job in self.pending if job.vfinish <= vfinish)
+        return 0.5 * run_s + ahead * run_s / self.limit
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        return {
+            "backend": self.backend,
+            "limit": self.limit,
+            "running": self.running,
+            "queued": len(self.pending),
+            "queue_max": self.queue_max,
+            "tenant_max": self.tenant_max,
+            "tenants_queued": len(self.queued_by),
+            "oldest_wait_s": round(now - min(j.submitted for j in self.pending), 3) if self.pending else 0.0,
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "wait_s": _summary(self.waits),
+            "run_s": _summary(self.durations),
+        }
 
 
 class TaskManager:
-    def __init__(self, max_workers: int = 2) -> None:
-        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="analyze")
+    """Background jobs and their TaskState.
+
+    Every stage has its own queue and concurrency limit (`stage_workers`,
+    `max_workers` for jobs without a stage), so long detections do not hold
+    up a short plot. Jobs run on a per-stage thread pool by default. Stages
+    routed to the "process" backend (`stage_backends`, e.g.
+    {"render": "process"}) run in a spawned process pool shared by those
+    stages instead, so GIL-bound work (matplotlib rendering, pandas
+    parsing) neither slows other jobs nor the event loop. In a pool process
+    the module-level `manager` relays update()/log() calls to the parent over
+    a queue, where a listener thread applies them; get() there only sees the
+    job's own fields, so stages that read other tasks' state must stay on
+    threads.
+
+    Task state is also kept in a TaskStore (`store`). Tasks run by this
+    process are served from memory; get() falls back to the store for tasks
+    of other API worker processes or of a previous run. Status changes are
+    written through at once, other updates and log lines are collected and
+    written in one batch every `flush_s` seconds, so per-frame progress does
+    not turn into a write per frame.
+    """
+
+    def __init__(self, max_workers: int = 2, process_workers: int = 2,
+                 stage_backends: Optional[Dict[str, str]] = None, store: Optional[TaskStore] = None,
+                 flush_s: float = 0.5, stage_workers: Optional[Dict[str, int]] = None,
+                 stage_queue: Optional[Dict[str, int]] = None, tenant_share: float = 0.5,
+                 tenant_weights: Optional[Dict[str, float]] = None, retry_after_s: float = 10.0,
+                 cancel_dir: Optional[Path] = None) -> None:
         self._tasks: dict[str, TaskState] = {}
         self._futures: dict[str, Future] = {}
         self._lock = threading.Lock()
+        self.process_workers = max(1, int(process_workers))
+        self.stage_backends = dict(stage_backends or {})
+        for stage, backend in self.stage_backends.items():
+            if backend not in BACKENDS:
+                raise ValueError(f"backend for stage {stage!r} must be one of {BACKENDS}, got {backend!r}")
+        workers = dict(stage_workers or {})
+        queues = dict(stage_queue or {})
+        for stage in list(self.stage_backends) + list(workers) + list(queues):
+            if stage not in STAGES:
+                raise ValueError(f"unknown stage {stage!r}, expected one of {STAGES}")
+        self._stages: dict[str, _Stage] = {
+            name: _Stage(name, self.backend(name), workers.get(name, max_workers),
+                         queue_max=queues.get(name), tenant_share=tenant_share)
+            for name in STAGES + ("default",)  # default: jobs without a stage, limited by max_workers
+        }
+        self.tenant_weights = {str(k): float(v) for k, v in (tenant_weights or {}).items()}
+        self.retry_after_s = float(retry_after_s)  # Retry-After while a stage has no run-time history
+        self.cancel_dir = cancel_dir  # cancel flag files shared with pool processes and other workers
+        self._tokens: dict[str, CancelToken] = {}
+        self._process_pool = None
+        self._queue = None
+        self._relay = None  # set in pool processes: queue of updates for the parent
+        self._in_process: dict[str, tuple] = {}  # task id -> (stage, started) of jobs running in the pool
+        self.store = store if store is not None else MemoryTaskStore()
+        self.flush_s = max(0.0, float(flush_s))
+        self._dirty: dict[str, set] = {}  # task id -> fields changed since the last flush
+        self._written: dict[str, dict[str, int]] = {}  # task id -> ITEM_FIELDS items already in the store
+        self._logs_dropped: dict[str, int] = {}  # task id -> old log lines trimmed from memory
+        self._flusher: Optional[threading.Thread] = None
+        self._flush_lock = threading.Lock()  # keeps batches in order: an older value never lands last
 
-    def create(self) -> TaskState:
+    def backend(self, stage: Optional[str]) -> str:
+        return self.stage_backends.get(stage or "", "thread")
+
+    def stage_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Per-stage limit, running/queued jobs and recent queue wait and run times (this process only)."""
+        with self._lock:
+            return {name: stg.stats() for name, stg in self._stages.items()}
+
+    def create(self, session_id: Optional[str] = None, kind: Optional[str] = None) -> TaskState:
         tid = str(uuid.uuid4())
-        st = TaskState(id=tid)
+        st = TaskState(id=tid, session_id=session_id, kind=kind)
         with self._lock:
             self._tasks[tid] = st
+        self.store.put(tid, _state_fields(st), owner=owner_id())
         return st
 
-    def get(self, task_id: str) -> Optional[TaskState]:
+    def _local(self, task_id: str) -> Optional[TaskState]:
         with self._lock:
             return self._tasks.get(task_id)
 
+    def get(self, task_id: str) -> Optional[TaskState]:
+        """Live state of a task of this process, else a snapshot from the store (None if unknown)."""
+        st = self._local(task_id)
+        if st is not None or self._relay is not None:
+            return st
+        doc = self.store.get(task_id)
+        return _state_from(doc) if doc is not None else None
+
+    def list(self, session_id: Optional[str] = None, limit: int = 100) -> List[TaskState]:
+        """Tasks of a session (all sessions if None), newest first, as last flushed to the store (without lists)."""
+        return [_state_from(doc) for doc in self.store.list(session_id, limit)]
+
+    def items(self, task_id: str, field_name: str, start: int = 0, limit: Optional[int] = None) -> List[Any]:
+        """Slice of a list field (e.g. data_items), from memory for tasks of this process, else from the store."""
+        with self._lock:
+            st = self._tasks.get(task_id)
+            if st is not None:
+                rows = getattr(st, field_name)
+                return list(rows[start:] if limit is None else rows[start:start + int(limit)])
+        return self.store.items(task_id, field_name, start, limit)
+
+    def item_count(self, task_id: str, field_name: str) -> int:
+        with self._lock:
+            st = self._tasks.get(task_id)
+            if st is not None:
+                return len(getattr(st, field_name))
+        return self.store.item_count(task_id, field_name)
+
+    def advance(self, task_id: str, field_name: str, stop: int, limit: int) -> int:
+        """Atomically move a read cursor (e.g. data_next_index) by up to `limit`, not past `stop`.
+
+        Returns the cursor before the move. The cursor lives in the store, so
+        polls that land on different worker processes continue each other.
+        """
+        self.flush(task_id)
+        start = self.store.advance(task_id, field_name, stop, limit)
+        if start is None:
+            return 0
+        with self._lock:
+            st = self._tasks.get(task_id)
+            if st is not None:
+                setattr(st, field_name, max(start, min(start + int(limit), int(stop))))
+        return start
+
     def log(self, task_id: str, msg: str) -> None:
-        st = self.get(task_id)
+        st = self._local(task_id)
         if not st:
             return
         msg_s = f"[{time.strftime('%H:%M:%S')}] {msg}"
         with self._lock:
             st.logs.append(msg_s)
             if len(st.logs) > 500:
+                self._logs_dropped[task_id] = self._logs_dropped.get(task_id, 0) + len(st.logs) - 500
+                st.logs = st.logs[-500:]
+        if self._relay is not None:
+            self._relay.put(("log", task_id, msg_s))
+            return
+        self._mark(task_id, ("logs",))
+
+    def _append_log(self, task_id: str, msg_s: str) -> None:
+        st = self._local(task_id)
+        if not st:
+            return
+        with self._lock:
+            st.logs.append(msg_s)
+            if len(st.logs) > 500:
+                self._logs_dropped[task_id] = self._logs_dropped.get(task_id, 0) + len(st.logs) - 500
                 st.logs = st.logs[-500:]
+        self._mark(task_id, ("logs",))
+
+    def append(self, task_id: str, field_name: str, *items: Any) -> None:
+        """Append to a list field (frames, data_items); pool processes relay only the new items."""
+        st = self._local(task_id)
+        if not st:
+            return
+        with self._lock:
+            getattr(st, field_name).extend(items)
+        if self._relay is not None:
+            self._relay.put(("append", task_id, (field_name, list(items))))
+            return
+        self._mark(task_id, (field_name,))
 
     def update(self, task_id: str, **kwargs: Any) -> None:
-        st = self.get(task_id)
+        st = self._local(task_id)
         if not st:
             return
         with self._lock:
             for k, v in kwargs.items():
                 setattr(st, k, v)
+        if self._relay is not None:
+            self._relay.put(("update", task_id, kwargs))
+            return
+        self._mark(task_id, kwargs.keys())
+        if "status" in kwargs:
+            self.flush(task_id)  # pollers on other workers see state changes without the flush delay
 
-    def run(self, task_id: str, fn: Callable[..., dict[str, Any]], *args: Any, **kwargs: Any) -> None:
-        st = self.get(task_id)
+    # ----- Store writes -----
+
+    def _mark(self, task_id: str, names) -> None:
+        with self._lock:
+            self._dirty.setdefault(task_id, set()).update(names)
+            if self._flusher is None:
+                import atexit
+
+                self._flusher = threading.Thread(target=self._flush_loop, name="tasks-flush", daemon=True)
+                self._flusher.start()
+                atexit.register(self.flush)
+
+    def _flush_loop(self) -> None:
+        while True:
+            time.sleep(self.flush_s)
+            self.flush()
+
+    def flush(self, task_id: Optional[str] = None) -> None:
+        """Write changed fields of one task (or of all tasks) to the store in one batch."""
+        with self._flush_lock:
+            with self._lock:
+                if task_id is None:
+                    dirty, self._dirty = self._dirty, {}
+                else:
+                    names = self._dirty.pop(task_id, None)
+                    dirty = {task_id: names} if names else {}
+                changes = {tid: _state_fields(self._tasks[tid], names) for tid, names in dirty.items()
+                           if tid in self._tasks}
+                appends = {}
+                for tid, names in dirty.items():
+                    if tid in self._tasks:
+                        new = self._new_items(tid, names)
+                        if new:
+                            appends[tid] = new
+            changes = {tid: fields for tid, fields in changes.items() if fields}
+            if not changes and not appends:
+                return
+            try:
+                self.store.write(changes, appends)
+                with self._lock:
+                    for tid, lists in appends.items():
+                        written = self._written.setdefault(tid, {})
+                        for name, (offset, values) in lists.items():
+                            written[name] = offset + len(values)
+            except Exception as e:
+                print("[tasks] store write failed:", e)
+                with self._lock:
+                    for tid, names in dirty.items():
+                        self._dirty.setdefault(tid, set()).update(names)
+
+    def _new_items(self, task_id: str, names) -> Dict[str, tuple]:
+        """{field: (offset, items)} of list fields that grew since the last flush (called with self._lock held)."""
+        st = self._tasks[task_id]
+        out = {}
+        for name in ITEM_FIELDS:
+            if name not in names:
+                continue
+            rows = getattr(st, name)
+            base = self._logs_dropped.get(task_id, 0) if name == "logs" else 0
+            offset = max(base, self._written.get(task_id, {}).get(name, 0))
+            if base + len(rows) > offset:
+                out[name] = (offset, list(rows[offset - base:]))
+        return out
+
+    def run(self, task_id: str, fn: Callable[..., dict[str, Any]], *args: Any,
+            stage: Optional[str] = None, tenant: Optional[str] = None, **kwargs: Any) -> Optional[float]:
+        """Queue fn(*args, **kwargs) as the job of `task_id` on `stage` (its backend and concurrency limit).
+
+        `tenant` (default: the task's session) is the unit of fair queuing and
+        of the per-tenant queue bound. Returns the expected queue wait in
+        seconds (None while the stage has no run-time history); raises
+        TaskRejected, leaving the task unqueued, when the stage queue or the
+        tenant's share of it is full. Process-backed jobs need a picklable
+        module-level `fn` and arguments.
+        """
+        st = self._local(task_id)
         if not st:
-            return
-        def _wrap() -> None:
+            return None
+        if stage is not None and stage not in STAGES:
+            raise ValueError(f"unknown stage {stage!r}, expected one of {STAGES}")
+        stg = self._stages[stage or "default"]
+        tenant = str(tenant if tenant is not None else (st.session_id or ""))
+        weight = self.tenant_weights.get(tenant, 1.0)
+        with self._lock:
+            if stg.running >= stg.limit:
+                reason = None
+                if len(stg.pending) >= stg.queue_max:
+                    reason = f"{len(stg.pending)} jobs queued (max {stg.queue_max})"
+                elif stg.queued_by.get(tenant, 0) >= stg.tenant_max:
+                    reason = f"{stg.queued_by[tenant]} jobs of this session queued (max {stg.tenant_max})"
+                if reason is not None:
+                    run_s = stg.mean_run_s()
+                    retry = run_s / stg.limit if run_s is not None else self.retry_after_s
+                    raise TaskRejected(stg.name, reason, max(1.0, math.ceil(retry)),
+                                       stg.expected_wait(tenant, weight))
+            expected = stg.expected_wait(tenant, weight)
+            stg.push(_Job(task_id, fn, args, kwargs, tenant=tenant), weight)
+            stg.submitted += 1
+            self._tokens.setdefault(task_id, CancelToken(task_id, self.cancel_dir))
+        self.update(task_id, stage=stg.name)
+        self._dispatch(stg)
+        return expected
+
+    def token(self, task_id: str) -> CancelToken:
+        """Cancel token of a task, to pass into its job as `cancel`."""
+        with self._lock:
+            return self._tokens.setdefault(task_id, CancelToken(task_id, self.cancel_dir))
+
+    def _forget_token(self, task_id: str) -> None:
+        with self._lock:
+            token = self._tokens.pop(task_id, None)
+        if token is not None:
+            token.clear()
+
+    def discard(self, task_id: str) -> None:
+        """Forget a task that was never queued (e.g. rejected by admission control)."""
+        with self._lock:
+            self._tasks.pop(task_id, None)
+            self._dirty.pop(task_id, None)
+            self._written.pop(task_id, None)
+            self._logs_dropped.pop(task_id, None)
+        self.store.delete(task_id)
+
+    def _dispatch(self, stg: _Stage) -> None:
+        """Start queued jobs of `stg` while it has free slots."""
+        while True:
+            with self._lock:
+                if stg.running >= stg.limit or not stg.pending:
+                    return
+                job = stg.pop()
+                stg.running += 1
+                wait = time.monotonic() - job.submitted
+                stg.waits.append(wait)
+            self.update(job.task_id, queue_wait_s=round(wait, 3))
+            started = time.monotonic()
+            try:
+                if stg.backend == "process":
+                    self._run_in_process(stg, job, started)
+                else:
+                    fut = stg.executor.submit(self._run_job, stg, job, started)
+                    with self._lock:
+                        self._futures[job.task_id] = fut
+                    fut.add_done_callback(lambda f, s=stg, tid=job.task_id: self._thread_job_done(s, tid, f))
+            except Exception as e:  # e.g. executor shut down at exit
+                self.update(job.task_id, status="error", error=str(e), finished_at=time.time())
+                self._release(stg, started)
+
+    def _release(self, stg: _Stage, started: float) -> None:
+        with self._lock:
+            stg.running -= 1
+            stg.completed += 1
+            stg.durations.append(time.monotonic() - started)
+        self._dispatch(stg)
+
+    def _thread_job_done(self, stg: _Stage, task_id: str, fut: Future) -> None:
+        """Drop a thread job's future; one cancelled before it started never ran _run_job, so free its slot here."""
+        with self._lock:
+            if self._futures.get(task_id) is fut:
+                del self._futures[task_id]
+            if not fut.cancelled():
+                return
+            stg.running -= 1  # not counted as completed: it never ran
+        self._forget_token(task_id)
+        self._dispatch(stg)
+
+    def _run_job(self, stg: _Stage, job: _Job, started: float) -> None:
+        task_id = job.task_id
+        token = self._tokens.get(task_id)
+        try:
+            if token is not None:
+                token()  # cancelled through another worker while it was queued here
             self.update(task_id, status="running")
+            result = job.fn(*job.args, **job.kwargs)
+            self.update(task_id, status="done", result=result, progress=100.0, finished_at=time.time())
+        except Exception as e:
+            if isinstance(e, TaskCancelled) or (token is not None and token.cancelled):
+                self.update(task_id, status="canceled", message="Canceled", finished_at=time.time())
+            else:
+                self.update(task_id, status="error", error=str(e), finished_at=time.time())
+        finally:
+            self._forget_token(task_id)
+            self._release(stg, started)
+
+    # ----- Process backend -----
+
+    def _ensure_process_pool(self):
+        with self._lock:
+            if self._process_pool is None:
+                import multiprocessing as mp
+                from concurrent.futures import ProcessPoolExecutor
+
+                ctx = mp.get_context("spawn")  # no fork of a threaded server process
+                self._queue = ctx.Queue()
+                self._process_pool = ProcessPoolExecutor(
+                    max_workers=self.process_workers, mp_context=ctx,
+                    initializer=_process_init, initargs=(self._queue,),
+                )
+                threading.Thread(target=self._listen, name="tasks-relay", daemon=True).start()
+            return self._process_pool
+
+    def _listen(self) -> None:
+        """Apply updates relayed by pool processes (in the order each process sent them)."""
+        while True:
             try:
-                result = fn(*args, **kwargs)
-                self.update(task_id, status="done", result=result, progress=100.0, finished_at=time.time())
+                kind, task_id, body = self._queue.get()
+            except (EOFError, OSError):
+                return
+            try:
+                if kind == "update":
+                    self.update(task_id, **body)
+                elif kind == "append":
+                    self.append(task_id, body[0], *body[1])
+                elif kind == "log":
+                    self._append_log(task_id, body)
+                elif kind == "finished":
+                    self._finish_in_process(task_id)
             except Exception as e:
-                self.update(task_id, status="error", error=str(e), finished_at=time.time())
-        fut = self._executor.submit(_wrap)
+                print("[tasks] relay update failed:", e)
+
+    def _run_in_process(self, stg: _Stage, job: _Job, started: float) -> None:
+        pool = self._ensure_process_pool()
+        task_id = job.task_id
+
+        def _done(fut: Future) -> None:
+            # Normal completion and job errors are relayed by the process itself, ending with
+            # "finished" once its final status is applied; that frees the slot. This only
+            # handles failures the process could not report (cancelled, broken pool, pickling)
+            with self._lock:
+                if self._futures.get(task_id) is fut:
+                    del self._futures[task_id]
+            exc = None if fut.cancelled() else fut.exception()
+            if exc is None and not fut.cancelled():
+                return
+            st = self._local(task_id)
+            if exc is not None and st is not None and st.status not in ("done", "error", "canceled"):
+                self.update(task_id, status="error", error=str(exc) or type(exc).__name__,
+                            finished_at=time.time())
+            self._finish_in_process(task_id)
+
+        with self._lock:
+            self._in_process[task_id] = (stg, started)
+        fut = pool.submit(_process_job, task_id, job.fn, job.args, job.kwargs, self._tokens.get(task_id))
         with self._lock:
             self._futures[task_id] = fut
+        fut.add_done_callback(_done)
+
+    def _finish_in_process(self, task_id: str) -> None:
+        """Free the slot of a pool job once (after its relayed final status, or on a pool failure)."""
+        with self._lock:
+            entry = self._in_process.pop(task_id, None)
+        if entry is None:
+            return
+        self._forget_token(task_id)
+        self._release(*entry)
 
     def cancel(self, task_id: str) -> bool:
-        fut = self._futures.get(task_id)
-        if fut and fut.cancel():
-            self.update(task_id, status="canceled", finished_at=time.time())
+        """Cancel a task: a queued job is dropped, a running one stops at its next token check.
+
+        Jobs check their token between frames, batches or chunks, so the stage
+        slot frees within one of those. Tasks of other API workers are reached
+        through the token's flag file. Returns False for unknown or finished tasks.
+        """
+        with self._lock:
+            queued = False
+            for stg in self._stages.values():
+                if stg.remove(task_id):
+                    queued = True
+                    break
+            fut = self._futures.get(task_id)
+            token = self._tokens.get(task_id)
+        if queued or (fut and fut.cancel()):
+            self.update(task_id, status="canceled", message="Canceled", finished_at=time.time())
+            if queued:
+                self._forget_token(task_id)
             return True
-        return False
+        st = self.get(task_id)
+        if st is None or st.status in TERMINAL:
+            return False
+        (token or CancelToken(task_id, self.cancel_dir)).cancel()
+        self.update(task_id, message="Cancelling")
+        return True
+
+
+def _process_init(queue) -> None:
+    """Pool process initializer: relay this process's TaskManager updates to the parent."""
+    manager._relay = queue
+    manager.store = MemoryTaskStore()  # state lives in the parent; never open its store here
+
+
+def _process_job(task_id: str, fn: Callable[..., dict[str, Any]], args: tuple, kwargs: dict,
+                 token: Optional[CancelToken] = None) -> None:
+    """Run a job in a pool process against a local shadow TaskState; state flows back via the relay."""
+    with manager._lock:
+        manager._tasks[task_id] = TaskState(id=task_id)
+    try:
+        if token is not None:
+            token()
+        manager.update(task_id, status="running")
+        result = fn(*args, **kwargs)
+        manager.update(task_id, status="done", result=result, progress=100.0, finished_at=time.time())
+    except Exception as e:
+        if isinstance(e, TaskCancelled) or (token is not None and token.cancelled):
+            manager.update(task_id, status="canceled", message="Canceled", finished_at=time.time())
+        else:
+            manager.update(task_id, status="error", error=str(e), finished_at=time.time())
+    finally:
+        with manager._lock:
+            manager._tasks.pop(task_id, None)
+        manager._relay.put(("finished", task_id, None))  # after the final status in the same queue
+
+
+def _manager_from_settings() -> "TaskManager":
+    from app.configs.settings import get_settings
+
+    settings = get_settings()
+    if settings.TASK_STORE == "sqlite":
+        store: TaskStore = SqliteTaskStore(settings.TASK_STORE_PATH,
+                                           max_age_s=float(settings.TASK_STORE_MAX_AGE_DAYS) * 86400.0)
+    elif settings.TASK_STORE == "memory":
+        store = MemoryTaskStore()
+    else:
+        raise ValueError(f"TASK_STORE must be 'memory' or 'sqlite', got {settings.TASK_STORE!r}")
+    workers = default_stage_workers(settings.num_cores)
+    workers.update(settings.TASK_STAGE_WORKERS)
+    queues = {stage: int(settings.TASK_QUEUE_FACTOR * n) for stage, n in workers.items()}
+    queues.update(settings.TASK_STAGE_QUEUE)
+    return TaskManager(
+        max_workers=2,
+        process_workers=int(settings.TASK_PROCESS_WORKERS),
+        stage_backends=dict(settings.TASK_STAGE_BACKENDS),
+        store=store,
+        flush_s=float(settings.TASK_STORE_FLUSH_S),
+        stage_workers=workers,
+        stage_queue=queues,
+        tenant_share=float(settings.TASK_TENANT_QUEUE_SHARE),
+        tenant_weights=dict(settings.TASK_TENANT_WEIGHTS),
+        retry_after_s=float(settings.TASK_RETRY_AFTER_S),
+        cancel_dir=Path(settings.CUSTOM_TMP_DIR) / "cancel",
+    )
 
 
 # A module-level singleton for convenience
-manager = TaskManager(max_workers=2)
+manager = _manager_from_settings()
@@ -0,0 +1,7 @@
+import sys
+from pathlib import Path
+
+# Tests import the server modules the way main.py does (app.*, predict_video_to_csv, hmm_decode, ...)
+SERVER_DIR = Path(__file__).resolve().parents[1]
+if str(SERVER_DIR) not in sys.path:
+    sys.path.insert(0, str(SERVER_DIR))
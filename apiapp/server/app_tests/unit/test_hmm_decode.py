@@ -0,0 +1,127 @@
+"""hmm_decode's blocked Viterbi / forward-backward against a naive per-row reference."""
+import numpy as np
+import pytest
+
+import hmm_decode as hd
+
+K, D, T = 3, 4, 37
+
+
+@pytest.fixture
+def model():
+    rng = np.random.default_rng(7)
+    startprob = rng.dirichlet(np.ones(K))
+    transmat = rng.dirichlet(np.ones(K) * 2.0, size=K) * 0.4 + np.eye(K) * 0.6
+    lambdas = rng.uniform(0.5, 6.0, size=(K, D))
+    states = rng.integers(0, K, size=T)
+    X = rng.poisson(lambdas[states]).astype(float)
+    return hd.PoissonHMMParams(startprob=startprob, transmat=transmat, lambdas=lambdas), X
+
+
+def _row_transitions(params, steps, n):
+    """Transition matrix into each row (row 0 unused), as decode quantizes them."""
+    stack, gid = hd.transition_stack(params.transmat, steps)
+    if stack is None:
+        return [params.transmat] * n
+    return [stack[g] for g in gid]
+
+
+def _naive_viterbi(params, X, steps=None):
+    logb = hd.log_emissions(params, X)
+    mats = _row_transitions(params, steps, len(X))
+    delta = np.log(params.startprob) + logb[0]
+    bps = []
+    for t in range(1, len(X)):
+        cand = delta[:, None] + np.log(mats[t])
+        bps.append(cand.argmax(axis=0))
+        delta = cand.max(axis=0) + logb[t]
+    path = [int(delta.argmax())]
+    for bp in reversed(bps):
+        path.append(int(bp[path[-1]]))
+    return np.array(path[::-1])
+
+
+def _naive_forward_backward(params, X, steps=None):
+    logb = hd.log_emissions(params, X)
+    mats = _row_transitions(params, steps, len(X))
+    n = len(X)
+    b = np.exp(logb - logb.max(axis=1, keepdims=True))
+    alphas, scales = np.empty((n, K)), np.empty(n)
+    alpha = params.startprob * b[0]
+    for t in range(n):
+        if t:
+            alpha = (alphas[t - 1] @ mats[t]) * b[t]
+        scales[t] = alpha.sum()
+        alphas[t] = alpha / scales[t]
+    beta = np.ones(K)
+    post = np.empty((n, K))
+    for t in range(n - 1, -1, -1):
+        p = alphas[t] * beta
+        post[t] = p / p.sum()
+        if t:
+            beta = mats[t] @ (b[t] * beta)
+            beta /= beta.sum()
+    logprob = float(np.log(scales).sum() + logb.max(axis=1).sum())
+    return post, logprob, alphas
+
+
+IRREGULAR = np.r_[1.0, np.tile([1.0, 3.0, 0.5, 2.25, 1.0, 7.0], 6)]
+
+
+@pytest.mark.parametrize("steps", [None, IRREGULAR], ids=["regular", "irregular"])
+@pytest.mark.parametrize("block_len", [1, 2, 5, 6, None, T])
+def test_decode_matches_naive(model, steps, block_len):
+    params, X = model
+    res = hd.decode(params, X, block_len=block_len, steps=steps)
+    post, logprob, _ = _naive_forward_backward(params, X, steps)
+    np.testing.assert_array_equal(res.states, _naive_viterbi(params, X, steps))
+    np.testing.assert_allclose(res.posteriors, post, rtol=0, atol=1e-10)
+    assert res.logprob == pytest.approx(logprob, rel=1e-12)
+
+
+def test_decode_without_posteriors(model):
+    params, X = model
+    res = hd.decode(params, X, posteriors=False, block_len=4)
+    assert res.posteriors is None and np.isnan(res.logprob)
+    np.testing.assert_array_equal(res.states, _naive_viterbi(params, X))
+
+
+def test_decode_rejects_bad_input(model):
+    params, X = model
+    with pytest.raises(ValueError):
+        hd.decode(params, X[:0])
+    with pytest.raises(ValueError):
+        hd.decode(params, X, steps=np.ones(T - 1))
+
+
+def test_transition_power_is_stochastic(model):
+    params, _ = model
+    for step in (0.5, 1.0, 2.25, 7.0):
+        A = hd.transition_power(params.transmat, step)
+        np.testing.assert_allclose(A.sum(axis=1), 1.0)
+    np.testing.assert_allclose(hd.transition_power(params.transmat, 2.0), params.transmat @ params.transmat)
+
+
+@pytest.mark.parametrize("steps", [None, IRREGULAR], ids=["regular", "irregular"])
+def test_online_filtered_posteriors(model, steps):
+    params, X = model
+    _, _, alphas = _naive_forward_backward(params, X, steps)
+    dec = hd.OnlineDecoder(params, lag=T)
+    for t, x in enumerate(X):
+        out = dec.push(x, 1.0 if steps is None else steps[t])
+        assert out.index == t and not out.smoothed
+        np.testing.assert_allclose(out.posteriors, alphas[t], rtol=0, atol=1e-10)
+    path = dec.flush()
+    assert [i for i, _ in path] == list(range(T))
+    np.testing.assert_array_equal([s for _, s in path], _naive_viterbi(params, X, steps))
+
+
+def test_online_lag_emits_every_row_once(model):
+    params, X = model
+    dec = hd.OnlineDecoder(params, lag=3)
+    rows = []
+    for t, x in enumerate(X):
+        rows += [i for i, _ in dec.push(x).smoothed]
+        assert dec.pending == min(t + 1, 3)
+    rows += [i for i, _ in dec.flush()]
+    assert rows == list(range(T))
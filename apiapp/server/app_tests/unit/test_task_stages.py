@@ -0,0 +1,135 @@
+"""Stage queues: admission control and weighted fair queuing across tenants."""
+import threading
+import time
+
+import pytest
+
+from app.utils.tasks import TaskManager, TaskRejected, _Job, _Stage
+
+
+def _drain(stage):
+    return [stage.pop().task_id for _ in range(len(stage.pending))]
+
+
+def test_wfq_takes_turns_across_tenants():
+    stage = _Stage("predict", "thread", 1)
+    for task_id, tenant in [("a1", "a"), ("a2", "a"), ("a3", "a"), ("b1", "b"), ("c1", "c"), ("b2", "b")]:
+        stage.push(_Job(task_id, print, (), {}, tenant=tenant), 1.0)
+    assert _drain(stage) == ["a1", "b1", "c1", "a2", "b2", "a3"]
+    assert stage.queued_by == {}
+
+
+def test_wfq_weights():
+    stage = _Stage("predict", "thread", 1)
+    for i in range(4):
+        stage.push(_Job(f"vip{i}", print, (), {}, tenant="vip"), 2.0)
+    for i in range(2):
+        stage.push(_Job(f"std{i}", print, (), {}, tenant="std"), 1.0)
+    # vip finishes at 0.5, 1.0, 1.5, 2.0; std at 1.0, 2.0 (ties go to the earlier submission)
+    assert _drain(stage) == ["vip0", "vip1", "std0", "vip2", "vip3", "std1"]
+
+
+def test_late_tenant_does_not_jump_ahead_of_the_virtual_clock():
+    stage = _Stage("predict", "thread", 1)
+    for i in range(3):
+        stage.push(_Job(f"a{i}", print, (), {}, tenant="a"), 1.0)
+    assert stage.pop().task_id == "a0"
+    assert stage.pop().task_id == "a1"
+    # b arrives now: it starts at the current virtual time, not at 0 with credit for the past
+    stage.push(_Job("b0", print, (), {}, tenant="b"), 1.0)
+    assert _drain(stage) == ["b0", "a2"]
+
+
+def test_remove_keeps_counts():
+    stage = _Stage("predict", "thread", 1)
+    stage.push(_Job("a1", print, (), {}, tenant="a"), 1.0)
+    stage.push(_Job("a2", print, (), {}, tenant="a"), 1.0)
+    assert stage.remove("a1") and not stage.remove("a1")
+    assert stage.queued_by == {"a": 1} and _drain(stage) == ["a2"]
+
+
+def test_tenant_max_from_share():
+    assert _Stage("s", "thread", 1, queue_max=3, tenant_share=0.5).tenant_max == 2
+    assert _Stage("s", "thread", 1, queue_max=4, tenant_share=0.0).tenant_max == 1
+    assert _Stage("s", "thread", 1, queue_max=4, tenant_share=1.0).tenant_max == 4
+
+
+@pytest.fixture
+def busy_manager():
+    """Manager whose single predict slot is held until the test releases `gate`."""
+    m = TaskManager(stage_workers={"predict": 1}, stage_queue={"predict": 3}, tenant_share=0.5,
+                    stage_backends={}, retry_after_s=7.0)
+    gate = threading.Event()
+    order = []
+
+    def job(name):
+        gate.wait(5)
+        order.append(name)
+        return {}
+
+    def submit(session, name):
+        st = m.create(session_id=session, kind="predict")
+        try:
+            m.run(st.id, job, name, stage="predict")
+        except TaskRejected:
+            m.discard(st.id)
+            raise
+        return st.id
+
+    submit("blocker", "blocker")
+    yield m, submit, gate, order
+    gate.set()
+
+
+def test_admission_rejects_at_tenant_max(busy_manager):
+    m, submit, gate, _ = busy_manager
+    submit("a", "a1")
+    submit("a", "a2")
+    with pytest.raises(TaskRejected) as e:
+        submit("a", "a3")
+    assert e.value.stage == "predict" and "of this session" in e.value.reason
+    assert e.value.retry_after_s == 7.0  # no run-time history yet
+    submit("b", "b1")  # other tenants still get in
+
+
+def test_admission_rejects_at_queue_max(busy_manager):
+    m, submit, gate, _ = busy_manager
+    submit("a", "a1")
+    submit("b", "b1")
+    submit("c", "c1")
+    with pytest.raises(TaskRejected) as e:
+        submit("d", "d1")
+    assert "3 jobs queued (max 3)" in e.value.reason
+    stats = m.stage_stats()["predict"]
+    assert stats["queued"] == 3 and stats["running"] == 1 and stats["tenants_queued"] == 3
+
+
+def test_jobs_run_in_wfq_order(busy_manager):
+    m, submit, gate, order = busy_manager
+    ids = [submit("a", "a1"), submit("a", "a2"), submit("b", "b1")]
+    gate.set()
+    deadline = time.monotonic() + 5
+    while any(m.get(i).status != "done" for i in ids) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert order == ["blocker", "a1", "b1", "a2"]
+
+
+def test_cancel_before_start_frees_the_slot():
+    m = TaskManager(stage_workers={"predict": 1}, stage_backends={})
+    stage = m._stages["predict"]
+    gate = threading.Event()
+    a = m.create(session_id="s")
+    m.run(a.id, lambda: gate.wait(5) and {}, stage="predict")
+    # let a second job reach the executor while its only thread is busy
+    stage.limit = 2
+    b = m.create(session_id="s")
+    m.run(b.id, lambda: {}, stage="predict")
+    stage.limit = 1
+    assert m.cancel(b.id) and m.get(b.id).status == "canceled"
+    gate.set()
+    c = m.create(session_id="s")
+    m.run(c.id, lambda: {}, stage="predict")
+    deadline = time.monotonic() + 5
+    while m.get(c.id).status != "done" and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert m.get(c.id).status == "done" and stage.running == 0 and b.id not in m._futures
@@ -0,0 +1,141 @@
+"""TaskStore implementations: item appends by offset, read cursors, orphaned tasks."""
+import socket
+import sqlite3
+import subprocess
+import threading
+
+import pytest
+
+from app.utils.task_store import LOG_TAIL, MemoryTaskStore, SqliteTaskStore, owner_id
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        return MemoryTaskStore()
+    return SqliteTaskStore(tmp_path / "tasks.sqlite3")
+
+
+def test_put_get_and_merge(store):
+    store.put("t1", {"id": "t1", "session_id": "s", "kind": "predict", "status": "pending", "started_at": 1.0,
+                     "logs": ["ignored"], "data_items": [1]})
+    store.write({"t1": {"status": "running", "progress": 10.0}})
+    st = store.get("t1")
+    assert (st["id"], st["session_id"], st["status"], st["progress"]) == ("t1", "s", "running", 10.0)
+    assert st["logs"] == [] and st["frames"] == [] and "data_items" not in st
+    assert store.get("nope") is None
+    assert [t["id"] for t in store.list("s")] == ["t1"] and store.list("other") == []
+
+
+def test_appends_by_offset(store):
+    store.put("t1", {"status": "running"})
+    store.write({}, {"t1": {"data_items": (0, [{"i": 0}, {"i": 1}]), "frames": (0, ["a.png"])}})
+    store.write({}, {"t1": {"data_items": (2, [{"i": 2}])}})
+    assert store.item_count("t1", "data_items") == 3
+    assert store.items("t1", "data_items") == [{"i": 0}, {"i": 1}, {"i": 2}]
+    assert store.items("t1", "data_items", 1, 1) == [{"i": 1}]
+    # a flush that repeats an offset (e.g. retried after an error) overwrites from there on
+    store.write({}, {"t1": {"data_items": (1, [{"i": "x"}])}})
+    assert store.items("t1", "data_items") == [{"i": 0}, {"i": "x"}]
+    assert store.get("t1")["frames"] == ["a.png"]
+    # put() starts the task over
+    store.put("t1", {"status": "pending"})
+    assert store.item_count("t1", "data_items") == 0
+
+
+def test_logs_tail(store):
+    store.put("t1", {"status": "running"})
+    store.write({}, {"t1": {"logs": (0, [f"line {i}" for i in range(LOG_TAIL + 20)])}})
+    logs = store.get("t1")["logs"]
+    assert len(logs) == LOG_TAIL and logs[0] == "line 20" and logs[-1] == f"line {LOG_TAIL + 19}"
+    assert store.item_count("t1", "logs") == LOG_TAIL + 20
+
+
+def test_delete(store):
+    store.put("t1", {"status": "done"})
+    store.write({}, {"t1": {"frames": (0, ["a.png"])}})
+    store.delete("t1")
+    assert store.get("t1") is None and store.item_count("t1", "frames") == 0
+
+
+def test_advance(store):
+    store.put("t1", {"status": "running"})
+    assert store.advance("t1", "cursor", 7, 5) == 0
+    assert store.advance("t1", "cursor", 7, 5) == 5
+    assert store.advance("t1", "cursor", 7, 5) == 7
+    assert store.get("t1")["cursor"] == 7
+    assert store.advance("nope", "cursor", 7, 5) is None
+
+
+def test_advance_hands_out_disjoint_slices(tmp_path):
+    path = tmp_path / "tasks.sqlite3"
+    stores = [SqliteTaskStore(path) for _ in range(4)]
+    stores[0].put("t1", {"status": "running"})
+    got, lock = [], threading.Lock()
+
+    def poll(s):
+        while True:
+            start = s.advance("t1", "cursor", 1000, 7)
+            if start >= 1000:
+                return
+            with lock:
+                got.append((start, min(start + 7, 1000)))
+
+    threads = [threading.Thread(target=poll, args=(s,)) for s in stores * 2]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    covered = sorted(got)
+    assert covered[0][0] == 0 and covered[-1][1] == 1000
+    assert all(a[1] == b[0] for a, b in zip(covered, covered[1:]))
+
+
+def test_sqlite_shared_between_stores(tmp_path):
+    a, b = SqliteTaskStore(tmp_path / "t.sqlite3"), SqliteTaskStore(tmp_path / "t.sqlite3")
+    a.put("t1", {"status": "running"}, owner=owner_id())
+    a.write({"t1": {"progress": 50.0}}, {"t1": {"data_items": (0, [1, 2])}})
+    assert b.get("t1")["progress"] == 50.0 and b.items("t1", "data_items") == [1, 2]
+
+
+def _dead_pid() -> int:
+    p = subprocess.Popen(["true"])
+    p.wait()
+    return p.pid
+
+
+def test_fail_orphans(tmp_path):
+    path = tmp_path / "t.sqlite3"
+    store = SqliteTaskStore(path)
+    host = socket.gethostname()
+    me = owner_id()
+    store.put("mine", {"status": "running"}, owner=me)
+    store.put("dead", {"status": "running"}, owner=f"{host}:{_dead_pid()}:abc")
+    store.put("legacy", {"status": "pending"}, owner=f"{host}:{_dead_pid()}")
+    store.put("remote", {"status": "running"}, owner="elsewhere:1:abc")
+    store.put("finished", {"status": "done"}, owner=f"{host}:{_dead_pid()}:abc")
+    # our host:pid, but an earlier process: the owners registry names the current one
+    pid = me.split(":")[1]
+    store.put("reused", {"status": "running"}, owner=f"{host}:{pid}:oldboot")
+
+    assert store.fail_orphans() == 3
+    status = {t["id"]: t["status"] for t in store.list()}
+    assert status == {"mine": "running", "dead": "error", "legacy": "error", "remote": "running",
+                      "finished": "done", "reused": "error"}
+    assert store.get("dead")["error"].startswith("interrupted")
+    assert store.fail_orphans() == 0
+
+
+def test_fail_orphans_with_alive_callback(tmp_path):
+    store = SqliteTaskStore(tmp_path / "t.sqlite3")
+    store.put("a", {"status": "running"}, owner="x")
+    store.put("b", {"status": "running"}, owner="y")
+    assert store.fail_orphans(alive=lambda owner: owner == "x") == 1
+    assert store.get("a")["status"] == "running" and store.get("b")["status"] == "error"
+
+
+def test_sqlite_uses_wal(tmp_path):
+    store = SqliteTaskStore(tmp_path / "t.sqlite3")
+    store.put("t1", {"status": "pending"})
+    conn = sqlite3.connect(str(tmp_path / "t.sqlite3"))
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""
+Column-group binary store for per-frame tables (a directory of .npy files).
+
+The prediction stage writes one next to every analysis CSV (`sidecar()`:
+`x_analysis.csv` -> `x_analysis.cols`); the CSV stays as the export format and
+readers go through `read_sidecar()`, falling back to the CSV when there is no
+up-to-date store.
+
+A store is a directory with:
+    columns.json     column order, group -> columns mapping, string columns, meta
+    <group>.npy      float32 matrix (rows x columns of that group)
+    strings.json     non-numeric columns as lists (optional)
+    <name>.npy       extra named arrays passed to write(..., arrays=...)
+
+Readers load only the groups holding the requested columns, memory-mapped, so
+e.g. reading 20 AU columns does not touch the 136 landmark coordinates.
+
+Example:
+    python column_store.py --store out_analysis.cols --cols AU01,AU02
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import re
+import shutil
+import sys
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional
+
+import numpy as np
+
+_GROUP_RULES = [
+    ("frame", re.compile(r"^frame$")),
+    ("face", re.compile(r"^Face(Rect\w+|Score)$")),
+    ("landmarks", re.compile(r"^[xy]_\d+$")),
+    ("pose", re.compile(r"^(Pitch|Roll|Yaw)$")),
+    ("aus", re.compile(r"^AU\d{2}(_r)?$")),
+    ("emotions", re.compile(r"^(anger|disgust|fear|happiness|sadness|surprise|neutral)$")),
+    ("identity", re.compile(r"^Identity_\d+$")),
+    ("hmm_state", re.compile(r"^HMM_state$")),
+    ("hmm_auexp", re.compile(r"^HMM_AUexp_\w+$")),
+    ("hmm_post", re.compile(r"^HMM_p_state_\d+$")),
+]
+
+
+def group_columns(columns: Iterable[str]) -> Dict[str, List[str]]:
+    """Assign columns to the standard groups; anything else goes to 'other'."""
+    groups: Dict[str, List[str]] = {}
+    for c in columns:
+        name = "other"
+        for g, pat in _GROUP_RULES:
+            if isinstance(c, str) and pat.match(c):
+                name = g
+                break
+        groups.setdefault(name, []).append(c)
+    return groups
+
+
+def exists(path: Path) -> bool:
+    return (Path(path) / "columns.json").is_file()
+
+
+def read_meta(path: Path) -> dict:
+    with open(Path(path) / "columns.json", "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+class StoreWriter:
+    """Write a store part by part: `rows` is the final row count, known up front.
+
+    The first appended DataFrame fixes the columns and their groups; each
+    group's .npy is preallocated and filled through a memory map, so only one
+    part is in memory at a time. close() publishes the store atomically.
+    """
+
+    def __init__(self, path: Path, rows: int, meta: Optional[dict] = None,
+                 arrays: Optional[Dict[str, np.ndarray]] = None) -> None:
+        self.path = Path(path)
+        self.rows = int(rows)
+        self.meta = meta or {}
+        self.arrays = arrays or {}
+        self.tmp = self.path.with_name(f"{self.path.name}.tmp{os.getpid()}")
+        if self.tmp.exists():
+            shutil.rmtree(self.tmp)
+        self.tmp.mkdir(parents=True)
+        self.columns: Optional[List[str]] = None
+        self._groups: Dict[str, List[str]] = {}
+        self._mats: Dict[str, np.ndarray] = {}
+        self._strings: Dict[str, List[str]] = {}
+        self._offset = 0
+
+    def _start(self, df) -> None:
+        import pandas as pd
+
+        self.columns = list(df.columns)
+        numeric = [c for c in df.columns if pd.api.types.is_numeric_dtype(df[c])]
+        self._strings = {c: [] for c in df.columns if c not in set(numeric)}
+        self._groups = group_columns(numeric)
+        for g, cols in self._groups.items():
+            self._mats[g] = np.lib.format.open_memmap(
+                self.tmp / f"{g}.npy", mode="w+", dtype=np.float32, shape=(self.rows, len(cols)))
+
+    def append(self, df) -> None:
+        import pandas as pd
+
+        # Duplicate labels (e.g. Fex's index + 'frame') keep their first occurrence
+        df = df.loc[:, ~pd.Index(df.columns).duplicated()]
+        if self.columns is None:
+            self._start(df)
+        else:
+            df = df.reindex(columns=self.columns)
+        n = len(df)
+        if self._offset + n > self.rows:
+            raise ValueError(f"StoreWriter: more than {self.rows} rows appended")
+        for g, cols in self._groups.items():
+            self._mats[g][self._offset:self._offset + n] = df[cols].to_numpy(dtype=np.float32, na_value=np.nan)
+        for c, values in self._strings.items():
+            values.extend(df[c].astype(str).tolist())
+        self._offset += n
+
+    def close(self) -> Path:
+        if self._offset != self.rows:
+            raise ValueError(f"StoreWriter: {self._offset} rows appended, {self.rows} expected")
+        for mat in self._mats.values():
+            mat.flush()
+        self._mats.clear()
+        if self._strings:
+            with open(self.tmp / "strings.json", "w", encoding="utf-8") as f:
+                json.dump(self._strings, f)
+        for name, arr in self.arrays.items():
+            np.save(self.tmp / f"{name}.npy", np.asarray(arr))
+        with open(self.tmp / "columns.json", "w", encoding="utf-8") as f:
+            json.dump({
+                "rows": self.rows,
+                "columns": [str(c) for c in (self.columns or [])],
+                "groups": self._groups,
+                "strings": list(self._strings),
+                "arrays": sorted(self.arrays.keys()),
+                "meta": self.meta,
+            }, f)
+
+        if self.path.exists():
+            shutil.rmtree(self.path)
+        self.tmp.rename(self.path)
+        return self.path
+
+
+def write(path: Path, df, meta: Optional[dict] = None,
+          arrays: Optional[Dict[str, np.ndarray]] = None) -> Path:
+    """Write df as a column-group store at `path` (replaced atomically via a temp dir)."""
+    writer = StoreWriter(path, len(df), meta=meta, arrays=arrays)
+    writer.append(df)
+    return writer.close()
+
+
+def read_array(path: Path, name: str) -> np.ndarray:
+    return np.load(Path(path) / f"{name}.npy")
+
+
+def read(path: Path, columns: Optional[Iterable[str]] = None,
+         groups: Optional[Iterable[str]] = None):
+    """Load a store as a DataFrame, limited to `columns` and/or whole `groups` if given."""
+    import pandas as pd
+
+    path = Path(path)
+    info = read_meta(path)
+    all_groups: Dict[str, List[str]] = info["groups"]
+    wanted: Optional[set] = None
+    if columns is not None or groups is not None:
+        wanted = set(columns or [])
+        for g in groups or []:
+            wanted.update(all_groups.get(g, []))
+
+    data: Dict[str, object] = {}
+    for g, cols in all_groups.items():
+        if wanted is not None and not wanted.intersection(cols):
+            continue
+        mat = np.load(path / f"{g}.npy", mmap_mode="r")
+        for i, c in enumerate(cols):
+            if wanted is None or c in wanted:
+                data[c] = np.asarray(mat[:, i])
+    strings = info.get("strings") or []
+    if strings and (wanted is None or wanted.intersection(strings)):
+        with open(path / "strings.json", "r", encoding="utf-8") as f:
+            svals = json.load(f)
+        for c in strings:
+            if wanted is None or c in wanted:
+                data[c] = svals[c]
+    order = [c for c in info["columns"] if c in data]
+    return pd.DataFrame({c: data[c] for c in order}, columns=order)
+
+
+def sidecar(csv_path: Path) -> Path:
+    """Store path written alongside an analysis CSV."""
+    return Path(csv_path).with_suffix(".cols")
+
+
+def read_sidecar(csv_path: Path, where: Optional[Callable[[str], bool]] = None):
+    """Read the store next to csv_path, limited to columns for which where(name) is true.
+
+    Returns None if there is no store or it is older than the CSV (the CSV was
+    rewritten by something that does not know about the store).
+    """
+    store = sidecar(csv_path)
+    try:
+        if store.joinpath("columns.json").stat().st_mtime < Path(csv_path).stat().st_mtime:
+            return None
+    except OSError:
+        return None
+    if where is None:
+        return read(store)
+    cols = [c for c in read_meta(store)["columns"] if where(c)]
+    return read(store, columns=cols)
+
+
+def replace(src: Path, dst: Path) -> None:
+    """Move a store to dst, replacing an existing one."""
+    src, dst = Path(src), Path(dst)
+    if dst.exists():
+        shutil.rmtree(dst)
+    os.replace(src, dst)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    p = argparse.ArgumentParser(description="Inspect a column-group store or export selected columns to CSV.")
+    p.add_argument("--store", required=True, help="Path to the store directory")
+    p.add_argument("--cols", default=None, help="Comma-separated columns to read (default: print layout)")
+    p.add_argument("--out", default=None, help="Write the selected columns to this CSV instead of stdout")
+    args = p.parse_args(argv)
+
+    if not exists(Path(args.store)):
+        print(f"[error] Not a column store: {args.store}", file=sys.stderr)
+        return 2
+    if not args.cols:
+        info = read_meta(Path(args.store))
+        print(f"rows={info['rows']}")
+        for g, cols in info["groups"].items():
+            print(f"  {g}: {len(cols)} columns")
+        return 0
+    df = read(Path(args.store), columns=[c.strip() for c in args.cols.split(",") if c.strip()])
+    if args.out:
+        df.to_csv(args.out, index=False)
+    else:
+        print(df.to_string(max_rows=20))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Sweep py-feat Detector batch sizes on sampled frames of a video and report throughput.
+
+The sampled frames are decoded once up front, so the numbers measure the
+detector alone: wall-clock frames per second and detector ms per frame for each
+batch size. Use the best value for PREDICT_BATCH_SIZE (or --batch-size of
+predict_video_to_csv.py) on a given CPU.
+
+Example:
+    python detect_benchmark.py --video 1_video.mp4 --batch-sizes 1,2,4,8,16 --frames 64
+"""
+from __future__ import annotations
+
+import argparse
+import sys
+import time
+from pathlib import Path
+from typing import List, Optional
+
+
+def _parse_sizes(text: str) -> List[int]:
+    sizes = sorted(set(int(s) for s in text.split(",") if s.strip()))
+    if not sizes or sizes[0] < 1:
+        raise ValueError("batch sizes must be positive integers")
+    return sizes
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    p = argparse.ArgumentParser(description="Benchmark Detector throughput against batch size.")
+    p.add_argument("--video", required=True, help="Path to input video")
+    p.add_argument("--skip-frames", type=int, default=25, help="Use every Nth frame")
+    p.add_argument("--frames", type=int, default=64, help="Sampled frames per batch size")
+    p.add_argument("--batch-sizes", default="1,2,4,8,16", help="Comma-separated batch sizes to try")
+    p.add_argument("--outputs", default="all", help="Detector outputs (as in predict_video_to_csv.py)")
+    p.add_argument("--face-threshold", type=float, default=0.95, help="Face detection threshold")
+    p.add_argument("--torch-threads", type=int, default=0, help="torch.set_num_threads (0 = leave default)")
+    args = p.parse_args(argv)
+
+    import predict_video_to_csv as pv
+    import video_frames
+
+    try:
+        sizes = _parse_sizes(args.batch_sizes)
+        outputs = pv._pipeline_outputs(args.outputs)
+    except ValueError as e:
+        print(f"[error] {e}", file=sys.stderr)
+        return 2
+    video = Path(args.video)
+    if not video.exists():
+        print(f"[error] Video not found: {video}", file=sys.stderr)
+        return 2
+    if args.torch_threads > 0:
+        try:
+            import torch  # type: ignore
+            torch.set_num_threads(int(args.torch_threads))
+        except Exception as e:
+            print("[warn] could not set torch threads:", e, file=sys.stderr)
+
+    info = video_frames.probe(video)
+    indices = video_frames.sample_indices(info.frame_count, args.skip_frames)[: max(1, args.frames)]
+    frames = list(video_frames.read_frames_at(video, indices))
+    print(f"frames={len(frames)} size={info.width}x{info.height} outputs={','.join(outputs)}")
+    detector = pv._build_detector(outputs)
+    # Warm-up: first calls pay lazy initialisation
+    pv._detect_frames(detector, frames[: max(sizes)], args.face_threshold, max(sizes), outputs=outputs)
+
+    best = None
+    for size in sizes:
+        stats: dict = {}
+        t0 = time.perf_counter()
+        pv._detect_frames(detector, frames, args.face_threshold, size, outputs=outputs, stats=stats)
+        wall = time.perf_counter() - t0
+        fps = len(frames) / wall if wall > 0 else 0.0
+        ms = 1000.0 * stats.get("detect_s", 0.0) / max(1, stats.get("frames", 0))
+        print(f"batch={size:<3} {fps:6.2f} frames/s  detect={ms:7.1f} ms/frame")
+        if best is None or fps > best[1]:
+            best = (size, fps, ms)
+    if best is not None:
+        print(f"best batch size: {best[0]} ({best[1]:.2f} frames/s)")
+        if outputs == pv.OUTPUTS_ALL:
+            # Baseline for the "saves X ms/frame" line in predict task logs
+            print(f"PREDICT_DETECT_ALL_HEADS_MS={best[2]:.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -63,11 +63,22 @@ def _fex_to_dataframe(obj):
     raise TypeError("Unsupported object type for DataFrame conversion")
 
 
+_EMOTIONS = ("anger", "disgust", "fear", "happiness", "sadness", "surprise", "neutral")
+
+
 def _load_csv(path: Path):
-    """Load CSV; prefer feat.utils.io.read_feat if available; else pandas.read_csv.
+    """Load CSV; prefer the columnar sidecar written by predict_video_to_csv.py (frame + emotion
+    columns only), then feat.utils.io.read_feat if available; else pandas.read_csv.
     Returns (df, meta_title)
     """
     import pandas as pd
+    try:
+        import column_store
+        df = column_store.read_sidecar(path, where=lambda c: c.lower() == "frame" or c.lower() in _EMOTIONS)
+        if df is not None:
+            return df, "Columnar (predict_video_to_csv)"
+    except Exception as e:
+        print(f"[warn] columnar read failed ({e}); falling back to CSV", file=sys.stderr)
     if _read_feat is not None:
         try:
             fex = _read_feat(str(path))
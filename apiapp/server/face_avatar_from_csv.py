@@ -77,8 +77,20 @@ def _fex_to_dataframe(obj):
     raise TypeError("Unsupported object type for DataFrame conversion")
 
 
+def _is_au_column(name: str) -> bool:
+    return name.startswith("AU") or name.startswith("HMM_AUexp_")
+
+
 def _load_csv(path: Path):
     import pandas as pd
+    # Columnar sidecar written by predict_video_to_csv.py: load only the AU columns
+    try:
+        import column_store
+        df = column_store.read_sidecar(path, where=_is_au_column)
+        if df is not None:
+            return df
+    except Exception:
+        pass
     if _read_feat is not None:
         try:
             fex = _read_feat(str(path))
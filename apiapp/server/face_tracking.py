@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+Face tracking for py-feat: skip the face detector between keyframes.
+
+FaceTracker is attached to a Detector around a detect_image call. It replaces
+Detector.detect_faces so that only every `keyframe_interval`-th frame runs the
+face model; on the frames in between the face box is propagated from the
+previous frame's landmarks (captured by wrapping Detector.detect_landmarks).
+Landmarks, AUs, emotions etc. still run on every frame, inside the box.
+
+Tracking is used only while exactly one face is seen (interview-style video).
+Each tracked frame gets a confidence: the keyframe's face score times the IoU
+between the box that was used and the box implied by the landmarks found in
+it. predict_video_to_csv re-detects frames whose confidence drops below
+face_threshold and resets the track from there.
+
+Example:
+    python face_tracking.py --video 1_video.mp4 --skip-frames 25 --keyframes 10
+"""
+from __future__ import annotations
+
+import argparse
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, List, Optional
+
+import numpy as np
+
+
+def _landmark_box(points) -> Optional[np.ndarray]:
+    """(x1, y1, x2, y2) of a (68, 2) landmark array, None if unusable."""
+    try:
+        pts = np.asarray(points, dtype=float).reshape(-1, 2)
+    except Exception:
+        return None
+    if pts.size == 0 or not np.isfinite(pts).all():
+        return None
+    return np.array([pts[:, 0].min(), pts[:, 1].min(), pts[:, 0].max(), pts[:, 1].max()])
+
+
+def _iou(a: np.ndarray, b: np.ndarray) -> float:
+    ix = max(0.0, min(a[2], b[2]) - max(a[0], b[0]))
+    iy = max(0.0, min(a[3], b[3]) - max(a[1], b[1]))
+    inter = ix * iy
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return float(inter / union) if union > 0 else 0.0
+
+
+class FaceTracker:
+    """Keyframe face detection with landmark-based box propagation (see module docstring).
+
+    `records` has one entry per image seen since the last `take_records()`:
+    {"tracked": bool, "confidence": float or None}. `stats` counts detector
+    calls, skipped face detections and the wall time spent in the face model.
+    """
+
+    def __init__(self, keyframe_interval: int = 10) -> None:
+        self.keyframe_interval = max(1, int(keyframe_interval))
+        self.force_detect = False
+        self.records: List[dict] = []
+        self.stats = {"face_detect_runs": 0, "face_detect_skipped": 0, "face_detect_s": 0.0}
+        self._since_keyframe = 0
+        self._score = 0.0                      # face score at the last keyframe
+        self._offsets: Optional[np.ndarray] = None  # face box relative to the landmark box
+        self._next_box: Optional[np.ndarray] = None
+        self._used_boxes: List[Optional[np.ndarray]] = []  # box used per image of the current batch
+        self._detected: List[bool] = []
+
+    def reset(self) -> None:
+        """Forget the track; the next frame runs full detection."""
+        self._offsets = None
+        self._next_box = None
+
+    def take_records(self) -> List[dict]:
+        out, self.records = self.records, []
+        return out
+
+    # ----- Detector hooks -----
+
+    def _detect_faces(self, original, frame, *args, **kwargs):
+        n = self._batch_len(frame)
+        due = n is None or self._since_keyframe + n >= self.keyframe_interval
+        if self.force_detect or due or self._next_box is None:
+            t0 = time.perf_counter()
+            faces = original(frame, *args, **kwargs)
+            self.stats["face_detect_s"] += time.perf_counter() - t0
+            self.stats["face_detect_runs"] += int(n or 1)
+            self._since_keyframe = 0
+            self._detected = [True] * int(n or 1)
+            try:
+                self._used_boxes = [
+                    np.asarray(per_image[0], dtype=float)[:5] if len(per_image) == 1 else None
+                    for per_image in faces
+                ]
+            except Exception:
+                self._used_boxes = [None] * int(n or 1)
+            return faces
+        self._since_keyframe += n
+        self.stats["face_detect_skipped"] += n
+        box = self._next_box
+        self._detected = [False] * n
+        self._used_boxes = [box] * n
+        return [[[float(box[0]), float(box[1]), float(box[2]), float(box[3]), self._score]] for _ in range(n)]
+
+    def _detect_landmarks(self, original, frame, *args, **kwargs):
+        landmarks = original(frame, *args, **kwargs)
+        try:
+            for i, per_image in enumerate(landmarks):
+                self._update(i, per_image)
+        except Exception:
+            # Unknown landmark layout in this py-feat version: stop tracking
+            self.reset()
+            for i in range(len(self._detected)):
+                self.records.append({"tracked": False, "confidence": None})
+        return landmarks
+
+    def _update(self, i: int, per_image) -> None:
+        detected = self._detected[i] if i < len(self._detected) else True
+        used = self._used_boxes[i] if i < len(self._used_boxes) else None
+        lbox = _landmark_box(per_image[0]) if (used is not None and len(per_image) == 1) else None
+        if lbox is None:
+            self.reset()
+            self.records.append({"tracked": not detected, "confidence": 0.0 if not detected else None})
+            return
+        lw, lh = max(lbox[2] - lbox[0], 1e-6), max(lbox[3] - lbox[1], 1e-6)
+        scale = np.array([lw, lh, lw, lh])
+        if detected:
+            self._score = float(used[4]) if used.shape[0] > 4 else 1.0
+            self._offsets = (used[:4] - lbox) / scale
+            conf = None
+        else:
+            implied = lbox + self._offsets * scale
+            conf = self._score * _iou(used[:4], implied)
+        self._next_box = lbox + self._offsets * scale
+        self.records.append({"tracked": not detected, "confidence": conf})
+
+    @staticmethod
+    def _batch_len(frame) -> Optional[int]:
+        try:
+            return int(len(frame))
+        except Exception:
+            return None
+
+    @contextmanager
+    def attach(self, detector) -> Iterator["FaceTracker"]:
+        """Route detector.detect_faces/detect_landmarks through the tracker for the `with` block."""
+        orig_faces = getattr(detector, "detect_faces", None)
+        orig_landmarks = getattr(detector, "detect_landmarks", None)
+        if not callable(orig_faces) or not callable(orig_landmarks):
+            yield self
+            return
+        detector.detect_faces = lambda frame, *a, **k: self._detect_faces(orig_faces, frame, *a, **k)
+        detector.detect_landmarks = lambda frame, *a, **k: self._detect_landmarks(orig_landmarks, frame, *a, **k)
+        try:
+            yield self
+        finally:
+            # Drop the instance attributes so the class methods are visible again
+            for name in ("detect_faces", "detect_landmarks"):
+                try:
+                    delattr(detector, name)
+                except AttributeError:
+                    pass
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    p = argparse.ArgumentParser(description="Compare face-detection time with and without keyframe tracking.")
+    p.add_argument("--video", required=True, help="Path to input video")
+    p.add_argument("--skip-frames", type=int, default=25, help="Process every Nth frame")
+    p.add_argument("--keyframes", type=int, default=10, help="Full face detection every N sampled frames")
+    p.add_argument("--face-threshold", type=float, default=0.95, help="Face detection threshold")
+    p.add_argument("--limit", type=int, default=100, help="Max sampled frames to process")
+    args = p.parse_args(argv)
+
+    import predict_video_to_csv as pv
+    import video_frames
+
+    video = Path(args.video)
+    info = video_frames.probe(video)
+    indices = video_frames.sample_indices(info.frame_count, args.skip_frames)[: max(1, args.limit)]
+    detector = pv._build_detector()
+    for label, tracker in (("full", None), ("tracked", FaceTracker(args.keyframes))):
+        stats: dict = {}
+        frames = video_frames.read_frames_at(video, indices)
+        df = pv._detect_frames(detector, frames, args.face_threshold, stats=stats, tracker=tracker)
+        ms = 1000.0 * stats.get("detect_s", 0.0) / max(1, stats.get("frames", 0))
+        extra = ""
+        if tracker is not None:
+            extra = (f" face_detect runs={tracker.stats['face_detect_runs']}"
+                     f" skipped={tracker.stats['face_detect_skipped']} redetected={stats.get('redetected', 0)}")
+        print(f"{label:<8} rows={len(df)} detect={ms:.1f} ms/frame{extra}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
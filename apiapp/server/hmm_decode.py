@@ -0,0 +1,501 @@
+#!/usr/bin/env python3
+"""
+Fused NumPy decoding for the saved Poisson HMM (hmm_poisson.joblib).
+
+hmmlearn's `predict` and `predict_proba` each run their own pass over the
+sequence and each recompute the Poisson emission log-likelihoods. `decode`
+computes the (T, K) emission matrix once with a single matrix product and then
+runs Viterbi and (optionally) forward-backward on it.
+
+The recursions are blocked: the sequence is cut into ~sqrt(T) blocks, each
+block's K x K transfer matrix is built with all blocks advanced together, the
+block boundaries are resolved sequentially, and the blocks are swept again in
+parallel. The Python-level loop is therefore O(sqrt(T)) instead of O(T).
+
+Irregularly sampled sequences pass `steps`: the elapsed time before each row
+in units of the sampling interval the model was fitted at. A row `s` steps
+after the previous one is reached through transmat ** s (fractional powers
+for rows sampled more densely), so a wide gap allows more state change than
+a narrow one.
+
+Benchmark against the hmmlearn path:
+    python hmm_decode.py --artifacts artifacts --frames 1000,10000,100000,1000000
+"""
+from __future__ import annotations
+
+import argparse
+import math
+import sys
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Optional
+
+import numpy as np
+
+
+@dataclass
+class PoissonHMMParams:
+    startprob: np.ndarray  # (K,)
+    transmat: np.ndarray   # (K, K)
+    lambdas: np.ndarray    # (K, D)
+
+    @classmethod
+    def from_model(cls, model) -> "PoissonHMMParams":
+        return cls(
+            startprob=np.asarray(model.startprob_, dtype=float),
+            transmat=np.asarray(model.transmat_, dtype=float),
+            lambdas=np.asarray(model.lambdas_, dtype=float),
+        )
+
+    @property
+    def n_components(self) -> int:
+        return int(self.transmat.shape[0])
+
+
+@dataclass
+class DecodeResult:
+    states: np.ndarray                 # (T,) Viterbi path
+    posteriors: Optional[np.ndarray]   # (T, K) or None when skipped
+    logprob: float                     # forward log-likelihood (nan when posteriors skipped)
+
+
+def _log(a: np.ndarray) -> np.ndarray:
+    with np.errstate(divide="ignore"):
+        return np.log(a)
+
+
+def log_emissions(params: PoissonHMMParams, X: np.ndarray) -> np.ndarray:
+    """Poisson log-pmf of each row of X under each state, summed over features: (T, K)."""
+    from scipy.special import gammaln
+
+    X = np.asarray(X, dtype=float)
+    lam = params.lambdas
+    zero = lam <= 0
+    log_lam = np.where(zero, 0.0, _log(np.where(zero, 1.0, lam)))
+    out = X @ log_lam.T - lam.sum(axis=1)[None, :] - gammaln(X + 1.0).sum(axis=1, keepdims=True)
+    if zero.any():
+        # x > 0 under a zero rate is impossible
+        impossible = (X > 0).astype(float) @ zero.T.astype(float) > 0
+        out[impossible] = -np.inf
+    return out
+
+
+def log_emissions_chunked(params: PoissonHMMParams, X: np.ndarray, chunk_rows: int = 65536) -> np.ndarray:
+    """log_emissions over row chunks of X, so a memory-mapped X is never loaded as a whole."""
+    T = int(X.shape[0])
+    out = np.empty((T, params.n_components), dtype=float)
+    step = max(1, int(chunk_rows))
+    for s in range(0, T, step):
+        out[s:s + step] = log_emissions(params, X[s:s + step])
+    return out
+
+
+def transition_power(transmat: np.ndarray, step: float) -> np.ndarray:
+    """transmat ** step as a row-stochastic matrix (fractional powers via scipy, clipped and renormalized)."""
+    A = np.asarray(transmat, dtype=float)
+    step = max(0.0, float(step))
+    n, frac = int(step), step - int(step)
+    out = np.linalg.matrix_power(A, n)
+    if frac > 1e-9:
+        try:
+            from scipy.linalg import fractional_matrix_power
+            part = np.real(fractional_matrix_power(A, frac))
+            if not np.all(np.isfinite(part)):
+                raise ValueError("non-finite fractional power")
+        except Exception:
+            part = A  # no real root: fall back to a whole step
+        out = out @ np.clip(part, 0.0, None)
+    out = np.clip(out, 0.0, None)
+    return _normalize_rows(out)
+
+
+def transition_stack(transmat: np.ndarray, steps, resolution: int = 8):
+    """Distinct transition matrices for per-row `steps` and each row's index into them.
+
+    Steps are rounded to 1/`resolution` (at least one grid step), so sequences
+    with many gap lengths share a few matrices. Returns (stack (G, K, K),
+    index (T,)), or (None, None) when every step is 1 (the regular case).
+    """
+    if steps is None:
+        return None, None
+    res = max(1, int(resolution))
+    q = np.maximum(1, np.rint(np.asarray(steps, dtype=float) * res)).astype(np.int64)
+    if q.size:
+        q[0] = res  # the first row has no incoming transition
+    if np.all(q == res):
+        return None, None
+    values, index = np.unique(q, return_inverse=True)
+    stack = np.stack([transition_power(transmat, v / res) for v in values])
+    return stack, index.astype(np.intp)
+
+
+def _blocks(T: int, block_len: Optional[int]) -> tuple[int, int]:
+    L = int(block_len) if block_len else max(1, int(math.ceil(math.sqrt(T))))
+    L = max(1, min(L, T))
+    return L, int(math.ceil(T / L))
+
+
+def _to_blocks(a: np.ndarray, n_blocks: int, L: int, fill: float) -> np.ndarray:
+    T = a.shape[0]
+    pad = n_blocks * L - T
+    if pad:
+        a = np.concatenate([a, np.full((pad,) + a.shape[1:], fill, dtype=a.dtype)], axis=0)
+    return a.reshape((n_blocks, L) + a.shape[1:])
+
+
+def _step_mats(mats: np.ndarray, gb: Optional[np.ndarray], r: int) -> np.ndarray:
+    """Transition matrix into row r of every block: (K, K) when regular, else (nb, K, K)."""
+    return mats if gb is None else mats[gb[:, r]]
+
+
+def _viterbi(logpi: np.ndarray, logA: np.ndarray, logb: np.ndarray, L: int, nb: int,
+             gid: Optional[np.ndarray] = None) -> np.ndarray:
+    """Blocked Viterbi; with `gid` logA is a (G, K, K) stack and row t enters through logA[gid[t]]."""
+    T, K = logb.shape
+    gb = None if gid is None else _to_blocks(gid, nb, L, 0)
+    lb = _to_blocks(logb, nb, L, 0.0)                       # (nb, L, K)
+    pad = _to_blocks(np.zeros(T, dtype=bool), nb, L, True)  # (nb, L)
+    eye = np.where(np.eye(K, dtype=bool), 0.0, -np.inf)
+    ident = np.broadcast_to(np.arange(K), (nb, K))
+
+    # Pass 1: max-plus transfer matrix of every block, all blocks advanced together
+    D = np.broadcast_to(eye, (nb, K, K)).copy()
+    Dn = np.empty_like(D)
+    tmp = np.empty_like(D)
+    for r in range(L):
+        Al = _step_mats(logA, gb, r)
+        row = (lambda k: Al[k][None, None, :]) if Al.ndim == 2 else (lambda k: Al[:, k][:, None, :])
+        # max_k D[:, i, k] + logA[k, j], one k at a time to avoid a (nb, K, K, K) temporary
+        np.add(D[:, :, 0, None], row(0), out=Dn)
+        for k in range(1, K):
+            np.add(D[:, :, k, None], row(k), out=tmp)
+            np.maximum(Dn, tmp, out=Dn)
+        Dn += lb[:, r, None, :]
+        if r == 0:
+            Dn[0] = D[0] + lb[0, 0][None, :]  # t=0 has no incoming transition
+        Dn[pad[:, r]] = D[pad[:, r]]
+        m = Dn.max(axis=(1, 2), keepdims=True)
+        np.subtract(Dn, np.where(np.isfinite(m), m, 0.0), out=D)
+
+    # Pass 2: resolve block boundaries sequentially
+    delta_in = np.empty((nb, K))
+    d = logpi.copy()
+    for b in range(nb):
+        delta_in[b] = d
+        d = (d[:, None] + D[b]).max(axis=0)
+        m = d.max()
+        d = d - (m if np.isfinite(m) else 0.0)
+
+    # Pass 3: in-block Viterbi with known start scores, keeping back-pointers
+    bp_dtype = np.int8 if K <= 127 else np.int32
+    bp = np.empty((nb, L, K), dtype=bp_dtype)
+    delta = delta_in
+    for r in range(L):
+        Al = _step_mats(logA, gb, r)
+        cand = delta[:, :, None] + (Al[None, :, :] if Al.ndim == 2 else Al)
+        arg = cand.argmax(axis=1)
+        dn = np.take_along_axis(cand, arg[:, None, :], axis=1)[:, 0, :] + lb[:, r, :]
+        if r == 0:
+            dn[0] = delta[0] + lb[0, 0]
+            arg[0] = ident[0]
+        keep = pad[:, r]
+        dn[keep] = delta[keep]
+        arg[keep] = ident[keep]
+        m = dn.max(axis=1, keepdims=True)
+        delta = dn - np.where(np.isfinite(m), m, 0.0)
+        bp[:, r, :] = arg
+
+    # Backtrack every block for all K possible end states at once
+    paths = np.empty((nb, L, K), dtype=bp_dtype)
+    cur = ident.astype(bp_dtype)
+    paths[:, L - 1, :] = cur
+    for r in range(L - 1, 0, -1):
+        cur = np.take_along_axis(bp[:, r, :], cur.astype(np.intp), axis=1)
+        paths[:, r - 1, :] = cur
+    prev_end = np.take_along_axis(bp[:, 0, :], cur.astype(np.intp), axis=1)  # state at previous block's end
+
+    end = np.empty(nb, dtype=np.intp)
+    end[-1] = int(np.argmax(delta[-1]))
+    for b in range(nb - 1, 0, -1):
+        end[b - 1] = int(prev_end[b, end[b]])
+    states = paths[np.arange(nb), :, end].reshape(-1)[:T]
+    return states.astype(np.int64)
+
+
+def _normalize_rows(a: np.ndarray) -> np.ndarray:
+    s = a.sum(axis=-1, keepdims=True)
+    return a / np.where(s > 0, s, 1.0)
+
+
+def _forward_backward(pi: np.ndarray, A: np.ndarray, logb: np.ndarray, L: int, nb: int,
+                      gid: Optional[np.ndarray] = None) -> tuple[np.ndarray, float]:
+    """Blocked forward-backward; with `gid` A is a (G, K, K) stack and row t enters through A[gid[t]]."""
+    T, K = logb.shape
+    gb = None if gid is None else _to_blocks(gid, nb, L, 0)
+    shift = logb.max(axis=1, keepdims=True)
+    shift = np.where(np.isfinite(shift), shift, 0.0)
+    b = np.exp(logb - shift)                                # (T, K), row max 1
+    bb = _to_blocks(b, nb, L, 1.0)
+    pad = _to_blocks(np.zeros(T, dtype=bool), nb, L, True)
+    eye = np.eye(K)
+
+    # ----- forward -----
+    P = np.broadcast_to(eye, (nb, K, K)).copy()
+    logscale = np.zeros(nb)
+    for r in range(L):
+        Pn = (P @ _step_mats(A, gb, r)) * bb[:, r, None, :]
+        if r == 0:
+            Pn[0] = P[0] * bb[0, 0][None, :]
+        Pn[pad[:, r]] = P[pad[:, r]]
+        s = Pn.sum(axis=(1, 2))
+        s = np.where(s > 0, s, 1.0)
+        P = Pn / s[:, None, None]
+        logscale += np.log(s)
+
+    a_in = np.empty((nb, K))
+    a = pi / pi.sum()
+    logZ = 0.0
+    for blk in range(nb):
+        a_in[blk] = a
+        v = a @ P[blk]
+        c = v.sum()
+        logZ += logscale[blk] + (math.log(c) if c > 0 else -math.inf)
+        a = v / c if c > 0 else v
+    logprob = float(logZ + shift.sum())
+
+    alphas = np.empty((nb, L, K))
+    alpha = a_in
+    for r in range(L):
+        Al = _step_mats(A, gb, r)
+        an = (alpha @ Al if Al.ndim == 2 else np.einsum("bi,bij->bj", alpha, Al)) * bb[:, r, :]
+        if r == 0:
+            an[0] = alpha[0] * bb[0, 0]
+        an[pad[:, r]] = alpha[pad[:, r]]
+        alpha = _normalize_rows(an)
+        alphas[:, r, :] = alpha
+
+    # ----- backward: beta_t = A @ (b_{t+1} * beta_{t+1}), beta_{T-1} = 1 -----
+    bnext = np.ones_like(b)
+    bnext[:-1] = b[1:]
+    bn = _to_blocks(bnext, nb, L, 1.0)
+    last = _to_blocks(np.arange(T) >= T - 1, nb, L, True)  # identity steps
+    gbn = None
+    if gid is not None:
+        gnext = np.zeros_like(gid)
+        gnext[:-1] = gid[1:]  # beta_t goes through the transition into row t+1
+        gbn = _to_blocks(gnext, nb, L, 0)
+
+    R = np.broadcast_to(eye, (nb, K, K)).copy()
+    for r in range(L - 1, -1, -1):
+        Rn = _step_mats(A, gbn, r) @ (bn[:, r, :, None] * R)
+        Rn[last[:, r]] = R[last[:, r]]
+        s = Rn.sum(axis=(1, 2))
+        R = Rn / np.where(s > 0, s, 1.0)[:, None, None]
+
+    beta_out = np.empty((nb, K))
+    v = np.full(K, 1.0 / K)
+    for blk in range(nb - 1, -1, -1):
+        beta_out[blk] = v
+        v = R[blk] @ v
+        v = v / (v.sum() or 1.0)
+
+    post = np.empty((nb, L, K))
+    beta = beta_out
+    for r in range(L - 1, -1, -1):
+        Al = _step_mats(A, gbn, r)
+        v_ = beta * bn[:, r, :]
+        bn_ = v_ @ Al.T if Al.ndim == 2 else np.einsum("bj,bij->bi", v_, Al)
+        bn_[last[:, r]] = beta[last[:, r]]
+        beta = _normalize_rows(bn_)
+        post[:, r, :] = _normalize_rows(alphas[:, r, :] * beta)
+
+    return post.reshape(nb * L, K)[:T], logprob
+
+
+def decode(params, X: np.ndarray, posteriors: bool = True, block_len: Optional[int] = None,
+           steps=None) -> DecodeResult:
+    """Viterbi states and (optionally) state posteriors for observation matrix X (T, D).
+
+    `params` is a PoissonHMMParams or a fitted hmmlearn PoissonHMM. X may be
+    a np.memmap: emissions are computed in row chunks, so only the (T, K)
+    state matrices are held in memory. `steps` (T,) gives the time since the
+    previous row in model sampling intervals for irregularly sampled rows
+    (see transition_stack); None means every row is one interval apart.
+    """
+    if not isinstance(params, PoissonHMMParams):
+        params = PoissonHMMParams.from_model(params)
+    if not isinstance(X, np.ndarray):
+        X = np.asarray(X)
+    if X.ndim != 2 or X.shape[0] == 0:
+        raise ValueError("Empty AU matrix for HMM decoding")
+    logb = log_emissions_chunked(params, X)
+    # Rows impossible under every state carry no information; keep them neutral
+    dead = ~np.isfinite(logb.max(axis=1))
+    if dead.any():
+        logb[dead] = 0.0
+    T = logb.shape[0]
+    L, nb = _blocks(T, block_len)
+    if steps is not None and len(steps) != T:
+        raise ValueError(f"steps has {len(steps)} entries for {T} rows")
+    A, gid = transition_stack(params.transmat, steps)
+    if A is None:
+        A = params.transmat
+    states = _viterbi(_log(params.startprob), _log(A), logb, L, nb, gid)
+    if not posteriors:
+        return DecodeResult(states=states, posteriors=None, logprob=float("nan"))
+    post, logprob = _forward_backward(params.startprob, A, logb, L, nb, gid)
+    return DecodeResult(states=states, posteriors=post, logprob=logprob)
+
+
+# ----- Online fixed-lag decoding -----
+
+@dataclass
+class OnlineStep:
+    index: int                    # index of the observation just pushed
+    posteriors: np.ndarray        # (K,) filtered P(state_t | x_0..x_t)
+    smoothed: List[tuple]         # (index, state) pairs finalised by this push
+
+
+class OnlineDecoder:
+    """Incremental decoder for one observation stream.
+
+    Each `push` returns the filtered posterior for the new row immediately and,
+    once `lag` more rows have arrived, the fixed-lag Viterbi state for the row
+    `lag` steps back (backtracked from the current best state). `flush` settles
+    the remaining tail when the stream ends. With lag=0 states are the running
+    argmax of the Viterbi scores. `push(x, step)` takes the time since the
+    previous row in model sampling intervals for irregularly sampled streams.
+    """
+
+    def __init__(self, params, lag: int = 5) -> None:
+        from collections import deque
+
+        if not isinstance(params, PoissonHMMParams):
+            params = PoissonHMMParams.from_model(params)
+        self.params = params
+        self.lag = max(0, int(lag))
+        self._A = params.transmat
+        self._logA = _log(params.transmat)
+        self._pi = params.startprob / params.startprob.sum()
+        self._logpi = _log(params.startprob)
+        self._alpha: Optional[np.ndarray] = None
+        self._delta: Optional[np.ndarray] = None
+        self._bp = deque(maxlen=max(1, self.lag))  # back-pointers of the last `lag` steps
+        self._t = -1
+        self._emitted = 0  # rows whose smoothed state has been returned
+        self._powers: dict = {}  # quantized step -> (A, logA)
+
+    def _transition(self, step: float):
+        q = max(1, int(round(float(step) * 8)))
+        if q == 8:
+            return self._A, self._logA
+        if q not in self._powers:
+            A = transition_power(self.params.transmat, q / 8.0)
+            self._powers[q] = (A, _log(A))
+        return self._powers[q]
+
+    @property
+    def pending(self) -> int:
+        """Rows pushed whose smoothed state is not final yet."""
+        return self._t + 1 - self._emitted
+
+    def push(self, x: np.ndarray, step: float = 1.0) -> OnlineStep:
+        logb = log_emissions(self.params, np.asarray(x, dtype=float)[None, :])[0]
+        if not np.isfinite(logb.max()):
+            logb = np.zeros_like(logb)
+        b = np.exp(logb - logb.max())
+        self._t += 1
+        if self._alpha is None:
+            alpha = self._pi * b
+            delta = self._logpi + logb
+        else:
+            A, logA = self._transition(step)
+            alpha = (self._alpha @ A) * b
+            cand = self._delta[:, None] + logA
+            bp = cand.argmax(axis=0)
+            delta = cand[bp, np.arange(cand.shape[1])] + logb
+            self._bp.append(bp)
+        s = alpha.sum()
+        self._alpha = alpha / s if s > 0 else np.full_like(alpha, 1.0 / alpha.size)
+        m = delta.max()
+        self._delta = delta - (m if np.isfinite(m) else 0.0)
+
+        smoothed: List[tuple] = []
+        if self._t - self.lag >= self._emitted:
+            state = int(np.argmax(self._delta))
+            for bp in list(self._bp)[::-1][: self.lag]:
+                state = int(bp[state])
+            smoothed.append((self._t - self.lag, state))
+            self._emitted += 1
+        return OnlineStep(index=self._t, posteriors=self._alpha.copy(), smoothed=smoothed)
+
+    def flush(self) -> List[tuple]:
+        """Finalise states for all rows still inside the lag window."""
+        if self._delta is None or self.pending <= 0:
+            return []
+        state = int(np.argmax(self._delta))
+        path = [state]
+        bps = list(self._bp)[::-1]
+        for bp in bps[: self.pending - 1]:
+            state = int(bp[state])
+            path.append(state)
+        path.reverse()
+        out = [(self._emitted + i, st) for i, st in enumerate(path)]
+        self._emitted += len(out)
+        return out
+
+
+# ----- Benchmark -----
+
+def _bench_one(model, X: np.ndarray, reference: bool) -> dict:
+    params = PoissonHMMParams.from_model(model)
+    row: dict = {"frames": int(X.shape[0])}
+    t0 = time.perf_counter()
+    fused = decode(params, X, posteriors=True)
+    row["fused_s"] = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    decode(params, X, posteriors=False)
+    row["fused_states_only_s"] = time.perf_counter() - t0
+    if reference:
+        t0 = time.perf_counter()
+        ref_states = model.predict(X)
+        ref_proba = model.predict_proba(X)
+        row["hmmlearn_s"] = time.perf_counter() - t0
+        row["state_agreement"] = float(np.mean(ref_states == fused.states))
+        row["max_proba_diff"] = float(np.max(np.abs(ref_proba - fused.posteriors)))
+    return row
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    p = argparse.ArgumentParser(description="Benchmark fused HMM decoding against hmmlearn predict + predict_proba.")
+    p.add_argument("--artifacts", default="artifacts", help="Artifacts dir with hmm_poisson.joblib and X.npy")
+    p.add_argument("--frames", default="1000,10000,100000,1000000", help="Comma-separated sequence lengths")
+    p.add_argument("--reference-max", type=int, default=1000000, help="Skip the hmmlearn path above this length")
+    args = p.parse_args(argv)
+
+    from joblib import load
+
+    adir = Path(args.artifacts)
+    try:
+        model = load(adir / "hmm_poisson.joblib")
+        X0 = np.load(adir / "X.npy")
+    except Exception as e:
+        print(f"[error] Could not load artifacts: {e}", file=sys.stderr)
+        return 2
+
+    print(f"{'frames':>9} {'hmmlearn_s':>11} {'fused_s':>9} {'states_s':>9} {'speedup':>8} {'agree':>7} {'max_dp':>9}")
+    for n in [int(x) for x in args.frames.split(",") if x.strip()]:
+        X = np.resize(X0, (n, X0.shape[1]))  # tile the training AU matrix to length n
+        r = _bench_one(model, X, reference=n <= args.reference_max)
+        ref = r.get("hmmlearn_s")
+        print(
+            f"{n:>9} {ref if ref is not None else float('nan'):>11.3f} {r['fused_s']:>9.3f} "
+            f"{r['fused_states_only_s']:>9.3f} {(ref / r['fused_s']) if ref else float('nan'):>8.1f} "
+            f"{r.get('state_agreement', float('nan')):>7.4f} {r.get('max_proba_diff', float('nan')):>9.2e}"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+Real-time per-frame analysis: warm py-feat Detector + online HMM on single frames.
+
+LiveSession takes one encoded image (JPEG/WebP bytes, as sent by a browser)
+or a decoded BGR frame at a time and returns the AUs and emotions of the most
+confident face together with the online HMM state. Frames arrive at irregular
+times, so each one advances the HMM by its wall-clock gap in units of
+`hmm_step_s` (the sampling interval the model was trained at, e.g. 1 s for
+skip_frames=25 at 25 fps; see hmm_decode.OnlineDecoder). Frames are shrunk to
+`max_height` lines before detection to keep the per-frame latency low.
+
+The WebSocket endpoint (app/routes/live.py) keeps only the newest frame while
+a detection is running, so a slow detector drops stale frames instead of
+falling further behind.
+
+Replay a file at its frame rate and report latency and dropped frames:
+    python live_analysis.py --video 1_video.mp4 --artifacts artifacts --seconds 20
+"""
+from __future__ import annotations
+
+import argparse
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+import predict_video_to_csv as pv
+
+
+def decode_image(data: bytes):
+    """BGR ndarray of a JPEG/WebP/PNG byte string (None if it cannot be decoded)."""
+    import cv2  # type: ignore
+
+    buf = np.frombuffer(data, dtype=np.uint8)
+    if buf.size == 0:
+        return None
+    return cv2.imdecode(buf, cv2.IMREAD_COLOR)
+
+
+def _ms(seconds: float) -> float:
+    return round(1000.0 * seconds, 1)
+
+
+class LiveSession:
+    """Analysis state of one live stream: detector lease, online HMM and frame counters.
+
+    `artifacts` is the (model, labels, raw_multiplier, meta) tuple of
+    _load_artifacts; without a Poisson HMM (no lambdas_) results carry no
+    HMM fields. Not thread-safe: frames are processed one at a time.
+    """
+
+    def __init__(self, detector, artifacts: Optional[tuple] = None, outputs=None, face_threshold: float = 0.9,
+                 hmm_step_s: float = 1.0, max_height: int = 480) -> None:
+        self.detector = detector
+        self.outputs = pv._pipeline_outputs(outputs)
+        self.face_threshold = float(face_threshold)
+        self.hmm_step_s = max(1e-3, float(hmm_step_s))
+        self.max_height = int(max_height)
+        self.model = self.labels = self.decoder = None
+        self.raw_multiplier = 1
+        if artifacts is not None:
+            model, labels, raw_multiplier, _meta = artifacts
+            if all(hasattr(model, a) for a in ("startprob_", "transmat_", "lambdas_")):
+                import hmm_decode
+                self.model, self.labels, self.raw_multiplier = model, list(labels), int(raw_multiplier)
+                self.decoder = hmm_decode.OnlineDecoder(model, lag=0)
+        self.frames = 0
+        self.faces = 0
+        self._last_t: Optional[float] = None
+
+    def _shrink(self, frame):
+        import cv2  # type: ignore
+
+        h, w = frame.shape[:2]
+        if self.max_height <= 0 or h <= self.max_height:
+            return frame
+        scale = self.max_height / float(h)
+        return cv2.resize(frame, (max(2, int(w * scale)), self.max_height), interpolation=cv2.INTER_AREA)
+
+    def process(self, data, t: Optional[float] = None) -> Dict[str, Any]:
+        """Analyze one frame (encoded bytes or BGR ndarray) captured/received at monotonic time `t`.
+
+        Returns {"face", "aus", "emotions", "face_score", "hmm", "timings_ms"};
+        timings_ms splits decode / detect / hmm wall time.
+        """
+        t = time.monotonic() if t is None else float(t)
+        t0 = time.perf_counter()
+        frame = decode_image(data) if isinstance(data, (bytes, bytearray, memoryview)) else data
+        if frame is None:
+            raise ValueError("could not decode frame")
+        frame = self._shrink(frame)
+        t1 = time.perf_counter()
+        df = pv._detect_frames(self.detector, [(self.frames, frame)], self.face_threshold, 1, outputs=self.outputs)
+        t2 = time.perf_counter()
+        self.frames += 1
+
+        out: Dict[str, Any] = {"face": False, "aus": {}, "emotions": {}, "face_score": None, "hmm": None}
+        if len(df) and "FaceScore" in df.columns:
+            scores = df["FaceScore"].astype(float)
+            if scores.notna().any():
+                row = df.loc[scores.idxmax()]
+                out["face"] = True
+                out["face_score"] = round(float(row["FaceScore"]), 4)
+                for c in df.columns:
+                    if not isinstance(c, str) or row[c] != row[c]:  # skip non-string labels and NaN
+                        continue
+                    if pv._OUTPUT_COLUMNS["aus"].match(c):
+                        out["aus"][c] = round(float(row[c]), 4)
+                    elif pv._OUTPUT_COLUMNS["emotions"].match(c):
+                        out["emotions"][c] = round(float(row[c]), 4)
+        if out["face"] and self.decoder is not None:
+            self.faces += 1
+            x = np.array([max(0.0, out["aus"].get(lab, 0.0)) for lab in self.labels], dtype=float)
+            step = 1.0 if self._last_t is None else (t - self._last_t) / self.hmm_step_s
+            st = self.decoder.push((self.raw_multiplier * x).astype(np.int64), step)
+            self._last_t = t
+            state = st.smoothed[-1][1] if st.smoothed else int(np.argmax(st.posteriors))
+            out["hmm"] = {"state": int(state), "posteriors": [round(float(p), 4) for p in st.posteriors]}
+        t3 = time.perf_counter()
+        out["timings_ms"] = {"decode": _ms(t1 - t0), "detect": _ms(t2 - t1), "hmm": _ms(t3 - t2)}
+        return out
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    p = argparse.ArgumentParser(description="Replay a video as a live stream and report per-frame latency.")
+    p.add_argument("--video", required=True, help="Path to input video")
+    p.add_argument("--artifacts", default="artifacts", help="HMM artifacts directory")
+    p.add_argument("--outputs", default="aus,emotions", help="Detector outputs (as in predict_video_to_csv.py)")
+    p.add_argument("--face-threshold", type=float, default=0.9, help="Face detection threshold")
+    p.add_argument("--max-height", type=int, default=480, help="Shrink frames to at most N lines before detection")
+    p.add_argument("--jpeg-quality", type=int, default=80, help="Encode frames as JPEG like a browser would")
+    p.add_argument("--seconds", type=float, default=20.0, help="Replay at most N seconds of video")
+    args = p.parse_args(argv)
+
+    import cv2  # type: ignore
+    import video_frames
+
+    video = Path(args.video)
+    if not video.exists():
+        print(f"[error] Video not found: {video}", file=sys.stderr)
+        return 2
+    try:
+        artifacts = pv._load_artifacts(Path(args.artifacts))
+    except Exception as e:
+        print(f"[warn] no HMM ({e}); reporting detector output only", file=sys.stderr)
+        artifacts = None
+    info = video_frames.probe(video)
+    session = LiveSession(pv._build_detector(args.outputs), artifacts, outputs=args.outputs,
+                          face_threshold=args.face_threshold, max_height=args.max_height)
+
+    # Frames "arrive" at the video's pace; whatever arrived during a detection except the newest is dropped
+    latencies: List[float] = []
+    dropped = 0
+    start = time.monotonic()
+    for idx, frame in video_frames.read_frames(video, stop=int(args.seconds * info.fps)):
+        arrival = start + idx / info.fps
+        now = time.monotonic()
+        if now < arrival:
+            time.sleep(arrival - now)
+        elif now >= arrival + 1.0 / info.fps:
+            dropped += 1  # a newer frame arrived before the detector was free
+            continue
+        ok, enc = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, int(args.jpeg_quality)])
+        if not ok:
+            continue
+        session.process(enc.tobytes(), arrival)
+        latencies.append(time.monotonic() - arrival)
+    if not latencies:
+        print("[error] no frames processed", file=sys.stderr)
+        return 1
+    lat = np.array(latencies) * 1000.0
+    print(f"processed={len(lat)} dropped={dropped} faces={session.faces} "
+          f"latency p50={np.percentile(lat, 50):.0f} ms p95={np.percentile(lat, 95):.0f} ms max={lat.max():.0f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
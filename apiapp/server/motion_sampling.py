@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Motion-adaptive frame sampling: spend a fixed detection budget where the picture changes.
+
+A cheap pre-pass decodes every `probe_step`-th frame, shrinks it to a small
+grayscale thumbnail and measures the mean absolute difference to the previous
+thumbnail (frame-difference energy). `allocate` then places `budget` sample
+frames at equal steps of the cumulative energy, so still passages get few
+frames and fast expression changes get many. A floor share of the budget is
+spread uniformly and `max_gap` bounds the distance between samples, so no
+passage goes unobserved.
+
+With the default budget (frame_count / skip_frames) the detector runs on as
+many frames as with fixed skip_frames sampling.
+
+Example:
+    python motion_sampling.py --video 1_video.mp4 --skip-frames 25
+"""
+from __future__ import annotations
+
+import argparse
+import sys
+from pathlib import Path
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+
+
+def _thumbnail(frame, size: int) -> np.ndarray:
+    import cv2  # type: ignore
+
+    if frame.ndim == 3:
+        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    h, w = frame.shape[:2]
+    scale = float(size) / float(max(h, w))
+    if scale < 1.0:
+        frame = cv2.resize(frame, (max(1, int(w * scale)), max(1, int(h * scale))), interpolation=cv2.INTER_AREA)
+    return frame.astype(np.float32)
+
+
+def motion_energy(frames: Iterable[Tuple[int, "object"]], frame_count: int,
+                  size: int = 64) -> np.ndarray:
+    """Per-frame motion energy (frame_count,) from (index, BGR frame) pairs in ascending order.
+
+    Each probed frame gets the mean absolute thumbnail difference to the
+    previous probed one, spread evenly over the frames in between; the
+    first probed frame gets 0.
+    """
+    energy = np.zeros(max(0, int(frame_count)), dtype=np.float64)
+    prev = None
+    prev_idx = 0
+    for idx, frame in frames:
+        thumb = _thumbnail(frame, size)
+        if prev is not None and thumb.shape == prev.shape and idx > prev_idx:
+            e = float(np.abs(thumb - prev).mean())
+            energy[prev_idx + 1:idx + 1] = e / (idx - prev_idx)
+        prev, prev_idx = thumb, int(idx)
+    return energy
+
+
+def allocate(energy: np.ndarray, budget: int, floor: float = 0.25,
+             max_gap: Optional[int] = None) -> List[int]:
+    """Pick about `budget` frame indices at equal steps of cumulative motion energy.
+
+    `floor` is the share of the budget spread uniformly over time (so a
+    static video degrades to uniform sampling); `max_gap`, if set, adds
+    frames until no two neighbouring samples are further apart. Frame 0 is
+    always sampled.
+    """
+    n = int(len(energy))
+    if n == 0 or budget <= 0:
+        return []
+    budget = min(int(budget), n)
+    e = np.clip(np.nan_to_num(np.asarray(energy, dtype=np.float64)), 0.0, None)
+    total = e.sum()
+    floor = min(1.0, max(0.0, float(floor)))
+    density = np.full(n, floor / n)
+    if total > 0:
+        density += (1.0 - floor) * e / total
+    else:
+        density = np.full(n, 1.0 / n)
+    cum = np.cumsum(density)
+    cum /= cum[-1]
+    levels = (np.arange(budget) + 0.5) / budget
+    picked = np.unique(np.searchsorted(cum, levels, side="left").clip(0, n - 1))
+    picked = sorted(set(int(i) for i in picked) | {0})
+    if max_gap is not None and int(max_gap) > 0:
+        gap = int(max_gap)
+        filled: List[int] = []
+        for idx in picked:
+            if filled:
+                prev = filled[-1]
+                filled.extend(range(prev + gap, idx, gap))
+            filled.append(idx)
+        last = filled[-1]
+        filled.extend(range(last + gap, n, gap))
+        picked = filled
+    return picked
+
+
+def sample_indices(frames: Iterable[Tuple[int, "object"]], frame_count: int, skip_frames: int,
+                   budget: Optional[int] = None, max_gap: Optional[int] = None, size: int = 64,
+                   floor: float = 0.25, stats: Optional[dict] = None) -> List[int]:
+    """Motion-adaptive replacement for video_frames.sample_indices.
+
+    `frames` are the probe frames (e.g. every few frames from
+    video_frames.read_frames_at). `budget` defaults to the number of frames
+    fixed skip_frames sampling would detect and `max_gap` to 4 * skip_frames.
+    `stats`, if given, receives motion_budget, motion_frames and motion_energy_mean.
+    """
+    step = max(1, int(skip_frames))
+    if budget is None:
+        budget = (max(0, int(frame_count)) + step - 1) // step
+    if max_gap is None:
+        max_gap = 4 * step
+    energy = motion_energy(frames, frame_count, size=size)
+    picked = allocate(energy, budget, floor=floor, max_gap=max_gap)
+    if stats is not None:
+        stats["motion_budget"] = int(budget)
+        stats["motion_frames"] = len(picked)
+        stats["motion_energy_mean"] = float(energy.mean()) if energy.size else 0.0
+    return picked
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    p = argparse.ArgumentParser(description="Show where motion-adaptive sampling would place detector frames.")
+    p.add_argument("--video", required=True, help="Path to input video")
+    p.add_argument("--skip-frames", type=int, default=25, help="Fixed sampling step the budget is matched to")
+    p.add_argument("--probe-step", type=int, default=0, help="Probe every Nth frame (0 = skip_frames // 5)")
+    p.add_argument("--max-gap", type=int, default=0, help="Largest gap between samples (0 = 4 * skip_frames)")
+    args = p.parse_args(argv)
+
+    import video_frames
+
+    video = Path(args.video)
+    if not video.exists():
+        print(f"[error] Video not found: {video}", file=sys.stderr)
+        return 2
+    info = video_frames.probe(video)
+    probe_step = args.probe_step or max(1, args.skip_frames // 5)
+    probes = video_frames.read_frames_at(video, video_frames.sample_indices(info.frame_count, probe_step))
+    stats: dict = {}
+    picked = sample_indices(probes, info.frame_count, args.skip_frames, max_gap=args.max_gap or None, stats=stats)
+    gaps = np.diff(picked) if len(picked) > 1 else np.array([0])
+    print(f"frames={info.frame_count} budget={stats['motion_budget']} sampled={len(picked)} "
+          f"gap min/median/max={gaps.min()}/{int(np.median(gaps))}/{gaps.max()}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -15,6 +15,12 @@ Example:
         --artifacts artifacts \
         --fps 25 --skip-frames 25 --face-threshold 0.95
 
+    # Detect 1500-frame chunks in 4 worker processes
+    python predict_video_to_csv.py --video 1_video.mp4 --output out.csv --workers 4 --chunk-frames 1500
+
+    # Keep raw detections; a rerun with another --face-threshold skips the detector
+    python predict_video_to_csv.py --video 1_video.mp4 --output out.csv --detection-store 1_video_detections
+
 Artifacts expected (created by FACS_HMM.ipynb):
     - artifacts/hmm_poisson.joblib
     - artifacts/meta.json           (must contain: labels, raw_data_multiplier)
@@ -28,7 +34,10 @@ from __future__ import annotations
 
 import argparse
 import json
+import re
 import sys
+import threading
+import time
 from pathlib import Path
 from typing import List, Optional
 
@@ -61,6 +70,8 @@ except Exception as _e:
 
 from joblib import load
 
+from video_frames import SEEK_MODES
+
 # py-feat
 try:
     from feat import Detector, Fex  # type: ignore
@@ -94,6 +105,1193 @@ def _load_artifacts(artifacts_dir: Path):
     return model, labels, raw_data_multiplier, meta
 
 
+# Detector heads by output group; FaceRect*/FaceScore (the face detector) are always produced
+OUTPUTS_ALL = ("aus", "emotions", "landmarks", "pose", "identity")
+
+_OUTPUT_COLUMNS = {
+    "aus": re.compile(r"^AU\d{2}(_r)?$"),
+    "emotions": re.compile(r"^(anger|disgust|fear|happiness|sadness|surprise|neutral)$"),
+    "landmarks": re.compile(r"^[xy]_\d+$"),
+    "pose": re.compile(r"^(Pitch|Roll|Yaw)$"),
+    "identity": re.compile(r"^Identity(_\d+)?$"),
+}
+
+
+def _normalize_outputs(outputs) -> tuple:
+    """Validate an outputs set ("aus,emotions" or an iterable); None means every head."""
+    if outputs is None:
+        return OUTPUTS_ALL
+    if isinstance(outputs, str):
+        outputs = [o for o in outputs.split(",")]
+    items = {str(o).strip().lower() for o in outputs if str(o).strip()}
+    if "all" in items:
+        return OUTPUTS_ALL
+    unknown = items - set(OUTPUTS_ALL)
+    if unknown:
+        raise ValueError(f"Unknown outputs: {sorted(unknown)}; expected any of {list(OUTPUTS_ALL)}")
+    return tuple(o for o in OUTPUTS_ALL if o in items)
+
+
+def _pipeline_outputs(outputs=None) -> tuple:
+    """Outputs a prediction run computes: the requested set plus AUs, which the HMM needs."""
+    outs = _normalize_outputs(outputs)
+    return outs if "aus" in outs else _normalize_outputs(outs + ("aus",))
+
+
+def _detector_config(outputs=None) -> dict:
+    """Detector kwargs that switch off the heads not needed for `outputs`."""
+    outs = set(_normalize_outputs(outputs))
+    cfg = {}
+    if "identity" not in outs:
+        cfg["identity_model"] = None
+    if "pose" not in outs:
+        cfg["facepose_model"] = None
+    if "emotions" not in outs:
+        cfg["emotion_model"] = None
+    if "aus" not in outs:
+        cfg["au_model"] = None
+    # The AU model consumes landmarks, so they are only dropped together
+    if "aus" not in outs and "landmarks" not in outs:
+        cfg["landmark_model"] = None
+    return cfg
+
+
+def _build_detector(outputs=None):
+    """Construct a py-feat Detector running only the heads needed for `outputs` (default: all).
+
+    py-feat versions that reject a None model fall back to the default model
+    set; the unwanted columns are then still dropped by _project_outputs.
+    """
+    cfg = _detector_config(outputs)
+    if cfg:
+        try:
+            return Detector(**cfg)
+        except Exception as e:
+            print(f"[warn] Detector({cfg}) failed ({e}); using the default model set", file=sys.stderr)
+    return Detector()
+
+
+def _project_outputs(df, outputs=None):
+    """Drop the columns of heads not listed in `outputs`."""
+    outs = set(_normalize_outputs(outputs))
+    pats = [pat for name, pat in _OUTPUT_COLUMNS.items() if name not in outs]
+    if not pats:
+        return df
+    drop = [c for c in df.columns if isinstance(c, str) and any(p.match(c) for p in pats)]
+    return df.drop(columns=drop) if drop else df
+
+
+# ----- Chunked detection across a process pool -----
+
+_WORKER_DETECTOR = None  # per-process warm Detector in chunk workers
+_CHUNK_BATCH_FRAMES = 50  # frames a chunk worker passes to one detect_image call; cancel is checked between
+_CHUNK_POOLS: dict = {}  # (workers, outputs) -> [pool, runs using it]
+_CHUNK_POOL_KEY = None  # key last asked for: its pool stays warm while idle
+_CHUNK_POOL_LOCK = threading.Lock()
+
+
+def _chunk_worker_init(torch_threads: int = 1, outputs=None) -> None:
+    """Process-pool initializer: pin torch threads and build this worker's Detector once."""
+    global _WORKER_DETECTOR
+    try:
+        import torch  # type: ignore
+        torch.set_num_threads(max(1, int(torch_threads)))
+    except Exception:
+        pass
+    _WORKER_DETECTOR = _build_detector(outputs)
+
+
+def _acquire_chunk_pool(workers: int, outputs=None):
+    """Return a persistent spawn-based process pool so worker Detectors stay warm between runs.
+
+    There is one pool per (worker count, Detector outputs). Each run holds its
+    pool until _release_chunk_pool, so concurrent runs with other settings never
+    shut down a pool in use; pools of older settings are retired once idle.
+    """
+    global _CHUNK_POOL_KEY
+    import multiprocessing as mp
+    from concurrent.futures import ProcessPoolExecutor
+
+    key = (workers, _normalize_outputs(outputs))
+    with _CHUNK_POOL_LOCK:
+        entry = _CHUNK_POOLS.get(key)
+        if entry is None:
+            # spawn: the parent may hold torch threads/models, which do not survive fork safely
+            pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=mp.get_context("spawn"),
+                initializer=_chunk_worker_init,
+                initargs=(1, key[1]),
+            )
+            entry = _CHUNK_POOLS[key] = [pool, 0]
+        entry[1] += 1
+        _CHUNK_POOL_KEY = key
+        _retire_idle_chunk_pools()
+        return entry[0]
+
+
+def _release_chunk_pool(pool) -> None:
+    with _CHUNK_POOL_LOCK:
+        for entry in _CHUNK_POOLS.values():
+            if entry[0] is pool:
+                entry[1] -= 1
+        _retire_idle_chunk_pools()
+
+
+def _retire_idle_chunk_pools() -> None:
+    # Called with _CHUNK_POOL_LOCK held
+    for key, (pool, users) in list(_CHUNK_POOLS.items()):
+        if users <= 0 and key != _CHUNK_POOL_KEY:
+            pool.shutdown(wait=False)
+            del _CHUNK_POOLS[key]
+
+
+def _approx_time(frame_idx: int, fps: float) -> str:
+    secs = int(frame_idx / fps) if fps > 0 else 0
+    return f"{secs // 60:02d}:{secs % 60:02d}"
+
+
+def _add_stats(stats: Optional[dict], frames: int, detect_s: float) -> None:
+    if stats is not None:
+        stats["frames"] = stats.get("frames", 0) + int(frames)
+        stats["detect_s"] = stats.get("detect_s", 0.0) + float(detect_s)
+
+
+def _merge_stats(stats: Optional[dict], part: dict) -> None:
+    """Add the numeric counters of a worker's stats (detector time, decode counts) into stats.
+
+    `*_max` gauges (queue depths) keep the maximum instead of the sum.
+    """
+    if stats is None:
+        return
+    for k, v in part.items():
+        if isinstance(v, bool) or not isinstance(v, (int, float)):
+            continue
+        if k.endswith("_max"):
+            stats[k] = max(stats.get(k, 0), v)
+        else:
+            stats[k] = stats.get(k, 0) + v
+
+
+class _WriterStage:
+    """Ordered writer stage: hands detection parts to `sink` on a background thread.
+
+    Parts are queued (at most `depth`) in the order they are submitted, so the
+    detector never waits on CSV/HMM writing unless the writer falls `depth`
+    parts behind. `finish()` drains the queue and re-raises a writer error.
+    Wall seconds go to `stats`: write_s (writing), write_wait_s (idle, waiting
+    for parts), infer_blocked_s (submitter waiting for queue space), plus
+    write_queue_max.
+    """
+
+    def __init__(self, sink, stats: Optional[dict] = None, depth: int = 4) -> None:
+        import queue
+        import threading
+
+        self.sink = sink
+        self.stats = stats if stats is not None else {}
+        self._q: "queue.Queue" = queue.Queue(maxsize=max(1, int(depth)))
+        self._error: Optional[BaseException] = None
+        self._thread = threading.Thread(target=self._run, name="rows-writer", daemon=True)
+        self._thread.start()
+
+    def _add(self, key: str, value: float) -> None:
+        self.stats[key] = self.stats.get(key, 0) + value
+
+    def _run(self) -> None:
+        while True:
+            t0 = time.perf_counter()
+            part = self._q.get()
+            self._add("write_wait_s", time.perf_counter() - t0)
+            if part is None:
+                return
+            if self._error is not None:
+                continue  # drain after a failure so submitters never block
+            t0 = time.perf_counter()
+            try:
+                self.sink(part)
+            except BaseException as e:
+                self._error = e
+            self._add("write_s", time.perf_counter() - t0)
+
+    def __call__(self, part) -> None:
+        if self._error is not None:
+            raise self._error
+        self.stats["write_queue_max"] = max(self.stats.get("write_queue_max", 0), self._q.qsize())
+        t0 = time.perf_counter()
+        self._q.put(part)
+        self._add("infer_blocked_s", time.perf_counter() - t0)
+
+    def finish(self) -> None:
+        self._q.put(None)
+        self._thread.join()
+        if self._error is not None:
+            raise self._error
+
+
+def _pipeline_summary(stats: dict) -> dict:
+    """Per-stage busy/idle seconds and queue depths of the decode -> detect -> write pipeline.
+
+    The bottleneck is the stage with the highest busy share: the others spend
+    their idle time waiting on it (decode blocked on a full queue, detection
+    waiting for frames or for the writer, the writer waiting for rows).
+    """
+    stages = {
+        "decode": (stats.get("decode_s", 0.0), stats.get("decode_blocked_s", 0.0)),
+        "detect": (stats.get("infer_s", 0.0), stats.get("infer_wait_s", 0.0) + stats.get("infer_blocked_s", 0.0)),
+        "write": (stats.get("write_s", 0.0), stats.get("write_wait_s", 0.0)),
+    }
+    out: dict = {}
+    for name, (busy, idle) in stages.items():
+        if busy + idle <= 0:
+            continue
+        out[name] = {"busy_s": round(busy, 3), "idle_s": round(idle, 3), "busy": round(busy / (busy + idle), 3)}
+    if stats.get("decode_queue_gets"):
+        out.setdefault("decode", {})["queue_mean"] = round(stats["decode_queue_sum"] / stats["decode_queue_gets"], 2)
+        out["decode"]["queue_max"] = int(stats.get("decode_queue_max", 0))
+    if "write" in out:
+        out["write"]["queue_max"] = int(stats.get("write_queue_max", 0))
+    busy = {k: v["busy"] for k, v in out.items() if "busy" in v}
+    if busy:
+        out["bottleneck"] = max(busy, key=busy.get)
+    return out
+
+
+_SCALE_LADDER = (1.0, 0.75, 0.5, 0.375, 0.25)
+_COORD_COLUMNS = re.compile(r"^(FaceRect(X|Y|Width|Height)|[xy]_\d+)$")
+
+
+class _Downscaler:
+    """Pre-detection downscale with the scale picked from the face size in the first frames.
+
+    The first `calibration_frames` frames go to the detector at full resolution;
+    the median face height there picks the smallest ladder step that keeps the
+    face at least `face_px` tall (and the short side at least `min_side`).
+    Coordinates detected on downscaled frames are mapped back by map_back().
+    """
+
+    def __init__(self, face_px: int, calibration_frames: int = 5, min_side: int = 240) -> None:
+        self.face_px = int(face_px)
+        self.calibration_frames = max(1, int(calibration_frames))
+        self.min_side = int(min_side)
+        self.scale: Optional[float] = None
+
+    def choose(self, df, frame_shape, face_threshold: float) -> float:
+        scale = 1.0
+        h = None
+        if len(df) and {"FaceRectHeight", "FaceScore"}.issubset(df.columns):
+            faces = df.loc[df["FaceScore"] >= face_threshold, "FaceRectHeight"].dropna()
+            if len(faces):
+                h = float(faces.median())
+        if h:
+            short = min(int(frame_shape[0]), int(frame_shape[1]))
+            for step in _SCALE_LADDER:
+                if h * step >= self.face_px and short * step >= self.min_side:
+                    scale = step
+        self.scale = scale
+        print(f"[predict] downscale: face height={h if h is None else round(h)}px "
+              f"frame={frame_shape[1]}x{frame_shape[0]} -> scale {scale}")
+        return scale
+
+    def resize(self, frame):
+        import cv2  # type: ignore
+        h, w = frame.shape[:2]
+        size = (max(1, int(round(w * self.scale))), max(1, int(round(h * self.scale))))
+        return cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+
+    @staticmethod
+    def map_back(df, scale: float):
+        """Scale face boxes and landmarks from detector-input to original-frame coordinates."""
+        if scale == 1.0 or not len(df):
+            return df
+        cols = [c for c in df.columns if isinstance(c, str) and _COORD_COLUMNS.match(c)]
+        if cols:
+            df[cols] = df[cols].astype(float) / scale
+        return df
+
+
+def _make_downscaler(downscale_face_px: int):
+    """_Downscaler targeting faces of `downscale_face_px` pixels (0 = off)."""
+    if not downscale_face_px or int(downscale_face_px) <= 0:
+        return None
+    return _Downscaler(int(downscale_face_px))
+
+
+def _detect_frames(detector, frames, face_threshold: float, batch_size: int = 1,
+                   outputs=None, stats: Optional[dict] = None, tracker=None,
+                   track_threshold: Optional[float] = None, downscale=None):
+    """Run py-feat on (frame_index, BGR ndarray) pairs and return a DataFrame with a `frame` column.
+
+    Frames are handed to Detector.detect_image through lossless temporary PNGs,
+    which is the input format supported across py-feat versions. Columns of
+    heads not in `outputs` are dropped; the wall time of the detect_image calls
+    is added to `stats` (process CPU would also count the decode and writer threads).
+
+    With a face_tracking.FaceTracker the face model runs on keyframes only;
+    tracked frames get the tracking confidence as FaceScore, and those below
+    `track_threshold` (default: face_threshold) are detected again in full.
+
+    With a _Downscaler, frames are resized before detection (after calibrating
+    on the first frames if needed) and coordinates are mapped back.
+    """
+    import tempfile
+    import cv2  # type: ignore
+    import pandas as pd
+
+    kw = dict(outputs=outputs, stats=stats, tracker=tracker, track_threshold=track_threshold)
+    if downscale is not None and downscale.scale is None:
+        import itertools
+        it = iter(frames)
+        head = list(itertools.islice(it, downscale.calibration_frames))
+        if not head:
+            return pd.DataFrame()
+        first = _detect_frames(detector, head, face_threshold, batch_size, **kw)
+        downscale.choose(first, head[0][1].shape,
+                         face_threshold if track_threshold is None else track_threshold)
+        if tracker is not None and downscale.scale != 1.0:
+            tracker.reset()  # boxes were tracked in full-resolution coordinates
+        rest = _detect_frames(detector, it, face_threshold, batch_size, downscale=downscale, **kw)
+        parts = [d for d in (first, rest) if len(d)]
+        return pd.concat(parts, ignore_index=True) if parts else pd.DataFrame()
+    scale = downscale.scale if downscale is not None else 1.0
+
+    with tempfile.TemporaryDirectory(prefix="feat_frames_") as tmp:
+        paths: List[str] = []
+        path_to_idx: dict = {}
+        for idx, frame in frames:
+            fp = str(Path(tmp) / f"frame_{int(idx):08d}.png")
+            if scale != 1.0:
+                frame = downscale.resize(frame)
+            cv2.imwrite(fp, frame, [cv2.IMWRITE_PNG_COMPRESSION, 1])
+            paths.append(fp)
+            path_to_idx[fp] = int(idx)
+        if not paths:
+            return pd.DataFrame()
+        t0 = time.perf_counter()
+        if tracker is None:
+            fex = detector.detect_image(
+                paths,
+                batch_size=max(1, int(batch_size)),
+                face_detection_threshold=face_threshold,
+            )
+        else:
+            # One image per call so each frame's box comes from the previous frame's landmarks
+            with tracker.attach(detector):
+                fex = detector.detect_image(paths, batch_size=1, face_detection_threshold=face_threshold)
+        _add_stats(stats, len(paths), time.perf_counter() - t0)
+        df = _map_frames(_project_outputs(_get_fex_dataframe(fex), outputs).copy(), paths, path_to_idx)
+
+        if tracker is not None:
+            df = _apply_tracking(detector, tracker, df, paths, path_to_idx, face_threshold,
+                                 face_threshold if track_threshold is None else track_threshold,
+                                 outputs, stats)
+    return _Downscaler.map_back(df, scale)
+
+
+def _map_frames(df, paths: List[str], path_to_idx: dict):
+    if "input" in df.columns and df["input"].isin(path_to_idx.keys()).all():
+        df["frame"] = df["input"].map(path_to_idx).astype(int)
+    elif len(df) == len(paths):
+        df["frame"] = [path_to_idx[p] for p in paths]
+    else:
+        raise RuntimeError("Could not map py-feat image results back to frame indices")
+    return df
+
+
+def _apply_tracking(detector, tracker, df, paths: List[str], path_to_idx: dict, face_threshold: float,
+                    track_threshold: float, outputs=None, stats: Optional[dict] = None):
+    """Stamp tracking confidence on tracked frames and re-detect the ones below track_threshold."""
+    import pandas as pd
+
+    records = tracker.take_records()
+    if len(records) != len(paths):
+        # Hooks did not line up with the images (unexpected py-feat internals): keep results as detected
+        tracker.reset()
+        return df
+    low: List[str] = []
+    for path, rec in zip(paths, records):
+        if not rec["tracked"]:
+            continue
+        conf = rec["confidence"] or 0.0
+        if "FaceScore" in df.columns:
+            df.loc[df["frame"] == path_to_idx[path], "FaceScore"] = conf
+        if conf < track_threshold:
+            low.append(path)
+    if low:
+        tracker.force_detect = True
+        try:
+            t0 = time.perf_counter()
+            with tracker.attach(detector):
+                fex = detector.detect_image(low, batch_size=1, face_detection_threshold=face_threshold)
+            _add_stats(stats, 0, time.perf_counter() - t0)
+            tracker.take_records()
+        finally:
+            tracker.force_detect = False
+        # The track now ends on an earlier frame; start the next batch from a keyframe
+        tracker.reset()
+        redo = _map_frames(_project_outputs(_get_fex_dataframe(fex), outputs).copy(), low, path_to_idx)
+        redone = set(path_to_idx[p] for p in low)
+        df = pd.concat([df[~df["frame"].isin(redone)], redo], ignore_index=True)
+        df = df.sort_values("frame", kind="stable").reset_index(drop=True)
+        if stats is not None:
+            stats["redetected"] = stats.get("redetected", 0) + len(low)
+    return df
+
+
+def _read_frames(video_path: Path, indices: List[int], seek: str = "auto", stats: Optional[dict] = None,
+                 decode_path: Optional[Path] = None):
+    """Return (frames, scale): sampled frames of video_path, decoded from the normalized
+    copy at `decode_path` when it is current, and the frame size relative to the source."""
+    import video_frames
+
+    if decode_path is not None:
+        import video_normalize
+        meta = video_normalize.current(Path(decode_path), Path(video_path))
+        if meta is not None:
+            frames = video_normalize.read_frames_at(Path(decode_path), meta, indices, seek=seek, stats=stats)
+            return frames, video_normalize.scale(meta)
+        print("[predict] normalized video missing or stale, decoding the original")
+    return video_frames.read_frames_at(Path(video_path), indices, seek=seek, stats=stats), 1.0
+
+
+def _detect_chunk(video_path: str, indices: List[int], face_threshold: float, batch_size: int = 1,
+                  outputs=None, seek: str = "auto", track_keyframes: int = 0,
+                  track_threshold: Optional[float] = None, downscale_face_px: int = 0,
+                  decode_path: Optional[str] = None, cancel=None):
+    """Pool task: detect the given frames with this worker's warm Detector.
+
+    Frames are detected in batches of _CHUNK_BATCH_FRAMES; `cancel()` (a
+    picklable token, see _chunk_cancel) is called before each one, so a
+    cancelled run also stops the chunks already running.
+    Returns (first index, rows, stats) where stats holds this worker's detector
+    time and decode counters.
+    """
+    import itertools
+    import pandas as pd
+    import video_frames
+
+    global _WORKER_DETECTOR
+    if _WORKER_DETECTOR is None:
+        _WORKER_DETECTOR = _build_detector(outputs)
+    stats: dict = {}
+    tracker = _make_tracker(track_keyframes)
+    downscale = _make_downscaler(downscale_face_px)
+    frames, pre_scale = _read_frames(Path(video_path), indices, seek, stats, decode_path)
+    flush_frames = max(_CHUNK_BATCH_FRAMES, int(batch_size))
+    frames = video_frames.prefetch(frames, _prefetch_depth(batch_size, flush_frames), metrics=stats)
+    parts = []
+    t0 = time.perf_counter()
+    try:
+        while True:
+            if cancel is not None:
+                cancel()
+            batch = list(itertools.islice(frames, flush_frames))
+            if not batch:
+                break
+            part = _detect_frames(_WORKER_DETECTOR, batch, face_threshold, batch_size, outputs=outputs,
+                                  stats=stats, tracker=tracker, track_threshold=track_threshold,
+                                  downscale=downscale)
+            if len(part):
+                parts.append(part)
+    finally:
+        frames.close()
+    # Detection time excluding the waits for decoded frames
+    stats["infer_s"] = time.perf_counter() - t0 - stats.get("infer_wait_s", 0.0)
+    df = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame()
+    df = _Downscaler.map_back(df, pre_scale)
+    if tracker is not None:
+        _merge_stats(stats, tracker.stats)
+    return indices[0], df, stats
+
+
+def _chunk_cancel(cancel):
+    """`cancel` if it can be sent to pool workers (e.g. app.utils.tasks.CancelToken), else None."""
+    if cancel is None:
+        return None
+    import pickle
+    try:
+        pickle.dumps(cancel)
+    except Exception:
+        return None
+    return cancel
+
+
+def _prefetch_depth(batch_size: int, batch_frames: int = 0) -> int:
+    """Frames the decode thread may run ahead: two model batches (or one flush batch)."""
+    return max(2 * max(1, int(batch_size)), int(batch_frames), 8)
+
+
+class _DeadlinePlan:
+    """Sampled frame indices that widen their step to finish within a wall-clock deadline.
+
+    Iterates frame indices lazily (see video_frames.read_frames_at) starting on
+    the skip_frames grid. After each detected batch `observe(indices)` updates
+    the measured cost per sampled frame (wall time since `started`, so model
+    load and decoding count too) and sets the step to the smallest one, never
+    below skip_frames, whose remaining frames still fit in the time left
+    (minus a `reserve` share kept for the HMM and writing the CSV). Frames
+    already handed out but not yet detected (the prefetch queue and the batch
+    being filled) are charged against the time left first. When time runs out
+    the iteration stops; the rest of the video is not analyzed.
+
+    `__next__` runs on the decode thread and `observe` on the detecting one,
+    so both hold a lock.
+    """
+
+    def __init__(self, frame_count: int, skip_frames: int, deadline_s: float, fps: float = 25.0,
+                 started: Optional[float] = None, reserve: float = 0.1) -> None:
+        self.frame_count = max(0, int(frame_count))
+        self.base = max(1, int(skip_frames))
+        self.step = self.base
+        self.deadline_s = float(deadline_s)
+        self.fps = float(fps) or 25.0
+        self.started = time.monotonic() if started is None else float(started)
+        self.budget = self.deadline_s * (1.0 - float(reserve))
+        self.pos = 0
+        self.yielded = 0
+        self.exhausted = False
+        self.detected: List[int] = []
+        self._lock = threading.Lock()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> int:
+        with self._lock:
+            if self.exhausted or self.pos >= self.frame_count:
+                raise StopIteration
+            if self.yielded and time.monotonic() - self.started >= self.budget:
+                self.exhausted = True
+                raise StopIteration
+            idx = self.pos
+            self.yielded += 1
+            self.pos += self.step
+            return idx
+
+    def observe(self, indices: List[int]) -> None:
+        """Account newly detected frame `indices` and re-plan the step."""
+        import math
+
+        with self._lock:
+            self.detected.extend(int(i) for i in indices)
+            if not self.detected:
+                return
+            elapsed = time.monotonic() - self.started
+            cost = elapsed / len(self.detected)
+            in_flight = max(0, self.yielded - len(self.detected))  # handed out, not yet detected
+            left = self.budget - elapsed - in_flight * cost
+            remaining = max(0, self.frame_count - self.pos)  # pos is already past the in-flight frames
+            if left <= 0:
+                # the frames already in flight use up the budget: stop sampling new ones
+                self.step = max(self.step, self.base, remaining)
+                return
+            if cost <= 0:
+                self.step = max(self.step, self.base)
+                return
+            affordable = max(1.0, left / cost)
+            self.step = max(self.base, int(math.ceil(remaining / affordable)))
+
+    def summary(self) -> dict:
+        """Sampling actually used: mean step, effective analysis rate and whether time ran out."""
+        with self._lock:
+            return self._summary()
+
+    def _summary(self) -> dict:
+        n = len(self.detected)
+        span = (self.detected[-1] - self.detected[0]) if n > 1 else 0
+        effective = span / (n - 1) if n > 1 else float(self.base)
+        return {
+            "mode": "deadline",
+            "deadline_s": self.deadline_s,
+            "skip_frames": self.base,
+            "effective_skip": round(effective, 3),
+            "effective_fps": round(self.fps / effective, 4) if effective > 0 else 0.0,
+            "final_skip": self.step,
+            "frames": n,
+            "covered_frames": min(self.frame_count, (self.detected[-1] + 1) if n else 0),
+            "frame_count": self.frame_count,
+            "exhausted": self.exhausted,
+        }
+
+
+SAMPLING_MODES = ("fixed", "motion")
+
+
+def _motion_indices(video_path: Path, frame_count: int, skip_frames: int, seek: str = "auto",
+                    decode_path: Optional[Path] = None, stats: Optional[dict] = None) -> List[int]:
+    """Motion-adaptive sample frames with the detector budget of fixed skip_frames sampling.
+
+    Probes every skip_frames // 5-th frame (from the normalized copy when
+    current) for frame-difference energy; see motion_sampling.py.
+    """
+    import motion_sampling
+    import video_frames
+
+    probe_step = max(1, int(skip_frames) // 5)
+    t0 = time.perf_counter()
+    probes, _ = _read_frames(video_path, video_frames.sample_indices(frame_count, probe_step), seek,
+                             None, decode_path)
+    info: dict = {}
+    picked = motion_sampling.sample_indices(probes, frame_count, skip_frames, stats=info)
+    info["motion_probe_step"] = probe_step
+    info["motion_probe_s"] = round(time.perf_counter() - t0, 3)
+    if stats is not None:
+        stats.update(info)
+    return picked
+
+
+def _hmm_steps(frames, step_frames: int) -> np.ndarray:
+    """Time before each row in HMM steps of `step_frames` frames, for irregularly sampled rows."""
+    f = np.asarray(frames, dtype=float)
+    steps = np.ones(len(f), dtype=float)
+    if len(f) > 1:
+        steps[1:] = np.diff(f) / float(max(1, int(step_frames)))
+    return steps
+
+
+def _make_tracker(track_keyframes: int):
+    """FaceTracker running full face detection every `track_keyframes` sampled frames (0 = off)."""
+    if not track_keyframes or int(track_keyframes) <= 1:
+        return None
+    import face_tracking
+    return face_tracking.FaceTracker(int(track_keyframes))
+
+
+def _stamp_frames(df, video_path: Path, fps: float):
+    """Fill the video-level columns detect_video would have produced for image-based results."""
+    df["input"] = str(video_path)
+    df["approx_time"] = [_approx_time(int(i), fps) for i in df["frame"]]
+    return df
+
+
+def _detect_video_chunked(video_path: Path, skip_frames: int, face_threshold: float,
+                          workers: int, chunk_frames: int, batch_size: int = 1, sink=None,
+                          indices: Optional[List[int]] = None, outputs=None, stats: Optional[dict] = None,
+                          seek: str = "auto", track_keyframes: int = 0, track_threshold: Optional[float] = None,
+                          downscale_face_px: int = 0, decode_path: Optional[Path] = None, keep: bool = True,
+                          on_part=None, cancel=None):
+    """Split the video into frame ranges, detect them in parallel and merge in frame order.
+
+    `indices` limits detection to those frames (default: every skip_frames-th frame).
+    `sink`, if given, receives each chunk's rows as soon as all earlier chunks are done.
+    `decode_path` is a video_normalize copy to decode frames from (coordinates stay in source pixels).
+    With keep=False rows are only handed to `sink` and dropped once written.
+    `on_part(rows, frames)` is called as soon as any chunk completes (checkpointing).
+    `cancel()` is called while waiting for chunks; when it raises, chunks not
+    started yet are dropped and the error propagates. Running chunks get
+    `cancel` too when it pickles and stop at their next batch.
+    Returns an empty DataFrame when nothing was detected (or keep=False).
+    """
+    import pandas as pd
+    from concurrent.futures import FIRST_COMPLETED, wait
+    import video_frames
+
+    info = video_frames.probe(video_path)
+    if indices is None:
+        indices = video_frames.sample_indices(info.frame_count, skip_frames)
+    ranges = video_frames.frame_ranges(info.frame_count, chunk_frames, skip_frames)
+    chunks = [[i for i in indices if s <= i < e] for s, e in ranges]
+    chunks = [c for c in chunks if c]
+    print(f"[predict] chunked detection: frames={len(indices)}/{info.frame_count} chunks={len(chunks)} workers={workers}")
+    if not chunks:
+        return pd.DataFrame()
+    pool = _acquire_chunk_pool(workers, outputs)
+    chunk_cancel = _chunk_cancel(cancel)
+    writer = _WriterStage(sink, stats) if sink is not None else None
+    done: dict = {}
+    order = [c[0] for c in chunks]
+    by_start = {c[0]: c for c in chunks}
+    next_pos = 0
+    pending: set = set()
+    try:
+        pending = {
+            pool.submit(_detect_chunk, str(video_path), c, face_threshold, batch_size, outputs, seek,
+                        track_keyframes, track_threshold, downscale_face_px,
+                        None if decode_path is None else str(decode_path), chunk_cancel)
+            for c in chunks
+        }
+        while pending:
+            if cancel is not None:
+                cancel()
+            finished, pending = wait(pending, timeout=0.5, return_when=FIRST_COMPLETED)
+            for fut in finished:
+                start, part, part_stats = fut.result()
+                _merge_stats(stats, part_stats)
+                done[start] = _stamp_frames(part, video_path, info.fps) if len(part) else part
+                if on_part is not None:
+                    on_part(done[start], by_start[start])
+            # Release chunks to the writer strictly in frame order
+            while next_pos < len(order) and order[next_pos] in done:
+                ready = done[order[next_pos]]
+                if writer is not None and len(ready):
+                    writer(ready)
+                if not keep:
+                    done[order[next_pos]] = ready.iloc[0:0]
+                next_pos += 1
+    except BaseException:
+        for fut in pending:
+            fut.cancel()
+        raise
+    finally:
+        _release_chunk_pool(pool)
+        if writer is not None:
+            writer.finish()
+    frames = [done[s] for s in order if len(done[s])]
+    if not frames:
+        return pd.DataFrame()
+    df = pd.concat(frames, ignore_index=True)
+    return df.sort_values("frame", kind="stable").reset_index(drop=True)
+
+
+def _detect_video_batched(detector, video_path: Path, skip_frames: int, face_threshold: float,
+                          batch_frames: int = 25, sink=None, indices: Optional[List[int]] = None,
+                          outputs=None, stats: Optional[dict] = None, seek: str = "auto",
+                          track_keyframes: int = 0, track_threshold: Optional[float] = None,
+                          downscale_face_px: int = 0, decode_path: Optional[Path] = None,
+                          batch_size: int = 1, keep: bool = True, on_part=None,
+                          deadline: Optional[_DeadlinePlan] = None, cancel=None):
+    """Serial detection in batches of sampled frames, handing each batch to `sink` when done.
+
+    Runs as a three-stage pipeline: a decode thread keeps a bounded queue of
+    upcoming frames filled, this thread detects each flush of `batch_frames`
+    frames (in model batches of `batch_size` images), and a writer thread hands
+    the parts to `sink` in order. Queues bound memory; per-stage busy/idle
+    times land in `stats` (see _pipeline_summary).
+    Frames are decoded from `decode_path` (a video_normalize copy) when it is current.
+    With keep=False rows are only handed to `sink`, not collected.
+    `on_part(rows, frames)` is called after each batch (checkpointing).
+    With `deadline` (a _DeadlinePlan) frames are sampled from the plan, which is
+    told after each batch how many frames were detected.
+    `cancel()` is called before each decoded frame is queued for detection;
+    when it raises, detection stops there and the error propagates.
+
+    Returns an empty DataFrame when nothing was detected (or keep=False).
+    """
+    import pandas as pd
+    import video_frames
+
+    info = video_frames.probe(video_path)
+    if deadline is not None:
+        indices = deadline
+    elif indices is None:
+        indices = video_frames.sample_indices(info.frame_count, skip_frames)
+    parts = []
+    batch: list = []
+    tracker = _make_tracker(track_keyframes)
+    downscale = _make_downscaler(downscale_face_px)
+    frames, pre_scale = _read_frames(video_path, indices, seek, stats, decode_path)
+    flush_frames = max(1, int(batch_frames), int(batch_size))
+    metrics = stats if stats is not None else {}
+    frames = video_frames.prefetch(frames, _prefetch_depth(batch_size, flush_frames), metrics=metrics)
+    writer = _WriterStage(sink, metrics) if sink is not None else None
+
+    def _flush() -> None:
+        if not batch:
+            return
+        t0 = time.perf_counter()
+        part = _detect_frames(detector, batch, face_threshold, batch_size, outputs=outputs, stats=stats,
+                              tracker=tracker, track_threshold=track_threshold, downscale=downscale)
+        part = _Downscaler.map_back(part, pre_scale)
+        metrics["infer_s"] = metrics.get("infer_s", 0.0) + time.perf_counter() - t0
+        covered = [i for i, _ in batch]
+        batch.clear()
+        if len(part):
+            part = _stamp_frames(part, video_path, info.fps)
+        if on_part is not None:
+            on_part(part, covered)
+        if deadline is not None:
+            deadline.observe(covered)
+        if len(part):
+            if keep:
+                parts.append(part)
+            if writer is not None:
+                writer(part)
+
+    try:
+        for idx, frame in frames:
+            if cancel is not None:
+                cancel()
+            batch.append((idx, frame))
+            if len(batch) >= flush_frames:
+                _flush()
+        _flush()
+    finally:
+        frames.close()
+        if writer is not None:
+            writer.finish()
+    if tracker is not None:
+        _merge_stats(stats, tracker.stats)
+    if not parts:
+        return pd.DataFrame()
+    return pd.concat(parts, ignore_index=True)
+
+
+# ----- Per-session store of raw detector outputs -----
+
+_STORE_DROP_PREFIXES = ("Identity_",)  # 512-d embeddings: not used downstream, ~70% of the row
+_STORE_DROP_COLUMNS = ("input", "approx_time")  # re-stamped on load
+
+
+def _video_signature(video_path: Path) -> dict:
+    st = Path(video_path).stat()
+    return {"size": int(st.st_size), "mtime_ns": int(st.st_mtime_ns)}
+
+
+def _load_detection_store(store_dir: Path, video_path: Path, detect_threshold: float, outputs=None,
+                          detect_params: Optional[dict] = None):
+    """Return (raw rows, set of sampled frames, stored outputs) from a detection store,
+    or (None, empty set, None).
+
+    The store is ignored when it belongs to another version of the video, was
+    detected with a stricter threshold than `detect_threshold` (its rows would
+    be missing faces the caller wants), lacks some of the requested `outputs`
+    or was detected with other `detect_params` (tracking, downscale).
+    """
+    import column_store
+
+    if store_dir is None or not column_store.exists(store_dir):
+        return None, set(), None
+    try:
+        meta = column_store.read_meta(store_dir).get("meta", {})
+        if meta.get("video") != _video_signature(video_path):
+            print("[predict] detection store: video changed, re-detecting")
+            return None, set(), None
+        if float(meta.get("detect_threshold", 1.0)) > float(detect_threshold) + 1e-9:
+            print("[predict] detection store: stored threshold", meta.get("detect_threshold"),
+                  "is stricter than", detect_threshold, "- re-detecting")
+            return None, set(), None
+        stored_outputs = _normalize_outputs(meta.get("outputs"))
+        missing_outputs = set(_normalize_outputs(outputs)) - set(stored_outputs)
+        if missing_outputs:
+            print("[predict] detection store: lacks outputs", sorted(missing_outputs), "- re-detecting")
+            return None, set(), None
+        if meta.get("detect_params", {}) != (detect_params or {}):
+            print("[predict] detection store: detection parameters changed, re-detecting")
+            return None, set(), None
+        df = column_store.read(store_dir)
+        df["frame"] = df["frame"].astype(np.int64)
+        sampled = set(int(i) for i in column_store.read_array(store_dir, "sampled"))
+        return df, sampled, stored_outputs
+    except Exception as e:
+        print("[predict] detection store unreadable, re-detecting:", e, file=sys.stderr)
+        return None, set(), None
+
+
+def _save_detection_store(store_dir: Path, raw, sampled, video_path: Path, detect_threshold: float,
+                          outputs=None, detect_params: Optional[dict] = None) -> bool:
+    import column_store
+
+    try:
+        column_store.write(
+            store_dir, raw,
+            meta={"video": _video_signature(video_path), "detect_threshold": float(detect_threshold),
+                  "outputs": list(_normalize_outputs(outputs)), "detect_params": detect_params or {}},
+            arrays={"sampled": np.array(sorted(sampled), dtype=np.int64)},
+        )
+        return True
+    except Exception as e:
+        print("[predict] could not save detection store:", e, file=sys.stderr)
+        return False
+
+
+def _store_columns(df):
+    keep = [c for c in df.columns
+            if not (isinstance(c, str) and (c.startswith(_STORE_DROP_PREFIXES) or c in _STORE_DROP_COLUMNS))]
+    return df[keep]
+
+
+def _filter_faces(df, face_threshold: float):
+    """Keep faces with FaceScore >= face_threshold; frames left without a face keep one empty row,
+    as detect_video reports them."""
+    import pandas as pd
+
+    if "FaceScore" not in df.columns or not len(df):
+        return df
+    kept = df[df["FaceScore"] >= face_threshold]
+    lost = sorted(set(df["frame"].astype(int)) - set(kept["frame"].astype(int)))
+    if lost:
+        blank = pd.DataFrame({"frame": lost}).reindex(columns=df.columns)
+        blank["frame"] = lost
+        kept = pd.concat([kept, blank], ignore_index=True)
+    return kept.sort_values("frame", kind="stable").reset_index(drop=True)
+
+
+def checkpoint_dir(store_dir: Path) -> Path:
+    """Journal of detections not yet merged into the store at `store_dir`."""
+    return Path(store_dir).with_name(f"{Path(store_dir).name}.ckpt")
+
+
+class _Checkpoint:
+    """Journal of detected batches/chunks, written as each one completes.
+
+    A run that dies before the detection store is saved leaves its finished
+    work here; the next run with the same video and detection parameters
+    (`meta`) loads it and detects only the remaining frames. A journal with
+    other parameters is discarded.
+    """
+
+    def __init__(self, directory: Path, meta: dict) -> None:
+        import shutil
+
+        self.dir = Path(directory)
+        self.meta = meta
+        try:
+            same = json.loads((self.dir / "meta.json").read_text(encoding="utf-8")) == meta
+        except (OSError, ValueError):
+            same = False
+        if not same:
+            shutil.rmtree(self.dir, ignore_errors=True)
+            self.dir.mkdir(parents=True)
+            (self.dir / "meta.json").write_text(json.dumps(meta), encoding="utf-8")
+        self._n = len(list(self.dir.glob("part_*.pkl")))
+
+    def load(self):
+        """(rows or None, set of frames covered) journaled so far."""
+        import pandas as pd
+
+        rows, frames = [], set()
+        for path in sorted(self.dir.glob("part_*.pkl")):
+            try:
+                part, covered = pd.read_pickle(path)
+            except Exception:
+                continue  # torn write of the last part
+            frames.update(int(i) for i in covered)
+            if len(part):
+                rows.append(part)
+        return (pd.concat(rows, ignore_index=True) if rows else None), frames
+
+    def add(self, part, frames) -> None:
+        import os
+        import pandas as pd
+
+        path = self.dir / f"part_{self._n:06d}.pkl"
+        tmp = path.with_suffix(".tmp")
+        pd.to_pickle((_store_columns(part) if len(part) else part, [int(i) for i in frames]), tmp)
+        os.replace(tmp, path)
+        self._n += 1
+
+    def clear(self) -> None:
+        import shutil
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+
+def _detect_with_store(store_dir: Path, video_path: Path, skip_frames: int, face_threshold: float,
+                       store_threshold: float, detector=None, workers: int = 1, chunk_frames: int = 1500,
+                       batch_frames: int = 25, sink=None, outputs=None, stats: Optional[dict] = None,
+                       seek: str = "auto", track_keyframes: int = 0, downscale_face_px: int = 0,
+                       decode_path: Optional[Path] = None, batch_size: int = 1,
+                       indices: Optional[List[int]] = None, cancel=None):
+    """Detection backed by the per-session store: run py-feat only on frames never sampled before.
+
+    Raw rows are kept down to min(face_threshold, store_threshold), so a later
+    run with a different face_threshold or skip_frames on the same grid only
+    filters/selects stored rows. New frames are detected with `outputs` only;
+    the store then keeps the outputs common to all of its rows.
+
+    Batches/chunks are journaled to checkpoint_dir(store_dir) as they finish,
+    so an interrupted (or cancelled) run resumes from there instead of detecting them again.
+    `indices` replaces the skip_frames grid (e.g. motion-adaptive sampling).
+    """
+    import pandas as pd
+    import video_frames
+
+    info = video_frames.probe(video_path)
+    wanted = list(indices) if indices is not None else video_frames.sample_indices(info.frame_count, skip_frames)
+    detect_threshold = min(float(face_threshold), float(store_threshold))
+    detect_params = {"track_keyframes": int(track_keyframes), "downscale_face_px": int(downscale_face_px)}
+    if decode_path is not None:
+        import video_normalize
+        meta = video_normalize.current(Path(decode_path), video_path)
+        if meta is not None:
+            # Rows detected on the normalized copy differ slightly from full-resolution ones
+            detect_params["normalized"] = {"fps": meta["fps"], "height": meta["height"]}
+        else:
+            decode_path = None
+    raw, sampled, stored_outputs = _load_detection_store(store_dir, video_path, detect_threshold, outputs,
+                                                         detect_params)
+    ckpt = _Checkpoint(checkpoint_dir(store_dir), {
+        "video": _video_signature(video_path), "detect_threshold": detect_threshold,
+        "outputs": list(_normalize_outputs(outputs)), "detect_params": detect_params,
+    })
+    resumed, resumed_frames = ckpt.load()
+    missing = [i for i in wanted if i not in sampled and i not in resumed_frames]
+    print(f"[predict] detection store: wanted={len(wanted)} cached={len(wanted) - len(missing)} missing={len(missing)}"
+          + (f" (resumed {len(resumed_frames)} frames from checkpoint)" if resumed_frames else ""))
+
+    # Rows can only be streamed in frame order when nothing is served from the store
+    stream = None
+    if sink is not None and len(missing) == len(wanted):
+        stream = lambda part: sink(_filter_faces(part, face_threshold))  # noqa: E731
+
+    fresh = pd.DataFrame()
+    if missing:
+        if workers > 1:
+            fresh = _detect_video_chunked(
+                video_path, skip_frames=skip_frames, face_threshold=detect_threshold,
+                workers=workers, chunk_frames=chunk_frames, batch_size=batch_size, sink=stream, indices=missing,
+                outputs=outputs, stats=stats, seek=seek,
+                track_keyframes=track_keyframes, track_threshold=face_threshold,
+                downscale_face_px=downscale_face_px, decode_path=decode_path, on_part=ckpt.add,
+                cancel=cancel,
+            )
+        else:
+            if detector is None:
+                detector = _build_detector(outputs)
+            fresh = _detect_video_batched(
+                detector, video_path, skip_frames=skip_frames, face_threshold=detect_threshold,
+                batch_frames=batch_frames, sink=stream, indices=missing, outputs=outputs, stats=stats,
+                seek=seek, track_keyframes=track_keyframes, track_threshold=face_threshold,
+                downscale_face_px=downscale_face_px, decode_path=decode_path, batch_size=batch_size,
+                on_part=ckpt.add, cancel=cancel,
+            )
+    if missing or resumed_frames:
+        if resumed is not None:
+            fresh = pd.concat([resumed, fresh], ignore_index=True) if len(fresh) else resumed
+        if raw is not None:
+            # Keep the store homogeneous: only outputs every row has
+            kept = [o for o in stored_outputs if o in _normalize_outputs(outputs)]
+            raw = _project_outputs(raw, kept)
+            stored_outputs = tuple(kept)
+        else:
+            stored_outputs = _normalize_outputs(outputs)
+        if len(fresh):
+            fresh = _store_columns(fresh)
+            raw = fresh if raw is None else pd.concat([raw, fresh], ignore_index=True)
+        sampled.update(missing)
+        sampled.update(resumed_frames)
+        saved = True
+        if raw is not None:
+            raw = raw.sort_values("frame", kind="stable").reset_index(drop=True)
+            saved = _save_detection_store(store_dir, raw, sampled, video_path, detect_threshold, stored_outputs,
+                                          detect_params)
+        if saved:
+            ckpt.clear()  # merged into the store
+    else:
+        ckpt.clear()
+
+    if raw is None or not len(raw):
+        return pd.DataFrame()
+    df = _project_outputs(raw[raw["frame"].isin(set(wanted))], outputs).reset_index(drop=True)
+    df = _stamp_frames(_filter_faces(df, face_threshold), video_path, info.fps)
+    if sink is not None and stream is None and len(df):
+        sink(df)
+    return df
+
+
+class _RowStreamWriter:
+    """Append detection rows to a sidecar CSV in flushed batches.
+
+    The header is fixed by the first batch; `rows` only counts rows that are
+    flushed to disk, so readers may safely read that many data rows.
+    """
+
+    def __init__(self, path: Path, on_rows=None) -> None:
+        self.path = Path(path)
+        self.on_rows = on_rows
+        self.columns: Optional[list] = None
+        self.rows = 0
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        if self.path.exists():
+            self.path.unlink()
+
+    def __call__(self, df) -> None:
+        import os
+        first = self.columns is None
+        if first:
+            self.columns = list(df.columns)
+        else:
+            df = df.reindex(columns=self.columns)
+        with open(self.path, "a", encoding="utf-8", newline="") as f:
+            df.to_csv(f, header=first, index=False)
+            f.flush()
+            os.fsync(f.fileno())
+        self.rows += len(df)
+        if callable(self.on_rows):
+            try:
+                self.on_rows(self.rows)
+            except Exception:
+                pass
+
+
+class _OnlineHmmSink:
+    """Add online HMM columns to streamed detection rows before writing them.
+
+    Rows are held back until their fixed-lag Viterbi state is final (at most
+    `lag` rows), so every streamed row carries HMM_state, HMM_AUexp_* and the
+    *filtered* HMM_p_state_* posteriors. The final CSV is still decoded offline.
+    With `step_frames` rows are irregularly sampled and each one advances the
+    decoder by its frame gap in steps of that many frames.
+    """
+
+    def __init__(self, writer, model, labels: List[str], raw_multiplier: int,
+                 lag: int = 5, write_lambda_aus: bool = True, step_frames: Optional[int] = None) -> None:
+        import hmm_decode
+
+        self.writer = writer
+        self.model = model
+        self.labels = list(labels)
+        self.raw_multiplier = raw_multiplier
+        self.write_lambda_aus = write_lambda_aus and hasattr(model, "lambdas_")
+        self.decoder = hmm_decode.OnlineDecoder(model, lag=lag)
+        self._pending = None        # DataFrame of rows not written yet
+        self._posteriors: list = []  # filtered posteriors of pending rows
+        self._states: dict = {}      # row index -> smoothed state
+        self._written = 0
+        self.step_frames = step_frames
+        self._last_frame: Optional[float] = None
+
+    @property
+    def rows(self) -> int:
+        return self.writer.rows
+
+    def __call__(self, df) -> None:
+        import pandas as pd
+
+        aus = _extract_aus_df(df, prefer_labels=self.labels).reindex(columns=self.labels, fill_value=0.0)
+        # Offline decoding shifts by the global AU minimum; online the minimum is unknown,
+        # so negative/missing intensities are clipped to 0 instead
+        values = np.nan_to_num(aus.values.astype(float), nan=0.0).clip(min=0.0)
+        X = (self.raw_multiplier * values).astype(np.int64)
+        steps = np.ones(len(X))
+        if self.step_frames and "frame" in df.columns:
+            frames = df["frame"].to_numpy(dtype=float)
+            prev = frames[0] if self._last_frame is None else self._last_frame
+            steps = np.diff(np.concatenate([[prev], frames])) / float(self.step_frames)
+            self._last_frame = float(frames[-1])
+        for x, step in zip(X, steps):
+            st = self.decoder.push(x, step)
+            self._posteriors.append(st.posteriors)
+            self._states.update(dict(st.smoothed))
+        df = df.reset_index(drop=True)
+        self._pending = df if self._pending is None else pd.concat([self._pending, df], ignore_index=True)
+        self._write_ready()
+
+    def close(self) -> None:
+        self._states.update(dict(self.decoder.flush()))
+        self._write_ready()
+
+    def _write_ready(self) -> None:
+        n = 0
+        while (self._written + n) in self._states:
+            n += 1
+        if n == 0 or self._pending is None:
+            return
+        part = self._pending.iloc[:n].copy()
+        self._pending = self._pending.iloc[n:].reset_index(drop=True)
+        states = np.array([self._states.pop(self._written + i) for i in range(n)], dtype=np.int64)
+        post = np.vstack(self._posteriors[:n])
+        del self._posteriors[:n]
+        part["HMM_state"] = states
+        if self.write_lambda_aus:
+            est = self.model.lambdas_[states].astype(float) / float(self.raw_multiplier)
+            for i, lab in enumerate(self.labels):
+                part[f"HMM_AUexp_{lab}"] = est[:, i]
+        for i in range(post.shape[1]):
+            part[f"HMM_p_state_{i}"] = post[:, i]
+        self._written += n
+        self.writer(part)
+
+
 def _get_fex_dataframe(fex: Fex):
     """Obtain a pandas DataFrame from a Fex while remaining robust to py-feat versions."""
     import pandas as pd  # local import to keep import-time fast if unused
@@ -158,8 +1356,13 @@ def _extract_aus_df(fex: Fex, prefer_labels: Optional[List[str]] = None):
     return aus_df
 
 
-def _predict_states(model, aus_df, raw_multiplier: int):
-    """Convert AU DF to integer matrix X and predict HMM states and probs."""
+def _predict_states(model, aus_df, raw_multiplier: int, posteriors: bool = True, steps=None):
+    """Convert AU DF to integer matrix X and predict HMM states and probs.
+
+    Uses the fused single-pass decoder from hmm_decode.py for Poisson HMMs and
+    falls back to hmmlearn's predict/predict_proba for other models. `steps`
+    (see _hmm_steps) makes the Poisson decoder account for irregular gaps.
+    """
     # Ensure non-negative values as in the notebook: X = int(raw_mult * (obs - min(obs)))
     values = aus_df.values.astype(float)
     if values.size == 0:
@@ -169,45 +1372,460 @@ def _predict_states(model, aus_df, raw_multiplier: int):
     if np.isfinite(min_val) and min_val < 0:
         shift = -min_val
     X = (raw_multiplier * (values + shift)).astype(np.int64)
+    states, proba = _decode_states(model, X, posteriors, steps=steps)
+    return states, proba, X
 
-    # HMM predictions
+
+def _decode_states(model, X, posteriors: bool = True, steps=None):
+    """HMM states and state posteriors (or None) for the integer observation matrix X.
+
+    `steps` only applies to the fused Poisson decoder; hmmlearn models assume regular sampling.
+    """
+    if all(hasattr(model, a) for a in ("startprob_", "transmat_", "lambdas_")):
+        import hmm_decode
+        res = hmm_decode.decode(model, X, posteriors=posteriors, steps=steps)
+        return res.states, res.posteriors
+    X = np.asarray(X)
     states = model.predict(X)
     proba = None
-    if hasattr(model, "predict_proba"):
+    if posteriors and hasattr(model, "predict_proba"):
         try:
             proba = model.predict_proba(X)
         except Exception:
             proba = None
-    return states, proba, X
+    return states, proba
+
+
+class _SpillSink:
+    """Memory-bounded mode: detection parts go to disk as they arrive instead of being kept.
+
+    Each part is pickled to `directory`, and its AU columns (aligned to the HMM
+    labels) are appended to a raw float64 file read back as a memory map, so
+    the HMM decode never needs the whole table. Parts are passed on to
+    `forward` (e.g. the streaming CSV writer) unchanged.
+    """
+
+    def __init__(self, directory: Path, labels: List[str], forward=None) -> None:
+        import shutil
+
+        self.dir = Path(directory)
+        if self.dir.exists():
+            shutil.rmtree(self.dir)
+        self.dir.mkdir(parents=True)
+        self.labels = list(labels)
+        self.forward = forward
+        self.parts: List[Path] = []
+        self.columns: Optional[list] = None
+        self.rows = 0
+        self.au_min = np.inf
+        self._aus = open(self.dir / "aus.f64", "wb")
+        self._frames = open(self.dir / "frames.f64", "wb")
+
+    def __call__(self, df) -> None:
+        if self.columns is None:
+            self.columns = list(df.columns)
+        else:
+            df = df.reindex(columns=self.columns)
+        df = df.reset_index(drop=True)
+        path = self.dir / f"part_{len(self.parts):06d}.pkl"
+        df.to_pickle(path)
+        self.parts.append(path)
+        values = _extract_aus_df(df, prefer_labels=self.labels).reindex(
+            columns=self.labels, fill_value=0.0).values.astype(np.float64)
+        finite = values[np.isfinite(values)]
+        if finite.size:
+            self.au_min = min(self.au_min, float(finite.min()))
+        values.tofile(self._aus)
+        frames = df["frame"] if "frame" in df.columns else np.arange(self.rows, self.rows + len(df))
+        np.asarray(frames, dtype=np.float64).tofile(self._frames)
+        self.rows += len(df)
+        if self.forward is not None:
+            self.forward(df)
+
+    def close(self) -> None:
+        for f in (self._aus, self._frames):
+            if not f.closed:
+                f.close()
+        if hasattr(self.forward, "close"):
+            self.forward.close()
+
+    def aus(self) -> np.ndarray:
+        return np.memmap(self.dir / "aus.f64", dtype=np.float64, mode="r", shape=(self.rows, len(self.labels)))
+
+    def frames(self) -> np.ndarray:
+        return np.memmap(self.dir / "frames.f64", dtype=np.float64, mode="r", shape=(self.rows,))
+
+    def iter_parts(self):
+        import pandas as pd
+        for path in self.parts:
+            yield pd.read_pickle(path)
+
+    def cleanup(self) -> None:
+        import shutil
+        for f in (self._aus, self._frames):
+            if not f.closed:
+                f.close()
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+
+def _predict_states_spilled(model, spill: _SpillSink, raw_multiplier: int, posteriors: bool = True,
+                            chunk_rows: int = 65536, step_frames: Optional[int] = None):
+    """_predict_states over the spilled AU matrix: X is built chunk-wise into a memory-mapped .npy.
+
+    With `step_frames` the decoder accounts for irregular gaps between the spilled frames.
+    """
+    if spill.rows == 0:
+        raise ValueError("Empty AU matrix for HMM prediction")
+    shift = -spill.au_min if np.isfinite(spill.au_min) and spill.au_min < 0 else 0.0
+    aus = spill.aus()
+    X = np.lib.format.open_memmap(spill.dir / "x.npy", mode="w+", dtype=np.int64, shape=aus.shape)
+    for s in range(0, spill.rows, chunk_rows):
+        X[s:s + chunk_rows] = (raw_multiplier * (aus[s:s + chunk_rows] + shift)).astype(np.int64)
+    X.flush()
+    steps = _hmm_steps(spill.frames(), step_frames) if step_frames else None
+    return _decode_states(model, X, posteriors, steps=steps)
+
+
+def _write_spilled(spill: _SpillSink, output_csv: Path, model, labels: List[str], raw_multiplier: int,
+                   states, proba, write_lambda_aus: bool = True, meta: Optional[dict] = None) -> Path:
+    """Write the CSV and its column store part by part, adding the HMM columns to each slice."""
+    import os
+    import column_store
+
+    est = None
+    if write_lambda_aus and hasattr(model, "lambdas_") and model.lambdas_.shape[1] == len(labels):
+        est = model.lambdas_.astype(float) / float(raw_multiplier)  # per state; indexed per part
+    tmp_csv = output_csv.with_name(f"{output_csv.name}.tmp{os.getpid()}")
+    store = column_store.StoreWriter(column_store.sidecar(output_csv), spill.rows, meta=meta)
+    offset = 0
+    with open(tmp_csv, "w", encoding="utf-8", newline="") as f:
+        for part in spill.iter_parts():
+            n = len(part)
+            part_states = np.asarray(states[offset:offset + n])
+            part["HMM_state"] = part_states
+            if est is not None:
+                for i, lab in enumerate(labels):
+                    part[f"HMM_AUexp_{lab}"] = est[part_states, i]
+            if proba is not None:
+                for i in range(proba.shape[1]):
+                    part[f"HMM_p_state_{i}"] = proba[offset:offset + n, i]
+            part.to_csv(f, header=(offset == 0), index=False)
+            store.append(part)
+            offset += n
+    os.replace(tmp_csv, output_csv)
+    try:
+        store.close()
+    except Exception as e:
+        print("[warn] could not write columnar output:", e, file=sys.stderr)
+    return output_csv
+
+
+def _replace_csv(output_csv: Path, write) -> None:
+    """Call write(path) on a temp file next to output_csv, then rename it over output_csv.
+
+    output_csv may be a hardlink to a result cache entry (see app/utils/result_cache.py);
+    rewriting it in place would change the cached copy of another run too.
+    """
+    import os
+
+    tmp = output_csv.with_name(f"{output_csv.name}.tmp{os.getpid()}")
+    try:
+        write(tmp)
+        os.replace(tmp, output_csv)
+    finally:
+        tmp.unlink(missing_ok=True)
+
+
+def _write_columnar(prediction, output_csv: Path, meta: Optional[dict] = None) -> None:
+    """Write the typed column-group store next to the CSV (see column_store.py); readers prefer it.
+
+    `meta` is stored with it (read back with column_store.read_meta(...)["meta"]).
+    """
+    import column_store
+
+    try:
+        df = prediction if not isinstance(prediction, Fex) else _get_fex_dataframe(prediction)
+        column_store.write(column_store.sidecar(output_csv), df, meta=meta)
+    except Exception as e:
+        print("[warn] could not write columnar output:", e, file=sys.stderr)
 
 
 def run(video_path: Path, output_csv: Path, artifacts_dir: Path,
         fps: int = 25, skip_frames: int = 25, face_threshold: float = 0.95,
-        write_lambda_aus: bool = True) -> Path:
-    """Run detection + HMM prediction and save CSV. Returns output path."""
+        write_lambda_aus: bool = True, write_posteriors: bool = True, detector=None, artifacts=None,
+        workers: int = 1, chunk_frames: int = 1500,
+        stream_csv: Optional[Path] = None, stream_batch_frames: int = 25, on_rows=None,
+        stream_hmm_lag: Optional[int] = 5,
+        detection_store: Optional[Path] = None, store_threshold: float = 0.5,
+        outputs=None, on_detect_stats=None, sampler: str = "auto", track_keyframes: int = 0,
+        downscale_face_px: int = 0, decode_path: Optional[Path] = None, batch_size: int = 1,
+        spill_dir: Optional[Path] = None, spill_min_frames: int = 0,
+        deadline_s: Optional[float] = None, sampling: str = "fixed", cancel=None) -> Path:
+    """Run detection + HMM prediction and save CSV. Returns output path.
+
+    A column-group binary copy of the table is written next to the CSV
+    (`column_store.sidecar(output_csv)`); the CSV is kept as the export format.
+
+    `detector` and `artifacts` (the tuple returned by `_load_artifacts`) may be
+    passed in by long-lived callers that keep models warm between runs; when
+    omitted they are built/loaded here as before.
+
+    With workers > 1 the video is split into ranges of `chunk_frames` frames that
+    are detected in a pool of worker processes, each holding its own Detector.
+
+    With `stream_csv` set, detection rows are appended to that sidecar CSV in
+    flushed batches while the video is still being processed; `on_rows(n)`
+    reports the rows flushed so far. Unless `stream_hmm_lag` is None, streamed
+    rows also carry online HMM columns and trail detection by that many rows.
+
+    With `detection_store` set, raw per-frame detector outputs are persisted in
+    that directory (see column_store.py) and reused by later runs: changing
+    face_threshold, the HMM artifacts or skip_frames only re-detects frames that
+    were never sampled. Faces are kept down to min(face_threshold, store_threshold).
+
+    `outputs` selects the Detector heads to run (see OUTPUTS_ALL; default: all).
+    AUs are always included since the HMM needs them. `on_detect_stats(stats)`
+    receives {"frames", "detect_s", "outputs"} (plus decode counters) for the frames
+    detected in this run.
+
+    `sampler` picks how sampled frames are decoded: "auto"/"seek"/"grab" read
+    only the sampled frames through video_frames.read_frames_at (seeking over
+    long gaps so decode cost follows the number of analyzed frames), "feat"
+    keeps py-feat's detect_video (sequential decode of the whole file) for
+    the plain serial path.
+
+    With `track_keyframes` > 1 (frame samplers only) the face model runs on
+    every `track_keyframes`-th sampled frame; in between the face box follows
+    the landmarks (see face_tracking.py) and frames whose tracking confidence
+    falls below face_threshold are detected again in full.
+
+    With `downscale_face_px` > 0 (frame samplers only) frames are downscaled
+    before detection to the smallest step of a fixed ladder that keeps faces,
+    as measured on the first frames, at least that many pixels tall. FaceRect*
+    and x_*/y_* are mapped back to original-frame coordinates.
+
+    `decode_path` points to a normalized copy of the video written by
+    video_normalize.py; frame samplers decode from it while it matches the
+    current video (frame indices and coordinates stay those of the original).
+
+    `batch_size` is the number of frames per Detector model call on the frame
+    sampler paths (face tracking forces 1); see detect_benchmark.py to pick it
+    for a given CPU.
+
+    With `spill_dir` set and at least `spill_min_frames` sampled frames, the run
+    is memory-bounded: detection rows are spilled to that directory per batch
+    or chunk instead of being collected, the HMM is decoded from a
+    memory-mapped AU matrix and the CSV and column store are written part by
+    part, so peak memory does not grow with the video length (the detection
+    store is not used in this mode). The directory is removed afterwards.
+
+    With `deadline_s` set, the run aims to finish within that many seconds:
+    frames are detected serially and the sampling step is widened from
+    skip_frames as throughput is measured (see _DeadlinePlan); if time still
+    runs out the tail of the video is left unanalyzed. The detection store is
+    not used in this mode. The sampling actually used is reported in
+    stats["sampling"] and in the column store meta.
+
+    `sampling="motion"` (frame samplers only) replaces the fixed skip_frames
+    grid by motion-adaptive sampling with the same detector budget: a cheap
+    frame-difference pre-pass concentrates sampled frames where the picture
+    changes (see motion_sampling.py). A deadline takes precedence.
+
+    Whenever sampling is irregular (motion or deadline) the HMM treats the gap
+    before each row as gap / skip_frames model steps (transition matrix powers,
+    see hmm_decode.py), offline and in the streamed online columns.
+
+    `cancel` is a callable checked between frames (serial paths) or while
+    waiting for chunks (workers > 1) and once more before the HMM; it stops the
+    run by raising (e.g. app.utils.tasks.CancelToken). py-feat's own
+    detect_video (sampler="feat") is only checked before it starts.
+    """
+    t_run = time.monotonic()
+    outputs = _pipeline_outputs(outputs)
+    if sampler not in ("feat",) + SEEK_MODES:
+        raise ValueError(f"sampler must be one of {('feat',) + SEEK_MODES}, got {sampler!r}")
+    if sampling not in SAMPLING_MODES:
+        raise ValueError(f"sampling must be one of {SAMPLING_MODES}, got {sampling!r}")
+    seek = sampler if sampler != "feat" else "auto"
+    stats: dict = {"frames": 0, "detect_s": 0.0, "outputs": list(outputs), "batch_size": max(1, int(batch_size))}
+
     # Load artifacts
-    model, labels, raw_multiplier, meta = _load_artifacts(artifacts_dir)
+    if artifacts is None:
+        artifacts = _load_artifacts(artifacts_dir)
+    model, labels, raw_multiplier, meta = artifacts
 
-    # Detect features using py-feat
-    detector = Detector()
+    plan = None
+    indices: Optional[List[int]] = None
+    if deadline_s is not None and float(deadline_s) > 0:
+        if sampler == "feat":
+            sampler = seek = "auto"
+        import video_frames
+        info = video_frames.probe(video_path)
+        plan = _DeadlinePlan(info.frame_count, skip_frames, float(deadline_s), fps=info.fps, started=t_run)
+        print(f"[predict] deadline {float(deadline_s):.1f}s: adaptive sampling from skip_frames={plan.base}"
+              + (f" (serial, workers={workers} ignored)" if workers > 1 else ""))
+        if detection_store is not None:
+            print("[predict] detection store is not used with a deadline")
+            stats["detection_store_skipped"] = "deadline"
+            detection_store = None
+    elif sampling == "motion":
+        if sampler == "feat":
+            sampler = seek = "auto"
+        import video_frames
+        indices = _motion_indices(video_path, video_frames.probe(video_path).frame_count, skip_frames,
+                                  seek=seek, decode_path=decode_path, stats=stats)
+        print(f"[predict] motion sampling: {len(indices)} frames (budget {stats['motion_budget']}, "
+              f"probe every {stats['motion_probe_step']} frames in {stats['motion_probe_s']:.1f}s)")
+    # Irregular sampling: the HMM steps by frame gap / skip_frames
+    step_frames = max(1, int(skip_frames)) if (plan is not None or indices is not None) else None
 
-    # Call detect_video with robust kwargs handling across py-feat versions
-    kwargs = {}
-    for k, v in {
-        "skip_frames": skip_frames,
-        "output_fps": fps,
-        "face_detection_threshold": face_threshold,
-    }.items():
-        kwargs[k] = v
+    sink = _RowStreamWriter(stream_csv, on_rows=on_rows) if stream_csv is not None else None
+    if sink is not None and stream_hmm_lag is not None and hasattr(model, "lambdas_"):
+        sink = _OnlineHmmSink(sink, model, labels, raw_multiplier, lag=stream_hmm_lag,
+                              write_lambda_aus=write_lambda_aus, step_frames=step_frames)
 
-    video_prediction = detector.detect_video(str(video_path), **kwargs)
+    spill = None
+    if spill_dir is not None:
+        import video_frames
+        n_sampled = len(indices) if indices is not None else len(
+            video_frames.sample_indices(video_frames.probe(video_path).frame_count, skip_frames))
+        if n_sampled >= int(spill_min_frames):
+            spill = sink = _SpillSink(Path(spill_dir), labels, forward=sink)
+            print(f"[predict] memory-bounded mode: {n_sampled} sampled frames, spilling to {spill_dir}")
+            stats["spill_frames"] = n_sampled
+            if detection_store is not None:
+                # the store holds all raw rows in memory, which this mode exists to avoid
+                print("[predict] detection store is not used in memory-bounded mode")
+                stats["detection_store_skipped"] = "memory-bounded mode"
+                detection_store = None
+
+    if plan is not None:
+        if detector is None:
+            detector = _build_detector(outputs)
+        video_prediction = _detect_video_batched(
+            detector, video_path, skip_frames=skip_frames, face_threshold=face_threshold,
+            batch_frames=stream_batch_frames, sink=sink, outputs=outputs, stats=stats, seek=seek,
+            track_keyframes=track_keyframes, downscale_face_px=downscale_face_px,
+            decode_path=decode_path, batch_size=batch_size, keep=spill is None, deadline=plan,
+            cancel=cancel,
+        )
+    elif detection_store is not None:
+        video_prediction = _detect_with_store(
+            Path(detection_store), video_path, skip_frames=skip_frames, face_threshold=face_threshold,
+            store_threshold=store_threshold, detector=detector, workers=workers,
+            chunk_frames=chunk_frames, batch_frames=stream_batch_frames, sink=sink,
+            outputs=outputs, stats=stats, seek=seek, track_keyframes=track_keyframes,
+            downscale_face_px=downscale_face_px, decode_path=decode_path, batch_size=batch_size,
+            indices=indices, cancel=cancel,
+        )
+    elif workers > 1:
+        video_prediction = _detect_video_chunked(
+            video_path, skip_frames=skip_frames, face_threshold=face_threshold,
+            workers=workers, chunk_frames=chunk_frames, batch_size=batch_size, sink=sink, outputs=outputs,
+            stats=stats, seek=seek, track_keyframes=track_keyframes, downscale_face_px=downscale_face_px,
+            decode_path=decode_path, keep=spill is None, indices=indices, cancel=cancel,
+        )
+    elif sink is not None or sampler != "feat":
+        if detector is None:
+            detector = _build_detector(outputs)
+        video_prediction = _detect_video_batched(
+            detector, video_path, skip_frames=skip_frames, face_threshold=face_threshold,
+            batch_frames=stream_batch_frames, sink=sink, outputs=outputs, stats=stats, seek=seek,
+            track_keyframes=track_keyframes, downscale_face_px=downscale_face_px,
+            decode_path=decode_path, batch_size=batch_size, keep=spill is None, indices=indices,
+            cancel=cancel,
+        )
+    else:
+        # Detect features using py-feat
+        if detector is None:
+            detector = _build_detector(outputs)
+
+        # Call detect_video with robust kwargs handling across py-feat versions
+        kwargs = {}
+        for k, v in {
+            "skip_frames": skip_frames,
+            "output_fps": fps,
+            "face_detection_threshold": face_threshold,
+        }.items():
+            kwargs[k] = v
+
+        if cancel is not None:
+            cancel()
+        t0 = time.perf_counter()
+        video_prediction = detector.detect_video(str(video_path), **kwargs)
+        try:
+            n_frames = int(video_prediction["frame"].nunique())
+        except Exception:
+            n_frames = len(video_prediction)
+        _add_stats(stats, n_frames, time.perf_counter() - t0)
+        try:
+            video_prediction = _project_outputs(video_prediction, outputs)
+        except Exception:
+            pass
+
+    if stats["frames"]:
+        print(f"[predict] detector time: {1000.0 * stats['detect_s'] / stats['frames']:.1f} ms/frame "
+              f"over {stats['frames']} frames (outputs={','.join(outputs)}, batch={stats['batch_size']})")
+    if stats.get("face_detect_skipped"):
+        print(f"[predict] tracking: face detection runs={stats['face_detect_runs']} "
+              f"skipped={stats['face_detect_skipped']} redetected={stats.get('redetected', 0)}")
+    if "read" in stats:
+        print(f"[predict] decode: read={stats['read']} grabbed={stats['grabbed']} seeks={stats['seeks']} (sampler={sampler})")
+    if plan is not None:
+        stats["sampling"] = plan.summary()
+        print("[predict] sampling:", json.dumps(stats["sampling"]))
+    elif indices is not None:
+        stats["sampling"] = {
+            "mode": "motion",
+            "skip_frames": max(1, int(skip_frames)),
+            "budget": stats["motion_budget"],
+            "frames": len(indices),
+            "probe_step": stats["motion_probe_step"],
+            "effective_skip": round((indices[-1] - indices[0]) / (len(indices) - 1), 3) if len(indices) > 1 else None,
+        }
+    else:
+        stats["sampling"] = {"mode": "fixed", "skip_frames": max(1, int(skip_frames))}
+    pipeline = _pipeline_summary(stats)
+    if pipeline:
+        stats["pipeline"] = pipeline
+        print("[predict] pipeline:", json.dumps(pipeline))
+    if callable(on_detect_stats):
+        try:
+            on_detect_stats(dict(stats))
+        except Exception:
+            pass
+
+    if hasattr(sink, "close"):
+        sink.close()
+    if cancel is not None:
+        try:
+            cancel()
+        except BaseException:
+            if spill is not None:
+                spill.cleanup()
+            raise
+    if spill is not None:
+        try:
+            if spill.rows == 0:
+                raise ValueError("No frames were detected in the video")
+            states, proba = _predict_states_spilled(model, spill, raw_multiplier, posteriors=write_posteriors,
+                                                    step_frames=step_frames)
+            return _write_spilled(spill, output_csv, model, labels, raw_multiplier, states, proba,
+                                  write_lambda_aus=write_lambda_aus, meta={"sampling": stats["sampling"]})
+        finally:
+            spill.cleanup()
+    if not isinstance(video_prediction, Fex) and not len(video_prediction):
+        raise ValueError("No frames were detected in the video")
 
     # Predict HMM state sequence
     aus_df = _extract_aus_df(video_prediction, prefer_labels=labels)
     # Reindex ensures columns order exactly matches training labels
     aus_df = aus_df.reindex(columns=labels, fill_value=0.0)
 
-    states, proba, X = _predict_states(model, aus_df, raw_multiplier)
+    steps = None
+    if step_frames is not None:
+        steps = _hmm_steps(_get_fex_dataframe(video_prediction)["frame"], step_frames)
+    states, proba, X = _predict_states(model, aus_df, raw_multiplier, posteriors=write_posteriors, steps=steps)
 
     # Attach predictions to Fex
     try:
@@ -216,7 +1834,8 @@ def run(video_path: Path, output_csv: Path, artifacts_dir: Path,
         # Fallback: convert to DF and add columns
         df = _get_fex_dataframe(video_prediction)
         df["HMM_state"] = states
-        df.to_csv(output_csv, index=False)
+        _replace_csv(output_csv, lambda p: df.to_csv(p, index=False))
+        _write_columnar(df, output_csv, meta={"sampling": stats["sampling"]})
         return output_csv
 
     # Optionally append expected AU per frame under the model (if available)
@@ -247,12 +1866,16 @@ def run(video_path: Path, output_csv: Path, artifacts_dir: Path,
 
     # Save to CSV using Fex's built-in method if available
     try:
-        video_prediction.to_csv(str(output_csv))
+        if isinstance(video_prediction, Fex):
+            _replace_csv(output_csv, lambda p: video_prediction.to_csv(str(p)))
+        else:
+            _replace_csv(output_csv, lambda p: video_prediction.to_csv(str(p), index=False))
     except Exception:
         # Fallback: convert to DataFrame and write
         df = _get_fex_dataframe(video_prediction)
-        df.to_csv(output_csv, index=False)
+        _replace_csv(output_csv, lambda p: df.to_csv(p, index=False))
 
+    _write_columnar(video_prediction, output_csv, meta={"sampling": stats["sampling"]})
     return output_csv
 
 
@@ -265,6 +1888,31 @@ def main(argv: Optional[List[str]] = None) -> int:
     p.add_argument("--skip-frames", type=int, default=25, help="Process every Nth frame (py-feat)")
     p.add_argument("--face-threshold", type=float, default=0.95, help="Face detection threshold (py-feat)")
     p.add_argument("--no-lambda-aus", action="store_true", help="Do not append model expected AU columns")
+    p.add_argument("--no-posteriors", action="store_true", help="Skip forward-backward; do not append HMM_p_state_* columns")
+    p.add_argument("--workers", type=int, default=1, help="Detect frame chunks in N worker processes (1 = serial)")
+    p.add_argument("--chunk-frames", type=int, default=1500, help="Frames per chunk when --workers > 1")
+    p.add_argument("--batch-size", type=int, default=1,
+                   help="Frames per Detector call with the OpenCV samplers (see detect_benchmark.py)")
+    p.add_argument("--sampler", default="auto", choices=("feat",) + SEEK_MODES,
+                   help="How sampled frames are decoded: auto/seek/grab via OpenCV, or feat (py-feat detect_video)")
+    p.add_argument("--track-keyframes", type=int, default=0,
+                   help="Run the face detector every N sampled frames and track the face in between (0 = off)")
+    p.add_argument("--downscale-face-px", type=int, default=0,
+                   help="Downscale frames before detection while faces stay at least N px tall (0 = off)")
+    p.add_argument("--decode-from", default=None,
+                   help="Normalized copy of the video (video_normalize.py) to decode sampled frames from")
+    p.add_argument("--outputs", default="all",
+                   help="Detector outputs to compute, comma-separated: " + ",".join(OUTPUTS_ALL) + " (default: all)")
+    p.add_argument("--spill-dir", default=None,
+                   help="Memory-bounded mode: spill detections to this directory and write the CSV in parts")
+    p.add_argument("--spill-min-frames", type=int, default=0,
+                   help="Use --spill-dir only when at least N frames are sampled")
+    p.add_argument("--sampling", default="fixed", choices=SAMPLING_MODES,
+                   help="fixed: every --skip-frames frame; motion: same budget placed where the picture changes")
+    p.add_argument("--deadline-s", type=float, default=None,
+                   help="Finish detection within N seconds by widening the sampling step as needed")
+    p.add_argument("--detection-store", default=None, help="Directory to keep raw detections in and reuse across runs")
+    p.add_argument("--store-threshold", type=float, default=0.5, help="Lowest face score kept in --detection-store")
 
     args = p.parse_args(argv)
 
@@ -287,6 +1935,21 @@ def main(argv: Optional[List[str]] = None) -> int:
             skip_frames=args.skip_frames,
             face_threshold=args.face_threshold,
             write_lambda_aus=(not args.no_lambda_aus),
+            write_posteriors=(not args.no_posteriors),
+            workers=args.workers,
+            chunk_frames=args.chunk_frames,
+            detection_store=Path(args.detection_store) if args.detection_store else None,
+            store_threshold=args.store_threshold,
+            outputs=args.outputs,
+            sampler=args.sampler,
+            track_keyframes=args.track_keyframes,
+            downscale_face_px=args.downscale_face_px,
+            decode_path=Path(args.decode_from) if args.decode_from else None,
+            batch_size=args.batch_size,
+            spill_dir=Path(args.spill_dir) if args.spill_dir else None,
+            spill_min_frames=args.spill_min_frames,
+            deadline_s=args.deadline_s,
+            sampling=args.sampling,
         )
         print(f"Saved predictions to: {out}")
         return 0
@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+"""
+OpenCV helpers to probe a video and read sampled frames from a frame range.
+
+Used by predict_video_to_csv.py to feed frames to py-feat without going through
+Detector.detect_video, so a video can be split into independent frame ranges
+and only the sampled frames are decoded (read_frames_at seeks over long gaps).
+
+Example:
+    python video_frames.py --video 1_video.mp4
+    python video_frames.py --video 1_video.mp4 --skip-frames 25   # compare seek modes
+"""
+from __future__ import annotations
+
+import argparse
+import sys
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+
+def _cv2():
+    try:
+        import cv2  # type: ignore
+    except Exception as e:  # pragma: no cover
+        raise RuntimeError("OpenCV (cv2) is required for frame-range video reading") from e
+    return cv2
+
+
+@dataclass
+class VideoInfo:
+    frame_count: int
+    fps: float
+    width: int
+    height: int
+
+
+def probe(video_path: Path) -> VideoInfo:
+    """Return frame count, fps and frame size of a video."""
+    cv2 = _cv2()
+    cap = cv2.VideoCapture(str(video_path))
+    if not cap.isOpened():
+        raise RuntimeError(f"Could not open video: {video_path}")
+    try:
+        n = int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+        fps = float(cap.get(cv2.CAP_PROP_FPS) or 0.0) or 25.0
+        w = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH) or 0)
+        h = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT) or 0)
+        if n <= 0:
+            # Some containers do not report a frame count; count by grabbing
+            n = 0
+            while cap.grab():
+                n += 1
+    finally:
+        cap.release()
+    return VideoInfo(frame_count=n, fps=fps, width=w, height=h)
+
+
+def frame_ranges(frame_count: int, chunk_frames: int, skip_frames: int = 1) -> List[Tuple[int, int]]:
+    """Split [0, frame_count) into [start, stop) ranges.
+
+    Chunk size is rounded up to a multiple of skip_frames so every chunk starts
+    on the global sampling grid (frame % skip_frames == 0).
+    """
+    step = max(1, int(skip_frames))
+    size = max(step, ((max(1, int(chunk_frames)) + step - 1) // step) * step)
+    return [(s, min(s + size, frame_count)) for s in range(0, frame_count, size)]
+
+
+def sample_indices(frame_count: int, skip_frames: int = 1) -> List[int]:
+    """Frame indices on the global sampling grid: 0, skip_frames, 2*skip_frames, ... < frame_count."""
+    return list(range(0, max(0, int(frame_count)), max(1, int(skip_frames))))
+
+
+def read_frames(video_path: Path, start: int = 0, stop: Optional[int] = None,
+                step: int = 1) -> Iterator[Tuple[int, "object"]]:
+    """Yield (frame_index, BGR ndarray) for frames start, start+step, ... < stop."""
+    cv2 = _cv2()
+    step = max(1, int(step))
+    cap = cv2.VideoCapture(str(video_path))
+    if not cap.isOpened():
+        raise RuntimeError(f"Could not open video: {video_path}")
+    try:
+        if start > 0:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, int(start))
+        idx = int(start)
+        while stop is None or idx < stop:
+            if (idx - start) % step == 0:
+                ok, frame = cap.read()
+                if not ok:
+                    break
+                yield idx, frame
+            elif not cap.grab():
+                break
+            idx += 1
+    finally:
+        cap.release()
+
+
+SEEK_MODES = ("auto", "seek", "grab")
+
+
+class _CostEMA:
+    """Exponential moving average of a per-operation wall time."""
+
+    def __init__(self, alpha: float = 0.2) -> None:
+        self.alpha = alpha
+        self.value: Optional[float] = None
+
+    def add(self, seconds: float) -> None:
+        self.value = seconds if self.value is None else (1 - self.alpha) * self.value + self.alpha * seconds
+
+
+def read_frames_at(video_path: Path, indices: Iterable[int], seek: str = "auto",
+                   stats: Optional[dict] = None) -> Iterator[Tuple[int, "object"]]:
+    """Yield (frame_index, BGR ndarray) for the given frame indices, in ascending order.
+
+    Gaps between requested frames are crossed either by grab() (decode without
+    conversion, cost grows with the gap) or by a seek (CAP_PROP_POS_FRAMES:
+    the decoder jumps to the preceding keyframe and decodes forward, cost
+    bounded by the keyframe interval). `seek`:
+        "grab"  always grab through gaps (sequential decode)
+        "seek"  always seek when the gap is more than one frame
+        "auto"  time both and seek when a seek is cheaper than grabbing the gap,
+                so long-GOP files are read sequentially and intra-only/short-GOP
+                files by seeking
+    `stats`, if given, receives counters: read, grabbed, seeks.
+
+    `indices` may also be a lazy iterator of ascending indices (e.g. a sampler
+    that adapts its step while frames are read); it is consumed one index at
+    a time and indices at or before the last one read are skipped.
+    """
+    import time
+    from collections.abc import Iterator as _Iterator
+
+    cv2 = _cv2()
+    if seek not in SEEK_MODES:
+        raise ValueError(f"seek must be one of {SEEK_MODES}, got {seek!r}")
+    if isinstance(indices, _Iterator):
+        wanted = indices
+    else:
+        wanted = sorted(set(int(i) for i in indices))
+        if not wanted:
+            return
+    counters = stats if stats is not None else {}
+    for k in ("read", "grabbed", "seeks"):
+        counters.setdefault(k, 0)
+    grab_cost, seek_cost = _CostEMA(), _CostEMA()
+
+    cap = cv2.VideoCapture(str(video_path))
+    if not cap.isOpened():
+        raise RuntimeError(f"Could not open video: {video_path}")
+    try:
+        idx = 0
+        for target in wanted:
+            target = int(target)
+            if target < idx:
+                continue
+            gap = target - idx
+            do_seek = False
+            if gap > 1 and seek != "grab":
+                if seek == "seek" or idx == 0:
+                    do_seek = True
+                elif seek_cost.value is None:
+                    do_seek = grab_cost.value is not None  # probe one seek once grabs are timed
+                else:
+                    do_seek = seek_cost.value < gap * (grab_cost.value or 0.0)
+            if do_seek:
+                t0 = time.perf_counter()
+                cap.set(cv2.CAP_PROP_POS_FRAMES, target)
+                pos = int(cap.get(cv2.CAP_PROP_POS_FRAMES))
+                if pos != target:
+                    # Backend cannot seek exactly: reopen and fall back to sequential grabs
+                    cap.release()
+                    cap = cv2.VideoCapture(str(video_path))
+                    idx, seek = 0, "grab"
+                else:
+                    ok, frame = cap.read()
+                    if not ok:
+                        return
+                    seek_cost.add(time.perf_counter() - t0)
+                    counters["seeks"] += 1
+                    counters["read"] += 1
+                    yield target, frame
+                    idx = target + 1
+                    continue
+            while idx < target:
+                t0 = time.perf_counter()
+                if not cap.grab():
+                    return
+                grab_cost.add(time.perf_counter() - t0)
+                counters["grabbed"] += 1
+                idx += 1
+            ok, frame = cap.read()
+            if not ok:
+                return
+            counters["read"] += 1
+            yield target, frame
+            idx += 1
+    finally:
+        cap.release()
+
+
+def _add(metrics: Optional[dict], key: str, value: float) -> None:
+    if metrics is not None:
+        metrics[key] = metrics.get(key, 0) + value
+
+
+def prefetch(frames: Iterable[Tuple[int, "object"]], depth: int = 32,
+             metrics: Optional[dict] = None) -> Iterator[Tuple[int, "object"]]:
+    """Decode `frames` on a background thread, at most `depth` frames ahead of the consumer.
+
+    The bounded queue overlaps decoding with detection while keeping memory
+    flat; decoder exceptions are re-raised in the consumer. Closing the
+    generator early stops the thread.
+
+    `metrics`, if given, accumulates wall seconds: decode_s (decoding),
+    decode_blocked_s (queue full: the consumer is the bottleneck) and
+    infer_wait_s (queue empty: the consumer waited for frames), plus
+    decode_queue_max and decode_queue_sum/decode_queue_gets for the mean depth.
+    """
+    import queue
+    import threading
+    import time
+
+    q: "queue.Queue" = queue.Queue(maxsize=max(1, int(depth)))
+    stop = threading.Event()
+    done = object()
+
+    def _put(item) -> bool:
+        t0 = time.perf_counter()
+        try:
+            while not stop.is_set():
+                try:
+                    q.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+        finally:
+            _add(metrics, "decode_blocked_s", time.perf_counter() - t0)
+
+    def _decode() -> None:
+        it = iter(frames)
+        try:
+            while True:
+                t0 = time.perf_counter()
+                try:
+                    item = next(it)
+                except StopIteration:
+                    break
+                finally:
+                    _add(metrics, "decode_s", time.perf_counter() - t0)
+                if not _put(item):
+                    return
+        except BaseException as e:  # handed over to the consumer
+            _put(e)
+            return
+        _put(done)
+
+    t = threading.Thread(target=_decode, name="frame-decode", daemon=True)
+    t.start()
+    try:
+        while True:
+            if metrics is not None:
+                n = q.qsize()
+                metrics["decode_queue_max"] = max(metrics.get("decode_queue_max", 0), n)
+                _add(metrics, "decode_queue_sum", n)
+                _add(metrics, "decode_queue_gets", 1)
+            t0 = time.perf_counter()
+            item = q.get()
+            _add(metrics, "infer_wait_s", time.perf_counter() - t0)
+            if item is done:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        t.join(timeout=5)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    p = argparse.ArgumentParser(description="Print basic video properties as seen by OpenCV.")
+    p.add_argument("--video", required=True, help="Path to input video")
+    p.add_argument("--skip-frames", type=int, default=0,
+                   help="Also time reading every Nth frame with each seek mode (0 = skip the benchmark)")
+    args = p.parse_args(argv)
+    try:
+        info = probe(Path(args.video))
+    except Exception as e:
+        print(f"[error] {e}", file=sys.stderr)
+        return 1
+    print(f"frames={info.frame_count} fps={info.fps:.3f} size={info.width}x{info.height}")
+    if args.skip_frames > 0:
+        import time
+        indices = sample_indices(info.frame_count, args.skip_frames)
+        for mode in SEEK_MODES:
+            stats: dict = {}
+            t0 = time.perf_counter()
+            n = sum(1 for _ in read_frames_at(Path(args.video), indices, seek=mode, stats=stats))
+            print(f"seek={mode:<5} frames={n} time={time.perf_counter() - t0:.2f}s "
+                  f"grabbed={stats['grabbed']} seeks={stats['seeks']}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+Re-encode an upload into a detector-friendly intermediate with OpenCV.
+
+The output is Motion-JPEG in AVI at a fixed fps and at most `max_height`
+lines. MJPG is intra-only, so every frame is a keyframe: any skip_frames grid
+is keyframe-aligned and video_frames.read_frames_at can seek straight to each
+sampled frame instead of decoding the long-GOP original again on every
+analysis.
+
+A JSON meta file next to the output (written last, so its presence marks a
+complete file) records the source signature, fps and size. Frame indices
+stay in source-frame units for callers: source frame i is read from
+normalized frame round(i * fps / source_fps), and coordinates detected on
+normalized frames are scaled by 1 / scale() to source pixels.
+
+Example:
+    python video_normalize.py --video uploads/1_video.mp4 --out workspace/1_video_normalized.avi
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sys
+from pathlib import Path
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
+
+
+def meta_path(normalized: Path) -> Path:
+    return Path(normalized).with_suffix(".json")
+
+
+def _signature(path: Path) -> dict:
+    st = Path(path).stat()
+    return {"size": int(st.st_size), "mtime_ns": int(st.st_mtime_ns)}
+
+
+def load_meta(normalized: Path) -> Optional[dict]:
+    try:
+        with open(meta_path(normalized), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def current(normalized: Path, source: Path) -> Optional[dict]:
+    """Meta of `normalized` if it is a complete normalization of the current `source`, else None."""
+    meta = load_meta(normalized)
+    if meta is None or not Path(normalized).is_file():
+        return None
+    try:
+        if meta.get("source", {}).get("signature") != _signature(source):
+            return None
+    except OSError:
+        return None
+    return meta
+
+
+def source_to_normalized(meta: dict, index: int) -> int:
+    """Normalized frame index showing source frame `index`."""
+    k = int(round(int(index) * float(meta["fps"]) / float(meta["source"]["fps"])))
+    return max(0, min(k, int(meta["frame_count"]) - 1))
+
+
+def scale(meta: dict) -> float:
+    """Normalized / source frame size ratio."""
+    return float(meta["height"]) / float(meta["source"]["height"])
+
+
+def read_frames_at(normalized: Path, meta: dict, indices: Iterable[int], seek: str = "auto",
+                   stats: Optional[dict] = None) -> Iterator[Tuple[int, "object"]]:
+    """video_frames.read_frames_at over the normalized file, keyed by source frame indices.
+
+    Source frames that map to the same normalized frame share one decode. A
+    lazy iterator of indices is mapped one by one; source frames landing on an
+    already requested normalized frame are then dropped.
+    """
+    import video_frames
+    from collections.abc import Iterator as _Iterator
+
+    if isinstance(indices, _Iterator):
+        sources: dict = {}
+
+        def _targets() -> Iterator[int]:
+            last = -1
+            for i in indices:
+                t = source_to_normalized(meta, i)
+                if t > last:
+                    sources[t] = int(i)
+                    last = t
+                    yield t
+
+        for target, frame in video_frames.read_frames_at(Path(normalized), _targets(), seek=seek, stats=stats):
+            yield sources.pop(target), frame
+        return
+
+    by_target: dict = {}
+    for i in sorted(set(int(i) for i in indices)):
+        by_target.setdefault(source_to_normalized(meta, i), []).append(i)
+    for target, frame in video_frames.read_frames_at(Path(normalized), by_target.keys(), seek=seek, stats=stats):
+        for i in by_target[target]:
+            yield i, frame
+
+
+def normalize(source: Path, out: Path, fps: float = 25.0, max_height: int = 720, quality: int = 90,
+              progress_cb: Optional[Callable[[int, int], None]] = None) -> dict:
+    """Write the intra-only intermediate of `source` to `out` (.avi) and return its meta.
+
+    Output frame k shows the source frame nearest to time k / fps (frames are
+    dropped or repeated to reach the fixed rate). `progress_cb(done, total)`
+    is called every 100 source frames.
+    """
+    import cv2  # type: ignore
+
+    source, out = Path(source), Path(out)
+    cap = cv2.VideoCapture(str(source))
+    if not cap.isOpened():
+        raise RuntimeError(f"Could not open video: {source}")
+    src_fps = float(cap.get(cv2.CAP_PROP_FPS) or 0.0) or 25.0
+    src_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+    w = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH) or 0)
+    h = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT) or 0)
+    if w <= 0 or h <= 0:
+        cap.release()
+        raise RuntimeError(f"Could not read frame size: {source}")
+    ratio = min(1.0, float(max_height) / float(h))
+    ow, oh = max(2, int(round(w * ratio / 2)) * 2), max(2, int(round(h * ratio / 2)) * 2)
+
+    out.parent.mkdir(parents=True, exist_ok=True)
+    tmp = out.with_name(f"{out.stem}.tmp{os.getpid()}{out.suffix}")
+    writer = cv2.VideoWriter(str(tmp), cv2.VideoWriter_fourcc(*"MJPG"), float(fps), (ow, oh))
+    if not writer.isOpened():
+        cap.release()
+        raise RuntimeError("Could not open an MJPG VideoWriter")
+    try:
+        writer.set(cv2.VIDEOWRITER_PROP_QUALITY, int(quality))
+    except Exception:
+        pass
+
+    written = 0
+    src_idx = 0
+    try:
+        while True:
+            ok, frame = cap.read()
+            if not ok:
+                break
+            if (ow, oh) != (w, h):
+                frame = cv2.resize(frame, (ow, oh), interpolation=cv2.INTER_AREA)
+            # Emit every output frame whose nearest source frame is this one
+            while int(round(written * src_fps / float(fps))) <= src_idx:
+                writer.write(frame)
+                written += 1
+            src_idx += 1
+            if progress_cb is not None and src_idx % 100 == 0:
+                progress_cb(src_idx, src_count)
+    finally:
+        cap.release()
+        writer.release()
+    if written == 0:
+        tmp.unlink(missing_ok=True)
+        raise RuntimeError(f"No frames decoded from {source}")
+
+    os.replace(tmp, out)
+    meta = {
+        "fps": float(fps),
+        "frame_count": written,
+        "width": ow,
+        "height": oh,
+        "codec": "MJPG",
+        "source": {
+            "name": source.name,
+            "signature": _signature(source),
+            "fps": src_fps,
+            "frame_count": src_idx,
+            "width": w,
+            "height": h,
+        },
+    }
+    tmp_meta = meta_path(out).with_suffix(".json.tmp")
+    tmp_meta.write_text(json.dumps(meta), encoding="utf-8")
+    os.replace(tmp_meta, meta_path(out))
+    return meta
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    p = argparse.ArgumentParser(description="Re-encode a video to intra-only MJPG at a fixed fps/size for analysis.")
+    p.add_argument("--video", required=True, help="Path to input video")
+    p.add_argument("--out", required=True, help="Output .avi path (meta is written next to it as .json)")
+    p.add_argument("--fps", type=float, default=25.0, help="Output frame rate")
+    p.add_argument("--max-height", type=int, default=720, help="Downscale to at most this many lines")
+    p.add_argument("--quality", type=int, default=90, help="JPEG quality (0-100)")
+    args = p.parse_args(argv)
+
+    if not Path(args.video).exists():
+        print(f"[error] Video not found: {args.video}", file=sys.stderr)
+        return 2
+    try:
+        meta = normalize(Path(args.video), Path(args.out), fps=args.fps, max_height=args.max_height,
+                         quality=args.quality)
+    except Exception as e:
+        print(f"[error] {e}", file=sys.stderr)
+        return 1
+    print(f"Saved {meta['frame_count']} frames {meta['width']}x{meta['height']} @ {meta['fps']} fps to {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())